@@ -2,36 +2,66 @@ import asyncio
 import logging
 import os
 from datetime import datetime
-from typing import List
+from time import perf_counter
+from typing import List, Optional, Tuple
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
 
+from hive_rc_auto.helpers.checkpoint import Checkpoint, CycleCheckpoint
 from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.db_indexes import setup_indexes
 from hive_rc_auto.helpers.hive_calls import publish_feed
+from hive_rc_auto.helpers.metrics import (
+    HEALTH,
+    STARTUP_PHASE_SECONDS,
+    start_metrics_server,
+)
+from hive_rc_auto.helpers.profiling import CycleProfiler, LoopBlockMonitor
+from hive_rc_auto.helpers.rc_cycle import CyclePipeline, build_apps
 from hive_rc_auto.helpers.rc_delegation import (
     RCAccount,
-    RCAllData,
     RCListOfAccounts,
+    RCPolicy,
+    load_policies,
     setup_mongo_db,
 )
+from hive_rc_auto.helpers.retention import keep_maintaining_history
+from hive_rc_auto.helpers.sharding import ShardLeases
+from hive_rc_auto.helpers.startup import fallback_apps, timed_phase
+from hive_rc_auto.helpers.tracing import configure_tracing
 
 
-async def update_rc_accounts():
+async def update_rc_accounts(
+    apps: List[Tuple[RCListOfAccounts, RCPolicy]],
+    lookup: asyncio.Task = None,
+    checkpoint: Checkpoint = None,
+    saved: CycleCheckpoint = None,
+    leases: ShardLeases = None,
+):
     """
-    Update all the accounts in a loop
+    Update all the accounts in a loop: a fixed-rate pipeline where the next
+    fetch overlaps the previous broadcast and storage. Starts warm from the
+    last checkpoint when there is one, switching to the accounts from
+    `lookup` when it finishes.
     """
-    all_accounts = RCListOfAccounts()
-    old_all_rcs = None
-    while True:
-        all_data = RCAllData(accounts=all_accounts)
-        await all_data.fill_data(old_all_rcs=old_all_rcs)
-        await all_data.update_delegations()
-        all_data.log_output(logger=logging.info)
-        await all_data.get_payload_for_pending_delegations(send_json=True)
-        asyncio.create_task(all_data.store_all_data())
-        old_all_rcs = all_data.rcs
-        await asyncio.sleep(Config.UPDATE_FREQUENCY_SECS)
+    profiler = CycleProfiler()
+    profiler.install_signal_handler()
+    pipeline = CyclePipeline(
+        apps,
+        leases=leases,
+        profiler=profiler,
+        on_cycle=lambda all_datas: HEALTH.cycle_done(),
+        checkpoint=checkpoint,
+        old_all_rcs=saved.recent_readings() if saved else None,
+    )
+    # Held until the pipeline stops, its errors are logged by refresh_apps
+    refresh = asyncio.create_task(pipeline.refresh_apps(lookup)) if lookup else None
+    try:
+        await pipeline.run()
+    finally:
+        if refresh:
+            refresh.cancel()
 
 
 async def keep_publishing_price_feed():
@@ -59,11 +89,60 @@ async def check_db():
         logging.exception(ex)
 
 
-async def main_loop():
-    # Setup the data
+async def prepare_db():
     await check_db()
-    setup_mongo_db()
-    tasks = [update_rc_accounts()]
+    await asyncio.to_thread(setup_mongo_db)
+    await asyncio.to_thread(setup_indexes)
+
+
+async def start_accounts(
+    policies: List[RCPolicy],
+    lookup: asyncio.Task,
+    saved: Optional[CycleCheckpoint],
+) -> List[Tuple[RCListOfAccounts, RCPolicy]]:
+    """
+    The accounts to start with: the checkpoint's, the lookup's if it finishes
+    in time or the fallback delegating accounts.
+    """
+    apps = saved.apps_for(policies) if saved else None
+    if apps:
+        return apps
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(lookup), timeout=Config.STARTUP_TIMEOUT_SECS
+        )
+    except asyncio.TimeoutError:
+        logging.warning("Account lookup still running, starting without targets")
+    except Exception as ex:
+        logging.error(f"Account lookup failed, starting without targets: {ex}")
+    return fallback_apps(policies)
+
+
+async def main_loop():
+    start = perf_counter()
+    await start_metrics_server()
+    configure_tracing()
+    LoopBlockMonitor().start()
+    policies = load_policies()
+    leases = ShardLeases() if Config.WORKER_SHARDS else None
+    # One checkpoint per worker: sharded workers without a WORKER_ID still
+    # have their own id
+    checkpoint = Checkpoint(key=leases.worker_id if leases else None)
+    # The slowest step (HiveSQL and the nodes), it runs alongside the rest
+    lookup = asyncio.create_task(
+        timed_phase("accounts", asyncio.to_thread(build_apps, policies))
+    )
+    _, saved = await asyncio.gather(
+        timed_phase("database", prepare_db()),
+        timed_phase("checkpoint", checkpoint.load()),
+    )
+    apps = await start_accounts(policies, lookup, saved)
+    HEALTH.startup_complete = True
+    STARTUP_PHASE_SECONDS.set(perf_counter() - start, phase="total")
+    logging.info(f"Startup complete: {perf_counter() - start:.2f}s")
+    tasks = [update_rc_accounts(apps, lookup, checkpoint, saved, leases)]
+    if Config.RETENTION_CHECK_SECS:
+        tasks.append(keep_maintaining_history())
     await asyncio.gather(*tasks)
 
 
@@ -0,0 +1,128 @@
+"""
+Parquet archive of timeseries documents past their retention, one
+zstd-compressed file per collection and day:
+
+    <ARCHIVE_DIR>/<collection>/date=2023-01-31/part-0.parquet
+
+Files are written under a temporary name and moved into place, so a
+partition either exists complete or not at all and archiving a day again
+is a no-op.
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from hive_rc_auto.helpers.config import Config
+
+# Archive directory of the RC readings, in the legacy shape whichever schema
+# they were stored in
+READINGS = "readings"
+
+READING_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("us")),
+        ("account", pa.string()),
+        ("delegating", pa.string()),
+        ("status", pa.string()),
+        ("max_rc", pa.int64()),
+        ("delegated_rc", pa.int64()),
+        ("received_delegated_rc", pa.int64()),
+        ("real_mana", pa.float64()),
+        ("real_mana_percent", pa.float64()),
+        ("delta_percent", pa.float64()),
+        ("rc_deleg_available", pa.float64()),
+        ("delta_icon", pa.string()),
+        ("testnet", pa.bool_()),
+    ]
+)
+
+
+def partition_path(collection: str, day: date, directory: str = None) -> str:
+    directory = directory or Config.ARCHIVE_DIR
+    return os.path.join(directory, collection, f"date={day:%Y-%m-%d}", "part-0.parquet")
+
+
+def write_partition(
+    docs: Iterable[dict],
+    path: str,
+    schema: Optional[pa.Schema] = None,
+    batch_size: int = 10_000,
+) -> int:
+    """
+    Stream `docs` into the Parquet file `path` a row group per batch.
+    Without a `schema` the first batch's is used. Returns the rows written,
+    nothing is written for none.
+    """
+    docs = iter(docs)
+    rows = 0
+    writer = None
+    temp_path = path + ".tmp"
+    try:
+        while batch := list(islice(docs, batch_size)):
+            for doc in batch:
+                doc.pop("_id", None)
+            table = pa.Table.from_pylist(batch, schema=schema)
+            if writer is None:
+                schema = table.schema
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = pq.ParquetWriter(temp_path, schema, compression="zstd")
+            writer.write_table(table)
+            rows += len(batch)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(temp_path)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(temp_path, path)
+    return rows
+
+
+def archived_days(collection: str, directory: str = None) -> List[date]:
+    directory = os.path.join(directory or Config.ARCHIVE_DIR, collection)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        date.fromisoformat(name[len("date=") :])
+        for name in os.listdir(directory)
+        if name.startswith("date=")
+        and os.path.exists(os.path.join(directory, name, "part-0.parquet"))
+    )
+
+
+def read_archive(
+    collection: str, start: datetime, end: datetime = None, directory: str = None
+) -> pd.DataFrame:
+    """The archived documents from `start` to `end`, only the days needed are read"""
+    days = [
+        day
+        for day in archived_days(collection, directory)
+        if start.date() <= day and (end is None or day <= end.date())
+    ]
+    if not days:
+        return pd.DataFrame()
+    dataset = ds.dataset(
+        [partition_path(collection, day, directory) for day in days], format="parquet"
+    )
+    condition = ds.field("timestamp") >= pa.scalar(start, pa.timestamp("us"))
+    if end is not None:
+        condition &= ds.field("timestamp") < pa.scalar(end, pa.timestamp("us"))
+    df = dataset.to_table(filter=condition).to_pandas()
+    logging.info(f"Archive {collection}: {len(df):,} rows from {len(days)} days")
+    return df
+
+
+def days_between(first: datetime, before: datetime) -> Iterable[date]:
+    """Each whole day from the one `first` falls in to the one before `before`"""
+    day = first.date()
+    while day < before.date():
+        yield day
+        day += timedelta(days=1)
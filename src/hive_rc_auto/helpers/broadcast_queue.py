@@ -0,0 +1,155 @@
+import heapq
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.hive_calls import send_custom_json
+from hive_rc_auto.helpers.metrics import (
+    BROADCAST_QUEUE_DEPTH,
+    BROADCAST_QUEUE_DROPPED_TOTAL,
+    BROADCAST_QUEUE_LATE_TOTAL,
+)
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCAllData,
+    RCDirectDelegation,
+    get_utc_now_timestamp,
+)
+
+
+class QueuedDelegation:
+    """A decided delegation waiting to be broadcast"""
+
+    def __init__(
+        self,
+        dd: RCDirectDelegation,
+        all_data: RCAllData,
+        decided_at: datetime,
+        runs_out_at: Optional[datetime],
+        percent: float,
+        seq: int,
+    ) -> None:
+        self.dd = dd
+        self.all_data = all_data
+        self.decided_at = decided_at
+        self.runs_out_at = runs_out_at
+        self.seq = seq
+        # Soonest to run out first, then the lowest RC, then first decided
+        self.priority: Tuple[float, float, int] = (
+            runs_out_at.timestamp() if runs_out_at else math.inf,
+            percent,
+            seq,
+        )
+
+
+class BroadcastQueue:
+    """
+    Delegations waiting to be broadcast, most urgent first: ordered by when
+    each target is projected to run out of RC (see
+    `RCAccount.seconds_to_empty`), so with a slow node the account closest
+    to empty isn't left until last. A newer decision for a target replaces
+    one still queued, decisions older than `max_age` are dropped as stale
+    (the next cycle decides again).
+    """
+
+    def __init__(self, max_age: float = None) -> None:
+        self.max_age = Config.UPDATE_FREQUENCY_SECS if max_age is None else max_age
+        self._heap: List[Tuple[Tuple[float, float, int], str]] = []
+        self._items: Dict[str, QueuedDelegation] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def push(self, dd: RCDirectDelegation, rc: RCAccount, all_data: RCAllData):
+        now = get_utc_now_timestamp()
+        runs_out_at = None
+        if not dd.cut and math.isfinite(rc.seconds_to_empty):
+            runs_out_at = rc.timestamp + timedelta(seconds=rc.seconds_to_empty)
+        if dd.acc_to in self._items:
+            BROADCAST_QUEUE_DROPPED_TOTAL.inc(reason="replaced")
+        self._seq += 1
+        item = QueuedDelegation(
+            dd, all_data, now, runs_out_at, rc.real_mana_percent, self._seq
+        )
+        self._items[dd.acc_to] = item
+        heapq.heappush(self._heap, (item.priority, dd.acc_to))
+        BROADCAST_QUEUE_DEPTH.set(len(self._items))
+
+    def push_all(self, all_data: RCAllData):
+        rcs = {rc.account: rc for rc in all_data.rcs}
+        for dd in all_data.pending_delegations:
+            if dd.acc_to in rcs:
+                self.push(dd, rcs[dd.acc_to], all_data)
+
+    def expire(self):
+        now = get_utc_now_timestamp()
+        for target, item in list(self._items.items()):
+            if (now - item.decided_at).total_seconds() > self.max_age:
+                del self._items[target]
+                BROADCAST_QUEUE_DROPPED_TOTAL.inc(reason="expired")
+        BROADCAST_QUEUE_DEPTH.set(len(self._items))
+
+    def pop_batch(self) -> Optional[Tuple[RCAllData, str, List[RCDirectDelegation]]]:
+        """
+        The most urgent delegation together with everything else queued for
+        the same delegator, which all goes in one custom_json.
+        """
+        self.expire()
+        while self._heap:
+            priority, target = heapq.heappop(self._heap)
+            item = self._items.get(target)
+            if item is None or item.priority != priority:
+                # Replaced or already sent with an earlier batch
+                continue
+            delegator, all_data = item.dd.acc_from, item.all_data
+            batch = sorted(
+                (
+                    queued
+                    for queued in self._items.values()
+                    if queued.dd.acc_from == delegator and queued.all_data is all_data
+                ),
+                key=lambda queued: queued.priority,
+            )
+            now = get_utc_now_timestamp()
+            for queued in batch:
+                del self._items[queued.dd.acc_to]
+                if queued.runs_out_at and queued.runs_out_at < now:
+                    BROADCAST_QUEUE_LATE_TOTAL.inc()
+                    logging.warning(
+                        f"{queued.dd.acc_to} projected to have run out of RC "
+                        f"at {queued.runs_out_at:%H:%M:%S}"
+                    )
+            BROADCAST_QUEUE_DEPTH.set(len(self._items))
+            return all_data, delegator, [queued.dd for queued in batch]
+        return None
+
+    async def dispatch(
+        self,
+        send_json: bool = True,
+        delegator_lock: Callable = None,
+        on_sent: Callable[[str, List[RCDirectDelegation]], None] = None,
+        broadcaster: Callable = send_custom_json,
+        store_delegations: bool = True,
+    ):
+        """
+        Broadcast everything queued, most urgent delegator first.
+        `on_sent(delegator, delegations)` is called for each one included.
+        """
+        while (batch := self.pop_batch()) is not None:
+            all_data, delegator, delegations = batch
+
+            def sent(delegator: str, trx, delegations=delegations):
+                if on_sent:
+                    on_sent(delegator, delegations)
+
+            await all_data.get_payload_for_pending_delegations(
+                send_json=send_json,
+                delegator_lock=delegator_lock,
+                delegations=delegations,
+                on_sent=sent,
+                broadcaster=broadcaster,
+                store_delegations=store_delegations,
+            )
@@ -0,0 +1,160 @@
+"""
+Warm restarts: after every cycle the last reading of each account and the
+resolved account lists are saved, to Mongo or a local file, and reloaded at
+startup. The first cycle after a restart then has deltas to work with (HIGH
+cuts and alarms need them) and doesn't have to wait for the slow
+`RCListOfAccounts` lookups, which are redone in the background instead.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCListOfAccounts,
+    RCPolicy,
+    get_mongo_db,
+    get_utc_now_timestamp,
+)
+
+
+class RCReading(BaseModel):
+    """All a later cycle needs of a reading to work out its delta"""
+
+    account: str
+    real_mana_percent: float
+    timestamp: datetime
+
+
+class CheckpointApp(BaseModel):
+    primary_account: str
+    delegating: List[str]
+    receiving: List[str]
+
+    def to_accounts(self) -> RCListOfAccounts:
+        # construct() skips the lookups RCListOfAccounts() would make
+        return RCListOfAccounts.construct(
+            all=list(set(self.delegating + self.receiving)),
+            delegating=self.delegating,
+            receiving=self.receiving,
+        )
+
+
+class CycleCheckpoint(BaseModel):
+    timestamp: datetime
+    apps: List[CheckpointApp] = []
+    readings: List[RCReading] = []
+
+    @property
+    def age(self) -> float:
+        return (get_utc_now_timestamp() - self.timestamp).total_seconds()
+
+    def apps_for(
+        self, policies: List[RCPolicy]
+    ) -> Optional[List[Tuple[RCListOfAccounts, RCPolicy]]]:
+        """The saved accounts of each policy, None unless all are saved"""
+        saved = {app.primary_account: app for app in self.apps}
+        if not all(policy.primary_account in saved for policy in policies):
+            return None
+        return [
+            (saved[policy.primary_account].to_accounts(), policy) for policy in policies
+        ]
+
+    def recent_readings(self, max_age: float = None) -> Optional[List[RCReading]]:
+        """The readings, None if they're too old to take a delta from"""
+        max_age = Config.CHECKPOINT_MAX_AGE_SECS if max_age is None else max_age
+        if not self.readings or self.age > max_age:
+            return None
+        return self.readings
+
+
+class Checkpoint:
+    """
+    Where the checkpoint lives: `target` is "mongo" (one document per
+    worker) or "file:<path>", empty turns checkpoints off.
+    """
+
+    def __init__(self, target: str = None, key: str = None) -> None:
+        self.target = Config.CHECKPOINT if target is None else target
+        self.key = key or Config.WORKER_ID or "bot"
+
+    @property
+    def path(self) -> str:
+        return self.target[len("file:") :]
+
+    async def save(
+        self,
+        apps: List[Tuple[RCListOfAccounts, RCPolicy]],
+        rcs: List[RCAccount],
+    ):
+        if not self.target:
+            return
+        checkpoint = CycleCheckpoint(
+            timestamp=get_utc_now_timestamp(),
+            apps=[
+                CheckpointApp(
+                    primary_account=policy.primary_account,
+                    delegating=accounts.delegating,
+                    receiving=accounts.receiving,
+                )
+                for accounts, policy in apps
+            ],
+            readings=[
+                RCReading(
+                    account=rc.account,
+                    real_mana_percent=rc.real_mana_percent,
+                    timestamp=rc.timestamp,
+                )
+                for rc in rcs
+            ],
+        )
+        # Through json so Mongo gets the timestamps with their timezone
+        data = json.loads(checkpoint.json())
+        try:
+            if self.target.startswith("file:"):
+                await asyncio.to_thread(self._write_file, data)
+            else:
+                await get_mongo_db(Config.DB_NAME_CHECKPOINT).replace_one(
+                    {"_id": self.key}, data, upsert=True
+                )
+        except Exception as ex:
+            logging.error(f"Problem saving checkpoint: {ex}")
+
+    def _write_file(self, data: dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        # Atomic, a crash mid write leaves the previous checkpoint
+        os.replace(tmp_path, self.path)
+
+    async def load(self) -> Optional[CycleCheckpoint]:
+        """The last checkpoint saved, None if there isn't one"""
+        if not self.target:
+            return None
+        try:
+            if self.target.startswith("file:"):
+                if not os.path.exists(self.path):
+                    return None
+                with open(self.path) as f:
+                    data = json.load(f)
+            else:
+                data = await get_mongo_db(Config.DB_NAME_CHECKPOINT).find_one(
+                    {"_id": self.key}
+                )
+                if not data:
+                    return None
+            checkpoint = CycleCheckpoint.parse_obj(data)
+        except Exception as ex:
+            logging.error(f"Problem loading checkpoint, starting cold: {ex}")
+            return None
+        logging.info(
+            f"Checkpoint from {checkpoint.timestamp:%H:%M:%S}: "
+            f"{len(checkpoint.readings)} readings, {len(checkpoint.apps)} apps"
+        )
+        return checkpoint
@@ -21,6 +21,10 @@ class Config:
         PRIMARY_ACCOUNT: str = os.getenv("PRIMARY_ACCOUNT")
         DELEGATING_ACCOUNTS: List[str] = os.getenv("DELEGATING_ACCOUNTS").split(",")
 
+        # JSON list of primary accounts with their own delegators and
+        # thresholds, see RCPolicy. Without it PRIMARY_ACCOUNT is managed.
+        RC_APPS_FILE: str = os.getenv("RC_APPS_FILE", "")
+
         POSTING_KEY: str = os.getenv("HIVE_POSTING_KEY")
         WITNESS_ACTIVE_KEY: str = os.getenv("WITNESS_ACTIVE_KEY")
         UPDATE_FREQUENCY_SECS: int = int(
@@ -40,18 +44,140 @@ class Config:
         TESTNET_NODE: List[str] = [os.getenv("TESTNET_NODE")]
         TESTNET_CHAINID: str = {"chain_id": os.getenv("TESTNET_CHAINID")}
 
+        # Comma separated list of nodes which replaces every node list used,
+        # e.g. to point the bot at a local stand-in node.
+        HIVE_NODES: List[str] = [
+            node for node in os.getenv("HIVE_NODES", "").split(",") if node
+        ]
+
         DB_CONNECTION = os.getenv("DB_CONNECTION")
         DB_NAME = os.getenv("DB_NAME")
         if TESTNET:
             DB_NAME = "testnet_" + DB_NAME
 
         DB_NAME_DELEG = DB_NAME + "_deleg"
+        DB_NAME_LEASES = DB_NAME + "_leases"
+        DB_NAME_CHECKPOINT = DB_NAME + "_checkpoint"
+        # Compact RC history (see rc_schema) and its account dictionary
+        DB_NAME_COMPACT = DB_NAME + "_v2"
+        DB_NAME_ACCOUNTS = DB_NAME + "_accounts"
+        # Hourly rollups of the RC history, kept longer than the readings
+        DB_NAME_ROLLUP = DB_NAME + "_hourly"
 
         if not DB_CONNECTION:
             DB_CONNECTION = "mongodb://127.0.0.1:27017"
 
         MINIMUM_DELEGATION = 10_000_000_000
 
+        # How often the delegations held in memory are checked against the chain
+        DELEGATION_RECONCILE_SECS: float = float(
+            os.getenv("DELEGATION_RECONCILE_SECS", "3600")
+        )
+
+        # Hysteresis against delegation churn: the extra % past a target an
+        # account must go before changing direction, the least time between
+        # changes to one account and how long cuts are held to coalesce them
+        HYSTERESIS_PCT: float = float(os.getenv("HYSTERESIS_PCT", "2"))
+        MIN_DWELL_SECS: float = float(
+            os.getenv("MIN_DWELL_SECS", str(2 * UPDATE_FREQUENCY_SECS))
+        )
+        COALESCE_SECS: float = float(
+            os.getenv("COALESCE_SECS", str(UPDATE_FREQUENCY_SECS))
+        )
+
+        # Send delegations for alarmed accounts as soon as the RCs are read,
+        # before the rest of the cycle
+        ALARM_FAST_PATH: bool = os.getenv("ALARM_FAST_PATH", "true").lower() in (
+            "true",
+            "1",
+            "t",
+        )
+
+        # Cycles start on a fixed grid every UPDATE_FREQUENCY_SECS. When one
+        # runs late: "skip" the missed starts, "catch_up" by running them back
+        # to back or "reset" the grid to now
+        MISSED_TICK_POLICY: str = os.getenv("MISSED_TICK_POLICY", "skip")
+        # Seconds each pipeline stage may run before it's abandoned, 0 is none
+        FETCH_DEADLINE_SECS: float = float(
+            os.getenv("FETCH_DEADLINE_SECS", str(UPDATE_FREQUENCY_SECS))
+        )
+        BROADCAST_DEADLINE_SECS: float = float(
+            os.getenv("BROADCAST_DEADLINE_SECS", str(UPDATE_FREQUENCY_SECS))
+        )
+        STORE_DEADLINE_SECS: float = float(
+            os.getenv("STORE_DEADLINE_SECS", str(UPDATE_FREQUENCY_SECS))
+        )
+        # Cycles which may wait between stages before fetching blocks
+        PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "1"))
+
+        # Sharded workers: number of shards the tracked accounts are split
+        # into, 0 runs a single process handling everything
+        WORKER_SHARDS: int = int(os.getenv("WORKER_SHARDS", "0"))
+        WORKER_ID: str = os.getenv("WORKER_ID", "")
+        LEASE_SECS: float = float(
+            os.getenv("LEASE_SECS", str(3 * UPDATE_FREQUENCY_SECS))
+        )
+
+        # RC history schema written and read: "legacy" (a full document per
+        # reading) or "compact", switch once migrate_history has run
+        RC_HISTORY_SCHEMA: str = os.getenv("RC_HISTORY_SCHEMA", "legacy")
+
+        # Change-only storage: a reading is stored when RC % moves more than
+        # the tolerance, anything else changes or the heartbeat is due. A
+        # heartbeat of 0 stores every reading.
+        STORE_TOLERANCE_PCT: float = float(os.getenv("STORE_TOLERANCE_PCT", "0.5"))
+        STORE_HEARTBEAT_SECS: float = float(
+            os.getenv("STORE_HEARTBEAT_SECS", str(12 * UPDATE_FREQUENCY_SECS))
+        )
+
+        # Retention: days the raw readings, hourly rollups and delegations are
+        # kept in Mongo (TTL), 0 keeps them for ever. With an archive directory
+        # readings and delegations are written to Parquet first and only
+        # expire ARCHIVE_GRACE_DAYS after they're due to be archived. Rollups
+        # and archiving run every RETENTION_CHECK_SECS, 0 turns them off.
+        RETENTION_DAYS: float = float(os.getenv("RETENTION_DAYS", "0"))
+        ROLLUP_RETENTION_DAYS: float = float(os.getenv("ROLLUP_RETENTION_DAYS", "0"))
+        DELEG_RETENTION_DAYS: float = float(os.getenv("DELEG_RETENTION_DAYS", "0"))
+        ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "")
+        ARCHIVE_GRACE_DAYS: float = float(os.getenv("ARCHIVE_GRACE_DAYS", "2"))
+        RETENTION_CHECK_SECS: float = float(os.getenv("RETENTION_CHECK_SECS", "3600"))
+
+        # Readings per account the RC trend (delta) is fitted over, under 2
+        # uses just the last two readings
+        TREND_WINDOW: int = int(os.getenv("TREND_WINDOW", "6"))
+
+        # Startup: how long to wait for the account lookup before starting
+        # with the fallback delegating accounts (the lookup carries on), and
+        # for HiveSQL to log in and answer
+        STARTUP_TIMEOUT_SECS: float = float(os.getenv("STARTUP_TIMEOUT_SECS", "30"))
+        HIVESQL_TIMEOUT_SECS: float = float(os.getenv("HIVESQL_TIMEOUT_SECS", "10"))
+
+        # Warm restart: "mongo" or "file:<path>" to save the last cycle's
+        # readings and accounts, empty turns off. Readings older than the max
+        # age aren't used for deltas.
+        CHECKPOINT: str = os.getenv("CHECKPOINT", "mongo")
+        CHECKPOINT_MAX_AGE_SECS: float = float(
+            os.getenv("CHECKPOINT_MAX_AGE_SECS", str(3 * UPDATE_FREQUENCY_SECS))
+        )
+
+        # Dashboard: the most points per account a chart loads, longer ranges
+        # are averaged into time buckets by Mongo
+        DASHBOARD_POINTS: int = int(os.getenv("DASHBOARD_POINTS", "1000"))
+
+        # Prometheus metrics and health endpoints for the bot, port 0 turns off
+        METRICS_HOST: str = os.getenv("METRICS_HOST", "0.0.0.0")
+        METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
+
+        # Tracing spans: "file:<path>" or a collector url, empty turns off
+        TRACE_EXPORT: str = os.getenv("TRACE_EXPORT", "")
+
+        # Profiling: every Nth cycle and/or the next N cycles (SIGUSR1 re-arms)
+        PROFILE_EVERY_N: int = int(os.getenv("PROFILE_EVERY_N", "0"))
+        PROFILE_NEXT_N: int = int(os.getenv("PROFILE_NEXT_N", "0"))
+        PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+        # Report the event loop being blocked for longer than this, 0 is off
+        SLOW_CALLBACK_SECS: float = float(os.getenv("SLOW_CALLBACK_SECS", "0"))
+
     except AttributeError as ex:
         logging.exception(ex)
         logging.error("ENV File not found or not correct")
@@ -0,0 +1,137 @@
+"""
+Caching shared by every dashboard page and viewer. One Mongo client per
+connection for the process (`st.cache_resource`) and query results kept for
+a cycle (`st.cache_data` with a TTL of UPDATE_FREQUENCY_SECS): the data
+only changes once a cycle. Times in a query are snapped down to the start
+of their cycle so viewers arriving seconds apart ask the same question and
+share the answer.
+"""
+import functools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import streamlit as st
+from bson import json_util
+from pymongo import MongoClient
+
+from hive_rc_auto.helpers.config import Config
+
+
+class CacheStats:
+    """Hits and misses of each cached query since the dashboard started"""
+
+    def __init__(self) -> None:
+        self.calls: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def miss(self, name: str):
+        with self._lock:
+            self.misses[name] += 1
+
+    @property
+    def totals(self) -> Dict[str, int]:
+        misses = sum(self.misses.values())
+        return {"hits": sum(self.calls.values()) - misses, "misses": misses}
+
+
+STATS = CacheStats()
+
+
+@st.cache_resource(show_spinner=False)
+def mongo_client(connection: str) -> MongoClient:
+    return MongoClient(connection)
+
+
+def snap(timestamp: datetime, period: float = None) -> datetime:
+    """`timestamp` rounded down to the start of its cycle (UTC)"""
+    period = period or Config.UPDATE_FREQUENCY_SECS
+    utc = timestamp.tzinfo is not None
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc if utc else None)
+    seconds = (timestamp - epoch).total_seconds()
+    return datetime.fromtimestamp(seconds - seconds % period, tz=timezone.utc).replace(
+        tzinfo=timestamp.tzinfo
+    )
+
+
+def snap_times(query: Any, period: float = None) -> Any:
+    """A copy of a filter or pipeline with every datetime in it snapped"""
+    if isinstance(query, datetime):
+        return snap(query, period)
+    if isinstance(query, dict):
+        return {key: snap_times(value, period) for key, value in query.items()}
+    if isinstance(query, (list, tuple)):
+        return type(query)(snap_times(value, period) for value in query)
+    return query
+
+
+def ttl_cache(func: Callable = None, *, ttl: float = None) -> Callable:
+    """
+    `st.cache_data` for a cycle, counting hits and misses in STATS.
+    Arguments named with a leading underscore aren't part of the key.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def on_miss(*args, **kwargs):
+            STATS.miss(name)
+            return func(*args, **kwargs)
+
+        cached = st.cache_data(
+            ttl=ttl or Config.UPDATE_FREQUENCY_SECS, show_spinner=False
+        )(on_miss)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            STATS.call(name)
+            return cached(*args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorate(func) if func else decorate
+
+
+@ttl_cache
+def _aggregate(
+    key: str, connection: str, database: str, collection: str, _pipeline: list
+) -> List[dict]:
+    return list(mongo_client(connection)[database][collection].aggregate(_pipeline))
+
+
+@ttl_cache
+def _find(key: str, connection: str, database: str, collection: str, _args: dict):
+    return list(mongo_client(connection)[database][collection].find(**_args))
+
+
+def cached_aggregate(
+    connection: str, database: str, collection: str, pipeline: List[dict]
+) -> List[dict]:
+    """The results of an aggregation, shared for a cycle"""
+    pipeline = snap_times(pipeline)
+    key = json_util.dumps(pipeline)
+    return _aggregate(key, connection, database, collection, pipeline)
+
+
+def cached_find(
+    connection: str, database: str, collection: str, **kwargs: Any
+) -> List[dict]:
+    """The results of `find(**kwargs)`, shared for a cycle"""
+    kwargs = snap_times(kwargs)
+    key = json_util.dumps(kwargs)
+    return _find(key, connection, database, collection, kwargs)
+
+
+def show_cache_stats(container: Any = None):
+    totals = STATS.totals
+    (container or st.sidebar).caption(
+        f"Query cache: {totals['hits']:,} hits, {totals['misses']:,} misses"
+    )
@@ -0,0 +1,356 @@
+"""
+The secondary indexes the bot's and the dashboards' queries need, kept in
+step with this declaration by `setup_indexes` at start up, and a plan check
+which runs each dashboard query through `explain` and fails if any of them
+has gone back to scanning the whole collection.
+
+    python -m hive_rc_auto.helpers.db_indexes reconcile
+    python -m hive_rc_auto.helpers.db_indexes check [--seed]
+
+`check --seed` fills scratch databases on the local mongod (DB_CONNECTION)
+with generated documents, so the planner has something to choose with, and
+drops them afterwards.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.pingslurp_accounts import (
+    LIVETEST_FILTERS,
+    TIME_FRAME,
+    iris_per_hour_pipeline,
+    since_match,
+    transactions_pipeline,
+)
+from hive_rc_auto.helpers.rc_delegation import DB_NAME, delegations_query
+from hive_rc_auto.helpers.rc_history import bucket_secs_for
+from hive_rc_auto.helpers.rc_schema import bucketed_query, readings_query
+from hive_rc_auto.helpers.retention import rollups_query
+
+# Only indexes with this prefix are ever dropped by reconcile
+PREFIX = "rcauto_"
+PINGSLURP_DB = "pingslurp"
+
+
+class IndexSpec(BaseModel):
+    database: str
+    collection: str
+    keys: List[Tuple[str, int]]
+
+    @property
+    def name(self) -> str:
+        return PREFIX + "_".join(key.replace(".", "_") for key, _ in self.keys)
+
+
+class QuerySpec(BaseModel):
+    """A dashboard query: a `find` filter or an aggregation pipeline"""
+
+    name: str
+    database: str
+    collection: str
+    filter: Optional[Dict[str, Any]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+
+def declared_indexes() -> List[IndexSpec]:
+    return [
+        # Readings by time (dashboards, replay) and by account over time
+        IndexSpec(database=DB_NAME, collection=Config.DB_NAME, keys=[("timestamp", 1)]),
+        IndexSpec(
+            database=DB_NAME,
+            collection=Config.DB_NAME,
+            keys=[("account", 1), ("timestamp", 1)],
+        ),
+        IndexSpec(
+            database=DB_NAME, collection=Config.DB_NAME_COMPACT, keys=[("timestamp", 1)]
+        ),
+        IndexSpec(
+            database=DB_NAME,
+            collection=Config.DB_NAME_COMPACT,
+            keys=[("a", 1), ("timestamp", 1)],
+        ),
+        IndexSpec(
+            database=DB_NAME, collection=Config.DB_NAME_ROLLUP, keys=[("timestamp", 1)]
+        ),
+        IndexSpec(
+            database=DB_NAME,
+            collection=Config.DB_NAME_ROLLUP,
+            keys=[("account", 1), ("timestamp", 1)],
+        ),
+        # Delegations by time and by target
+        IndexSpec(
+            database=DB_NAME, collection=Config.DB_NAME_DELEG, keys=[("timestamp", 1)]
+        ),
+        IndexSpec(
+            database=DB_NAME,
+            collection=Config.DB_NAME_DELEG,
+            keys=[("deleg.acc_to", 1), ("timestamp", 1)],
+        ),
+        # Pingslurp pages: grouped by posting account and by host over time
+        IndexSpec(database=PINGSLURP_DB, collection="meta_ts", keys=[("timestamp", 1)]),
+        IndexSpec(
+            database=PINGSLURP_DB,
+            collection="meta_ts",
+            keys=[("metadata.posting_auth", 1), ("timestamp", 1)],
+        ),
+        IndexSpec(
+            database=PINGSLURP_DB, collection="hosts_ts", keys=[("timestamp", 1)]
+        ),
+        IndexSpec(
+            database=PINGSLURP_DB,
+            collection="hosts_ts",
+            keys=[("metadata.host", 1), ("timestamp", 1)],
+        ),
+    ]
+
+
+def dashboard_queries(now: datetime = None) -> List[QuerySpec]:
+    """The dashboards' queries, built by the functions the pages call"""
+    now = now or datetime.utcnow()
+    day_ago = now - timedelta(hours=24)
+    # 2_RC_Overview's "All", long enough to be averaged by Mongo
+    month_ago = now - timedelta(weeks=4)
+    bucket_secs = bucket_secs_for((now - month_ago).total_seconds())
+    queries = []
+    # 2_RC_Overview and replay, in either schema
+    for compact in (False, True):
+        schema = "compact" if compact else "legacy"
+        collection, query = readings_query(day_ago, compact=compact)
+        queries.append(
+            QuerySpec(
+                name=f"rc_readings_{schema}",
+                database=DB_NAME,
+                collection=collection,
+                filter=query,
+            )
+        )
+        collection, pipeline = bucketed_query(month_ago, None, bucket_secs, compact)
+        queries.append(
+            QuerySpec(
+                name=f"rc_readings_{schema}_bucketed",
+                database=DB_NAME,
+                collection=collection,
+                pipeline=pipeline,
+            )
+        )
+    queries += [
+        # retention.read_history past the raw readings' retention
+        QuerySpec(
+            name="rc_rollups",
+            database=DB_NAME,
+            collection=Config.DB_NAME_ROLLUP,
+            filter=rollups_query(month_ago, day_ago),
+        ),
+        # 2_RC_Overview delegation markers
+        QuerySpec(
+            name="rc_delegations",
+            database=DB_NAME,
+            collection=Config.DB_NAME_DELEG,
+            filter=delegations_query(day_ago),
+        ),
+    ]
+    # 4_Pingslurp_Accounts, and the sizes on 2_RC_Overview
+    for by_account in (True, False):
+        queries.append(
+            QuerySpec(
+                name=f"pingslurp_{'by_account' if by_account else 'total'}",
+                database=PINGSLURP_DB,
+                collection="meta_ts",
+                pipeline=transactions_pipeline(
+                    since_match(day_ago),
+                    LIVETEST_FILTERS["Exclude Live Tests"],
+                    TIME_FRAME,
+                    by_account,
+                ),
+            )
+        )
+    # 5_Pingslurp_Hosts
+    for by_host in (True, False):
+        queries.append(
+            QuerySpec(
+                name=f"pingslurp_hosts_{'by_host' if by_host else 'total'}",
+                database=PINGSLURP_DB,
+                collection="hosts_ts",
+                pipeline=iris_per_hour_pipeline(day_ago, by_host),
+            )
+        )
+    return queries
+
+
+def reconcile_indexes(db: Database, specs: List[IndexSpec]) -> Tuple[int, int]:
+    """
+    Create the declared indexes missing from `db` and drop ones of ours
+    (named with PREFIX) no longer declared. Returns (created, dropped).
+    """
+    created = dropped = 0
+    collection_names = set(db.list_collection_names())
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(spec)
+    for collection_name, wanted in by_collection.items():
+        if collection_name not in collection_names:
+            continue
+        collection = db[collection_name]
+        existing = collection.index_information()
+        existing_keys = {tuple(map(tuple, info["key"])) for info in existing.values()}
+        for spec in wanted:
+            if spec.name in existing or tuple(spec.keys) in existing_keys:
+                continue
+            collection.create_index(spec.keys, name=spec.name)
+            logging.info(f"Index {spec.name} created on {collection_name}")
+            created += 1
+        wanted_names = {spec.name for spec in wanted}
+        for name in existing:
+            if name.startswith(PREFIX) and name not in wanted_names:
+                collection.drop_index(name)
+                logging.info(f"Index {name} dropped from {collection_name}")
+                dropped += 1
+    return created, dropped
+
+
+def setup_indexes() -> Tuple[int, int]:
+    """Reconcile the RC database's indexes, after `setup_mongo_db`"""
+    client = MongoClient(Config.DB_CONNECTION)
+    try:
+        return reconcile_indexes(
+            client[DB_NAME],
+            [spec for spec in declared_indexes() if spec.database == DB_NAME],
+        )
+    finally:
+        client.close()
+
+
+def collscans(explain: Any) -> Iterator[str]:
+    """The collections scanned in full anywhere in an `explain` result"""
+    if isinstance(explain, dict):
+        if explain.get("stage") == "COLLSCAN":
+            yield explain.get("namespace", explain.get("ns", ""))
+        for key, value in explain.items():
+            # Plans the planner considered but didn't pick don't count
+            if key != "rejectedPlans":
+                yield from collscans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from collscans(item)
+
+
+def explain_query(db: Database, query: QuerySpec) -> dict:
+    if query.pipeline is not None:
+        command = {
+            "aggregate": query.collection,
+            "pipeline": query.pipeline,
+            "cursor": {},
+        }
+    else:
+        command = {"find": query.collection, "filter": query.filter}
+    return db.command("explain", command, verbosity="queryPlanner")
+
+
+def check_plans(databases: Dict[str, Database], queries: List[QuerySpec]) -> List[str]:
+    """Run each query through explain, the names of any which scan"""
+    failures = []
+    for query in queries:
+        db = databases.get(query.database)
+        if db is None or query.collection not in db.list_collection_names():
+            logging.info(f"Plan {query.name}: skipped, no collection")
+            continue
+        scanned = list(collscans(explain_query(db, query)))
+        if scanned:
+            logging.error(f"Plan {query.name}: COLLSCAN {scanned}")
+            failures.append(query.name)
+        else:
+            logging.info(f"Plan {query.name}: ok")
+    return failures
+
+
+def seed(databases: Dict[str, Database], accounts: int = 50, hours: int = 72):
+    """Timeseries collections filled with a reading per account every cycle"""
+    now = datetime.utcnow()
+    steps = int(hours * 3600 / Config.UPDATE_FREQUENCY_SECS)
+    times = [
+        now - timedelta(seconds=i * Config.UPDATE_FREQUENCY_SECS) for i in range(steps)
+    ]
+    names = [f"podping.{i:03d}" for i in range(accounts)]
+    collections = {
+        (DB_NAME, Config.DB_NAME): ("account", lambda t, n, i: {"account": n}),
+        (DB_NAME, Config.DB_NAME_COMPACT): ("a", lambda t, n, i: {"a": i}),
+        (DB_NAME, Config.DB_NAME_ROLLUP): ("account", lambda t, n, i: {"account": n}),
+        (DB_NAME, Config.DB_NAME_DELEG): (
+            "deleg",
+            lambda t, n, i: {"deleg": {"acc_from": "podping", "acc_to": n}},
+        ),
+        (PINGSLURP_DB, "meta_ts"): (
+            "metadata",
+            lambda t, n, i: {"metadata": {"posting_auth": n, "id": "pp_podcast"}},
+        ),
+        (PINGSLURP_DB, "hosts_ts"): (
+            "metadata",
+            lambda t, n, i: {"metadata": {"host": f"host{i % 7}"}},
+        ),
+    }
+    for (database, name), (meta_field, make) in collections.items():
+        db = databases[database]
+        db.drop_collection(name)
+        db.create_collection(
+            name, timeseries={"timeField": "timestamp", "metaField": meta_field}
+        )
+        db[name].insert_many(
+            {"timestamp": t, "real_mana": 1, **make(t, n, i)}
+            for t in times
+            for i, n in enumerate(names)
+        )
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage and check Mongo indexes")
+    parser.add_argument("command", choices=["reconcile", "check"])
+    parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="Check against generated data in scratch databases on DB_CONNECTION",
+    )
+    parsed = parser.parse_args(args)
+    rc_client = MongoClient(Config.DB_CONNECTION)
+    pingslurp_connection = os.getenv("PINGSLURP_DB_CONNECTION")
+    if parsed.seed:
+        databases = {
+            DB_NAME: rc_client[f"{DB_NAME}_plancheck"],
+            PINGSLURP_DB: rc_client[f"{PINGSLURP_DB}_plancheck"],
+        }
+    else:
+        databases = {DB_NAME: rc_client[DB_NAME]}
+        if pingslurp_connection:
+            databases[PINGSLURP_DB] = MongoClient(pingslurp_connection)[PINGSLURP_DB]
+    try:
+        if parsed.seed:
+            seed(databases)
+        for database, db in databases.items():
+            created, dropped = reconcile_indexes(
+                db, [s for s in declared_indexes() if s.database == database]
+            )
+            logging.info(f"{database}: {created} indexes created, {dropped} dropped")
+        if parsed.command == "reconcile":
+            return 0
+        failures = check_plans(databases, dashboard_queries())
+        return 1 if failures else 0
+    finally:
+        if parsed.seed:
+            for db in databases.values():
+                rc_client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(module)-14s %(lineno) 5d : %(message)s",
+        datefmt="%m-%dT%H:%M:%S",
+    )
+    sys.exit(main())
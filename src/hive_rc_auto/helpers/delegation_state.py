@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import DELEGATION_DRIFT_TOTAL, NOOP_DELEGATIONS_TOTAL
+from hive_rc_auto.helpers.rc_delegation import (
+    RCDirectDelegation,
+    get_utc_now_timestamp,
+    list_rc_direct_delegations,
+)
+
+
+class DelegationState:
+    """
+    What we believe is on chain: the RC each delegator has delegated to each
+    account. Seeded from `list_rc_direct_delegations`, kept up to date from
+    our own broadcasts once they're included and only read back from the
+    chain every `reconcile_secs` to pick up anything changed elsewhere.
+
+    Planned delegations which match it exactly are dropped before the
+    payloads are built, saving a sign-and-broadcast round trip which the node
+    would only reject with "same amount of RC already exist".
+    """
+
+    def __init__(self, reconcile_secs: float = None) -> None:
+        self.reconcile_secs = (
+            Config.DELEGATION_RECONCILE_SECS
+            if reconcile_secs is None
+            else reconcile_secs
+        )
+        self.state: Dict[str, Dict[str, int]] = {}
+        self.reconciled_at: Dict[str, datetime] = {}
+
+    def stale(self, delegator: str) -> bool:
+        reconciled_at = self.reconciled_at.get(delegator)
+        if not reconciled_at:
+            return True
+        age = (get_utc_now_timestamp() - reconciled_at).total_seconds()
+        return age >= self.reconcile_secs
+
+    async def reconcile(self, delegator: str):
+        """Replace what we hold for `delegator` with what the chain says"""
+        on_chain = {
+            dd.acc_to: dd.delegated_rc
+            for dd in await list_rc_direct_delegations(delegator)
+        }
+        held = self.state.get(delegator)
+        if held is not None and held != on_chain:
+            changed = {
+                acc
+                for acc in set(held) | set(on_chain)
+                if held.get(acc) != on_chain.get(acc)
+            }
+            DELEGATION_DRIFT_TOTAL.inc(len(changed))
+            logging.warning(f"Delegations from {delegator} changed on chain: {changed}")
+        self.state[delegator] = on_chain
+        self.reconciled_at[delegator] = get_utc_now_timestamp()
+
+    async def delegations_of(self, delegator: str) -> List[RCDirectDelegation]:
+        if self.stale(delegator):
+            await self.reconcile(delegator)
+        return [
+            RCDirectDelegation.parse_obj(
+                {"from": delegator, "to": acc_to, "delegated_rc": amount}
+            )
+            for acc_to, amount in self.state[delegator].items()
+        ]
+
+    def is_no_op(self, dd: RCDirectDelegation) -> bool:
+        held = self.state.get(dd.acc_from)
+        if held is None:
+            return False
+        return held.get(dd.acc_to, 0) == int(dd.delegated_rc)
+
+    def drop_no_ops(
+        self, delegations: List[RCDirectDelegation]
+    ) -> List[RCDirectDelegation]:
+        keep = [dd for dd in delegations if not self.is_no_op(dd)]
+        if len(keep) < len(delegations):
+            NOOP_DELEGATIONS_TOTAL.inc(len(delegations) - len(keep))
+            logging.info(
+                f"Skipped {len(delegations) - len(keep)} unchanged delegations"
+            )
+        return keep
+
+    def record_sent(self, delegator: str, delegations: List[RCDirectDelegation]):
+        """Apply delegations from `delegator` which are now in a block"""
+        held = self.state.get(delegator)
+        if held is None:
+            # Not seeded yet, the next reconcile will see it
+            return
+        for dd in delegations:
+            if dd.acc_from != delegator:
+                continue
+            if dd.delegated_rc:
+                held[dd.acc_to] = int(dd.delegated_rc)
+            else:
+                held.pop(dd.acc_to, None)
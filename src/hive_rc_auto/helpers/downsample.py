@@ -0,0 +1,102 @@
+"""
+Shape-preserving downsampling for the dashboard charts. Averaging a series
+down to fewer points flattens exactly what the charts are for, the RC dips
+and the bursts of podpings. Largest-Triangle-Three-Buckets keeps, from each
+bucket, the point which makes the biggest triangle with its neighbours, so
+peaks and troughs survive; `minmax_indices` keeps each bucket's extremes
+outright.
+"""
+from typing import Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from hive_rc_auto.helpers.config import Config
+
+
+def as_numbers(values: Any) -> np.ndarray:
+    """x values (numbers, datetimes or timedeltas) as floats"""
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_datetime64_any_dtype(
+        values
+    ) or pd.api.types.is_timedelta64_dtype(values):
+        return values.to_numpy().astype("int64").astype(float)
+    return values.to_numpy(dtype=float, na_value=np.nan)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Positions of the `n_out` points LTTB keeps, always including the first
+    and last. Points with no y value are left out.
+    """
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(valid)
+    if n_out >= n or n_out < 3:
+        return valid
+    x, y = x[valid], y[valid]
+    # Bucket i holds points edges[i] to edges[i+1], the first and last
+    # points are buckets of their own
+    edges = np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    # The average of each bucket, the next bucket's is the third corner
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.diff(edges)
+    avg_x = np.append((cum_x[edges[1:]] - cum_x[edges[:-1]]) / counts, x[-1])
+    avg_y = np.append((cum_y[edges[1:]] - cum_y[edges[:-1]]) / counts, y[-1])
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return valid[keep]
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the lowest and highest point in each of `n_out // 2` buckets"""
+    valid = np.flatnonzero(np.isfinite(y))
+    n = len(valid)
+    buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return valid
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y[valid]
+    rows = padded.reshape(buckets, size)
+    filled = ~np.all(np.isnan(rows), axis=1)
+    offsets = np.arange(buckets)[filled] * size
+    lows = offsets + np.nanargmin(rows[filled], axis=1)
+    highs = offsets + np.nanargmax(rows[filled], axis=1)
+    return valid[np.unique(np.concatenate((lows, highs)))]
+
+
+def take(values: Any, positions: np.ndarray) -> Any:
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        return values.iloc[positions]
+    if isinstance(values, (pd.Index, np.ndarray)):
+        return values[positions]
+    return [values[i] for i in positions]
+
+
+def capped(
+    x: Any, y: Any, *others: Any, max_points: int = None, method: str = "lttb"
+) -> Tuple[Any, ...]:
+    """
+    `x`, `y` and any other per-point values (hover text, marker sizes) cut
+    down to at most `max_points` (default DASHBOARD_POINTS) points for a
+    trace, using LTTB or "minmax".
+    """
+    max_points = max_points or Config.DASHBOARD_POINTS
+    if len(x) <= max_points:
+        return (x, y, *others)
+    y_values = np.asarray(as_numbers(y))
+    if method == "minmax":
+        positions = minmax_indices(y_values, max_points)
+    else:
+        positions = lttb_indices(as_numbers(x), y_values, max_points)
+    return tuple(take(values, positions) for values in (x, y, *others))
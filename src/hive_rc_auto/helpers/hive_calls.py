@@ -1,10 +1,12 @@
+import asyncio
 import json
 import logging
 import os
 import re
 from datetime import datetime, timedelta
 from random import shuffle
-from typing import Any, Callable, List, Optional, Union
+from timeit import default_timer as timer
+from typing import Any, Callable, Dict, List, Optional, Union
 
 import backoff
 import httpx
@@ -16,6 +18,8 @@ from lighthive.helpers.account import VOTING_MANA_REGENERATION_IN_SECONDS
 from pydantic import BaseModel, Field
 
 from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import RPC_FAILURES_TOTAL, RPC_LATENCY_SECONDS
+from hive_rc_auto.helpers.tracing import span
 
 Config.VOTING_MANA_REGENERATION_IN_SECONDS = VOTING_MANA_REGENERATION_IN_SECONDS
 
@@ -27,6 +31,11 @@ class HiveTrx(BaseModel):
     expired: bool
 
 
+# Clients are reused so they keep their node choice and connections between
+# cycles and are shared by every primary account the bot manages.
+_clients: Dict[tuple, Client] = {}
+
+
 def get_client(
     posting_keys: Optional[List[str]] = None,
     nodes=None,
@@ -36,7 +45,12 @@ def get_client(
     chain=None,
     automatic_node_selection=False,
     api_type="condenser_api",
+    shared: bool = True,
 ) -> Client:
+    """
+    Return a lighthive client, by default from the shared registry. Each
+    api_type gets its own client because calling a client sets its api_type.
+    """
     try:
         if os.getenv("TESTNET", "False").lower() in (
             "true",
@@ -45,6 +59,8 @@ def get_client(
         ):
             nodes = [os.getenv("TESTNET_NODE")]
             chain = {"chain_id": os.getenv("TESTNET_CHAINID")}
+        elif Config.HIVE_NODES:
+            nodes = Config.HIVE_NODES
         else:
             if not nodes:
                 nodes = [
@@ -56,6 +72,16 @@ def get_client(
                     # "https://api.openhive.network",
                     # "https://rpc.ausbit.dev",
                 ]
+        key = (
+            tuple(nodes),
+            tuple(posting_keys or []),
+            api_type,
+            json.dumps(chain, sort_keys=True),
+            connect_timeout,
+            read_timeout,
+        )
+        if shared and key in _clients:
+            return _clients[key]
         client = Client(
             keys=posting_keys,
             nodes=nodes,
@@ -70,7 +96,10 @@ def get_client(
             circuit_breaker=True,
         )
         logging.info(f"Client created: {client.current_node}")
-        return client(api_type)
+        client = client(api_type)
+        if shared:
+            _clients[key] = client
+        return client
     except Exception as ex:
         logging.error("Error getting Hive Client")
         logging.exception(ex)
@@ -79,6 +108,7 @@ def get_client(
 
 def get_delegated_posting_auth_accounts(
     primary_account=Config.PRIMARY_ACCOUNT,
+    fallback_accounts: List[str] = None,
 ) -> List[str]:
     """
     Return a list of all accounts which have delegated posting authority
@@ -87,19 +117,22 @@ def get_delegated_posting_auth_accounts(
 
     The primary account is added to the start of the list
     """
+    if fallback_accounts is None:
+        fallback_accounts = Config.DELEGATING_ACCOUNTS
     try:
         SQLCommand = (
             f"SELECT name FROM Accounts WHERE posting LIKE "
             f"'%\"{primary_account}\"%'"
         )
-        result = hive_sql(SQLCommand, 100)
+        result = hive_sql(SQLCommand, 100, timeout=Config.HIVESQL_TIMEOUT_SECS)
 
-    except pymssql.OperationalError as e:
+    except (pymssql.Error, KeyError) as e:
+        # Unreachable, too slow or no HIVESQL setting
         logging.error("Unable to connect to HiveSQL")
         logging.error(e)
         # If there is a problem with HiveSQL falls back to hard coded list
         # found in the .env
-        return [primary_account] + Config.DELEGATING_ACCOUNTS
+        return [primary_account] + fallback_accounts
     except Exception as e:
         logging.error(e)
         raise e
@@ -107,15 +140,16 @@ def get_delegated_posting_auth_accounts(
     return ans
 
 
-def hive_sql(SQLCommand, limit):
+def hive_sql(SQLCommand, limit, timeout: int = 0):
+    """Run a query on HiveSQL, `timeout` seconds for the query (0 waits)"""
     db = os.environ["HIVESQL"].split()
     conn = pymssql.connect(
         server=db[0],
         user=db[1],
         password=db[2],
         database=db[3],
-        timeout=0,
-        login_timeout=10,
+        timeout=int(timeout),
+        login_timeout=int(timeout) or 10,
     )
     cursor = conn.cursor()
     cursor.execute(SQLCommand)
@@ -157,6 +191,7 @@ def get_rcs(check_accounts: List[str]) -> dict:
         client=client_rc,
         call_to_make=client_rc.find_rc_accounts,
         params=({"accounts": check_accounts}),
+        method_name="find_rc_accounts",
     )
 
 
@@ -210,7 +245,9 @@ async def publish_feed(publisher: str = "brianoflondon") -> bool:
                         },
                     },
                 )
-                trx = client.broadcast_sync(op=op, dry_run=False)
+                trx = await asyncio.to_thread(
+                    client.broadcast_sync, op=op, dry_run=False
+                )
                 logging.info(f"Price feed published: {trx}")
                 with open("price_feed.json", "w") as f:
                     json.dump(
@@ -224,18 +261,47 @@ async def publish_feed(publisher: str = "brianoflondon") -> bool:
         return False
 
 
-def make_lighthive_call(client: Client, call_to_make: Callable, params: Any = None):
+def make_lighthive_call(
+    client: Client,
+    call_to_make: Callable,
+    params: Any = None,
+    method_name: str = None,
+):
+    """
+    Make a call trying each node in turn. `method_name` labels the latency
+    metrics, calls made through the client's attribute lookup all share the
+    same function name.
+    """
+    method_name = method_name or getattr(call_to_make, "__name__", "unknown")
     counter = len(client.node_list)
+    attempt = 0
     while counter > 0:
+        node = client.current_node
+        attempt += 1
+        start = timer()
         try:
-            if params:
-                response = call_to_make(params)
-            else:
-                response = call_to_make()
+            with span(
+                "rpc_call", node=node, method=method_name, attempt=attempt
+            ) as rpc_span:
+                try:
+                    if params:
+                        response = call_to_make(params)
+                    else:
+                        response = call_to_make()
+                except Exception as ex:
+                    RPC_FAILURES_TOTAL.inc(node=node, method=method_name)
+                    logging.error(f"{node} {client.api_type} Failing: {ex}")
+                    client.next_node()
+                    # Before the span ends, it's exported as soon as it does
+                    if rpc_span:
+                        rpc_span.add_event("failover", next_node=client.current_node)
+                    raise
+                finally:
+                    RPC_LATENCY_SECONDS.observe(
+                        timer() - start, node=node, method=method_name
+                    )
             return response
-        except Exception as ex:
-            logging.error(f"{client.current_node} {client.api_type} Failing: {ex}")
-            client.next_node()
+        except Exception:
             logging.warning(f"Trying new node: {client.current_node}")
             counter -= 1
     raise Exception("Everything failed")
@@ -287,7 +353,18 @@ async def send_custom_json(
             required_auth=required_auth,
             required_posting_auth=required_posting_auth,
         )
-        trx = client.broadcast_sync(op=op, dry_run=False)
+        node = client.current_node
+        with span(
+            "send_custom_json",
+            node=node,
+            hive_operation_id=hive_operation_id,
+            required_posting_auth=required_posting_auth,
+        ) as broadcast_span, RPC_LATENCY_SECONDS.time(
+            node=node, method="broadcast_sync"
+        ):
+            trx = await asyncio.to_thread(client.broadcast_sync, op=op, dry_run=False)
+            if broadcast_span and trx:
+                broadcast_span.set_attribute("trx_id", trx.get("id"))
 
         logging.info(f"Json sent via Lighthive Node: {client.current_node}")
         logging.info(f"{trx}")
@@ -0,0 +1,108 @@
+"""
+A policy layer between the delegation decisions and the broadcasts, to stop
+accounts flip-flopping between increases and cuts on consecutive cycles.
+Every broadcast costs the delegator RC and an RPC round trip.
+
+- Hysteresis: an account whose last change went one way only changes the
+  other way once it's `hysteresis_pct` beyond the target it's crossing
+  (per account bands in `RCPolicy.account_bands`).
+- Dwell time: no change to an account within `min_dwell_secs` of the last.
+- Coalescing: cuts aren't urgent, they're held for `coalesce_secs` and only
+  sent, at the latest amount, if they're still wanted when that's up.
+
+Increases for accounts with an alarm set are never held back.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from hive_rc_auto.helpers.metrics import DELEGATIONS_SUPPRESSED_TOTAL
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCAllData,
+    RCDirectDelegation,
+    RCPolicy,
+    get_utc_now_timestamp,
+)
+
+INCREASE = "increase"
+CUT = "cut"
+
+
+class DelegationGovernor:
+    """Keeps the state across cycles, use one for the life of the bot"""
+
+    def __init__(self) -> None:
+        self.last_change: Dict[str, Tuple[datetime, str]] = {}
+        self.held: Dict[Tuple[str, str], Tuple[datetime, RCDirectDelegation]] = {}
+        self.suppressed: Dict[str, int] = {}
+
+    def _suppress(self, reason: str, dd: RCDirectDelegation):
+        self.suppressed[reason] = self.suppressed.get(reason, 0) + 1
+        DELEGATIONS_SUPPRESSED_TOTAL.inc(reason=reason)
+        logging.info(f"Holding back ({reason}): {dd.acc_from} -> {dd.acc_to}")
+
+    @staticmethod
+    def band(policy: RCPolicy, account: str) -> float:
+        return policy.account_bands.get(account, policy.hysteresis_pct)
+
+    def blocked_by(
+        self, rc: RCAccount, dd: RCDirectDelegation, policy: RCPolicy, now: datetime
+    ) -> str:
+        """Why this change shouldn't go out now, empty if it should"""
+        if not dd.cut and rc.alarm_set:
+            return ""
+        last = self.last_change.get(dd.acc_to)
+        if not last:
+            return ""
+        last_time, last_direction = last
+        if (now - last_time).total_seconds() < policy.min_dwell_secs:
+            return "dwell"
+        band = self.band(policy, dd.acc_to)
+        if dd.cut and last_direction == INCREASE:
+            if rc.real_mana_percent < policy.rc_pct_upper_target + band:
+                return "hysteresis"
+        elif not dd.cut and last_direction == CUT:
+            if rc.real_mana_percent > policy.rc_pct_lower_target - band:
+                return "hysteresis"
+        return ""
+
+    def apply(self, all_data: RCAllData) -> List[RCDirectDelegation]:
+        """
+        Replace the cycle's pending delegations with the ones to send now,
+        call after `update_delegations`.
+        """
+        policy = all_data.policy
+        now = get_utc_now_timestamp()
+        rcs = {rc.account: rc for rc in all_data.rcs}
+        send: List[RCDirectDelegation] = []
+        wanted_cuts = set()
+        for dd in all_data.pending_delegations:
+            rc = rcs.get(dd.acc_to)
+            reason = self.blocked_by(rc, dd, policy, now) if rc else ""
+            if reason:
+                self._suppress(reason, dd)
+            elif dd.cut and policy.coalesce_secs:
+                key = (dd.acc_from, dd.acc_to)
+                first_seen = self.held[key][0] if key in self.held else now
+                if key in self.held:
+                    self._suppress("coalesced", self.held[key][1])
+                self.held[key] = (first_seen, dd)
+                wanted_cuts.add(key)
+            else:
+                send.append(dd)
+        for key, (first_seen, dd) in list(self.held.items()):
+            if dd.acc_to not in rcs:
+                # Another primary account's target
+                continue
+            if key not in wanted_cuts:
+                # Not wanted any more, this is the flip-flop being avoided
+                del self.held[key]
+                self._suppress("withdrawn", dd)
+            elif (now - first_seen).total_seconds() >= policy.coalesce_secs:
+                del self.held[key]
+                send.append(dd)
+        for dd in all_data.alarm_delegations + send:
+            self.last_change[dd.acc_to] = (now, CUT if dd.cut else INCREASE)
+        all_data.pending_delegations = send
+        return send
@@ -0,0 +1,107 @@
+"""
+Append-only refresh for the dashboard pages. A page keeps the frame for its
+time window between reruns and on each refresh fetches only from the start
+of the newest bucket it holds (that bucket may have been partial), swaps
+those rows for the fresh ones, trims what has fallen out of the window and
+recomputes rolling statistics only where the new rows reach.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, Optional
+
+import pandas as pd
+import streamlit as st
+
+from hive_rc_auto.helpers.config import Config
+
+Fetch = Callable[[datetime], pd.DataFrame]
+
+
+class IncrementalFrame:
+    """
+    The rows of the last `window`, ordered by their `timestamp` column.
+    `bucket` is the width of the rows' time buckets (a cycle for readings).
+    """
+
+    def __init__(self, window: timedelta, bucket: timedelta = None) -> None:
+        self.window = window
+        self.bucket = bucket or timedelta(seconds=Config.UPDATE_FREQUENCY_SECS)
+        self.df = pd.DataFrame()
+        # Where the last update started replacing rows
+        self.since: Optional[datetime] = None
+        self.fetched = 0
+
+    def refresh_from(self) -> Optional[datetime]:
+        """The start of the newest bucket held, None before the first load"""
+        if self.df.empty:
+            return None
+        last = pd.Timestamp(self.df.timestamp.iloc[-1])
+        return last.floor(self.bucket).to_pydatetime()
+
+    def update(self, fetch: Fetch, now: datetime = None) -> pd.DataFrame:
+        """
+        Bring the frame up to `now` with `fetch(start)`, which returns the
+        rows from `start` (or a little before) on with a `timestamp` column.
+        """
+        now = now or datetime.utcnow()
+        start = now - self.window
+        since = self.refresh_from() or start
+        new = fetch(since)
+        if not new.empty:
+            # `fetch` may start earlier, a cached query snaps its times down
+            new = new[new.timestamp >= since].sort_values("timestamp", kind="stable")
+        self.fetched = len(new)
+        parts = [self.df[self.df.timestamp < since]] if not self.df.empty else []
+        if not new.empty:
+            parts.append(new)
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if not df.empty:
+            df = df[df.timestamp >= start].reset_index(drop=True)
+        self.df = df
+        self.since = since
+        return df
+
+
+def incremental_frame(
+    key: Hashable, window: timedelta, bucket: timedelta = None
+) -> IncrementalFrame:
+    """The viewer's frame for `key` (a page and its window and filters)"""
+    frames: Dict[Hashable, IncrementalFrame] = st.session_state.setdefault(
+        "incremental_frames", {}
+    )
+    if key not in frames:
+        frames[key] = IncrementalFrame(window, bucket)
+    return frames[key]
+
+
+def update_rolling(
+    df: pd.DataFrame,
+    column: str,
+    windows: Dict[str, str],
+    since: datetime,
+    by: str = None,
+    center: bool = False,
+) -> pd.DataFrame:
+    """
+    Time-based rolling means of `column` into the columns named in
+    `windows` ({"avg4H": "4h"}), recomputed only for the rows that rows
+    from `since` on can change, from the rows they depend on. `df` is
+    ordered by its `timestamp` column. Returns `df`.
+    """
+    if df.empty:
+        return df
+    widest = max(pd.Timedelta(w) for w in windows.values())
+    reach = widest / 2 if center else widest
+    missing = any(name not in df for name in windows)
+    changed_from = pd.Timestamp(since) - (reach if center else pd.Timedelta(0))
+    context = df.timestamp >= (changed_from - reach) if not missing else None
+    tail = df if missing else df[context]
+    groups = tail.groupby(by, sort=False) if by else [(None, tail)]
+    for _, part in groups:
+        series = part.set_index("timestamp")[column]
+        for name, window in windows.items():
+            rolled = series.rolling(window, center=center).mean().to_numpy()
+            keep = (
+                slice(None) if missing else (part.timestamp >= changed_from).to_numpy()
+            )
+            df.loc[part.index[keep], name] = rolled[keep]
+    return df
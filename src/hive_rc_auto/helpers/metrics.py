@@ -0,0 +1,414 @@
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from hive_rc_auto.helpers.config import Config
+
+# Prometheus text exposition format, version 0.0.4 (also read by OpenMetrics
+# scrapers). Kept to the standard library so the bot has no extra dependency.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent inside the `with` block, works across awaits"""
+        start = timer()
+        try:
+            yield
+        finally:
+            self.observe(timer() - start, **labels)
+
+    def samples(self):
+        for key in sorted(self._counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts[key]):
+                cumulative += count
+                labels = _format_labels(
+                    self.labelnames + ("le",), key + (_format_value(bound),)
+                )
+                yield "_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield "_sum", labels, self._sums[key]
+            yield "_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+CYCLE_STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "rc_bot_cycle_stage_seconds",
+        "Time spent in each stage of an update cycle.",
+        ["stage"],
+    )
+)
+CYCLES_TOTAL: Counter = REGISTRY.register(
+    Counter("rc_bot_cycles_total", "Update cycles completed.")
+)
+CYCLE_LAG_SECONDS: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_cycle_lag_seconds",
+        "How late the last cycle started against its schedule.",
+    )
+)
+LAST_CYCLE_TIMESTAMP: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_last_cycle_timestamp_seconds",
+        "Unix time the last update cycle finished.",
+    )
+)
+STARTUP_PHASE_SECONDS: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_startup_phase_seconds",
+        "How long each startup phase took.",
+        ["phase"],
+    )
+)
+TIME_TO_FIRST_CYCLE_SECONDS: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_time_to_first_cycle_seconds",
+        "From the bot starting to its first update cycle finishing.",
+    )
+)
+MISSED_TICKS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_missed_ticks_total",
+        "Scheduled cycle starts missed because the previous one ran late.",
+    )
+)
+STAGE_DEADLINE_EXCEEDED_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_stage_deadline_exceeded_total",
+        "Cycle stages abandoned for running past their deadline.",
+        ["stage"],
+    )
+)
+RPC_LATENCY_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "rc_bot_rpc_latency_seconds",
+        "Latency of each Hive RPC attempt by node and method.",
+        ["node", "method"],
+    )
+)
+RPC_FAILURES_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_rpc_failures_total",
+        "Failed Hive RPC attempts by node and method.",
+        ["node", "method"],
+    )
+)
+MONGO_WRITE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "rc_bot_mongo_write_seconds",
+        "Latency of MongoDB writes by collection.",
+        ["collection"],
+    )
+)
+MONGO_WRITE_ERRORS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_mongo_write_errors_total",
+        "Failed MongoDB writes by collection.",
+        ["collection"],
+    )
+)
+MONGO_QUEUE_DEPTH: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_mongo_write_queue_depth",
+        "Background MongoDB writes waiting to finish.",
+    )
+)
+STORED_READINGS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_stored_readings_total",
+        "RC readings written, or skipped as unchanged since the last stored.",
+        ["result"],
+    )
+)
+STORED_BYTES_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_stored_bytes_total",
+        "BSON size of the RC readings written or skipped as unchanged.",
+        ["result"],
+    )
+)
+BROADCASTS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_broadcasts_total",
+        "Delegation custom_json broadcasts by result.",
+        ["result"],
+    )
+)
+NOOP_DELEGATIONS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_noop_delegations_skipped_total",
+        "Planned delegations dropped because they match the chain already.",
+    )
+)
+DELEGATION_DRIFT_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_delegation_cache_drift_total",
+        "Delegations found changed on chain when the cache was reconciled.",
+    )
+)
+DELEGATIONS_SUPPRESSED_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_delegations_suppressed_total",
+        "Delegation changes not broadcast by the hysteresis policy by reason.",
+        ["reason"],
+    )
+)
+ALARM_TO_INCLUSION_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "rc_bot_alarm_to_inclusion_seconds",
+        "From reading an account's RC below the alarm level to the delegation "
+        "for it being included in a block.",
+        buckets=(1, 2, 3, 5, 10, 15, 30, 60, 120, 300, 600),
+    )
+)
+BROADCAST_QUEUE_DEPTH: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_broadcast_queue_depth",
+        "Delegations waiting in the broadcast queue.",
+    )
+)
+BROADCAST_QUEUE_DROPPED_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_broadcast_queue_dropped_total",
+        "Queued delegations dropped as replaced by a newer decision or expired.",
+        ["reason"],
+    )
+)
+BROADCAST_QUEUE_LATE_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_broadcast_queue_late_total",
+        "Delegations broadcast after their target was projected to run out.",
+    )
+)
+ACCOUNTS_BY_STATUS: Gauge = REGISTRY.register(
+    Gauge(
+        "rc_bot_accounts",
+        "Tracked accounts in each RC status after the last cycle.",
+        ["status"],
+    )
+)
+
+
+class HealthState:
+    """
+    Liveness: the bot has finished a cycle recently (or is still inside its
+    first few periods after starting). Readiness: startup has completed and at
+    least one cycle has run.
+    """
+
+    def __init__(self, max_cycle_periods: float = 3) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.startup_complete = False
+        self.last_cycle: Optional[datetime] = None
+        self.max_cycle_periods = max_cycle_periods
+
+    def cycle_done(self):
+        if self.last_cycle is None:
+            TIME_TO_FIRST_CYCLE_SECONDS.set(
+                (datetime.now(timezone.utc) - self.started).total_seconds()
+            )
+        self.last_cycle = datetime.now(timezone.utc)
+        LAST_CYCLE_TIMESTAMP.set(self.last_cycle.timestamp())
+        CYCLES_TOTAL.inc()
+
+    @property
+    def max_age_seconds(self) -> float:
+        return self.max_cycle_periods * Config.UPDATE_FREQUENCY_SECS
+
+    @property
+    def alive(self) -> bool:
+        reference = self.last_cycle or self.started
+        age = (datetime.now(timezone.utc) - reference).total_seconds()
+        return age < self.max_age_seconds
+
+    @property
+    def ready(self) -> bool:
+        return self.startup_complete and self.last_cycle is not None
+
+
+HEALTH = HealthState()
+
+
+async def _handle_request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain the headers, nothing in them matters here
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (
+            b"\r\n",
+            b"\n",
+            b"",
+        ):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?")[0] if len(parts) > 1 else "/"
+        if path == "/metrics":
+            status, body, content_type = 200, REGISTRY.render(), CONTENT_TYPE
+        elif path in ("/healthz", "/livez"):
+            alive = HEALTH.alive
+            status, body = (200, "ok\n") if alive else (503, "stalled\n")
+            content_type = "text/plain"
+        elif path == "/readyz":
+            ready = HEALTH.ready
+            status, body = (200, "ready\n") if ready else (503, "not ready\n")
+            content_type = "text/plain"
+        else:
+            status, body, content_type = 404, "not found\n", "text/plain"
+        data = body.encode()
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as ex:
+        logging.debug(f"Metrics request dropped: {ex}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(
+    host: str = None, port: int = None
+) -> Optional[asyncio.AbstractServer]:
+    """
+    Serve /metrics, /healthz (liveness) and /readyz (readiness).
+    A port of 0 in the config turns the server off.
+    """
+    host = host or Config.METRICS_HOST
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_request, host, port)
+    logging.info(f"Metrics server listening on {host}:{port}")
+    return server
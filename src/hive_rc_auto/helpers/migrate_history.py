@@ -0,0 +1,115 @@
+"""
+Convert the legacy RC history collection to the compact schema (see
+rc_schema), streaming it in timestamp order in batches so it runs in
+constant memory however big the collection is. Run it again to pick up
+where it stopped: it starts after the newest compact reading.
+
+    python -m hive_rc_auto.helpers.migrate_history [--batch 5000]
+
+Set RC_HISTORY_SCHEMA=compact once it has finished.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from timeit import default_timer as timer
+from typing import List, Optional
+
+import bson
+from pydantic import BaseModel
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.db_indexes import setup_indexes
+from hive_rc_auto.helpers.rc_delegation import get_mongo_db, setup_mongo_db
+from hive_rc_auto.helpers.rc_schema import AccountDictionary, to_compact
+
+
+class MigrationReport(BaseModel):
+    documents: int = 0
+    legacy_bytes: int = 0
+    compact_bytes: int = 0
+    seconds: float = 0.0
+    last_timestamp: Optional[datetime] = None
+
+    def log_output(self, logger=logging.info):
+        saved = 1 - self.compact_bytes / self.legacy_bytes if self.legacy_bytes else 0
+        logger(
+            f"Migrated {self.documents:,} readings up to {self.last_timestamp} "
+            f"in {self.seconds:.1f}s | {self.legacy_bytes / 1e6:,.1f} MB -> "
+            f"{self.compact_bytes / 1e6:,.1f} MB ({saved:.0%} smaller)"
+        )
+
+
+async def migrate(
+    batch_size: int = 5000, start: datetime = None, end: datetime = None
+) -> MigrationReport:
+    """
+    Copy the legacy readings from `start` (default: after the newest compact
+    reading) to `end` into the compact collection.
+    """
+    report = MigrationReport()
+    began = timer()
+    legacy = get_mongo_db(Config.DB_NAME)
+    compact = get_mongo_db(Config.DB_NAME_COMPACT)
+    if start is None:
+        newest = await compact.find_one({}, sort=[("timestamp", -1)])
+        start = newest["timestamp"] if newest else None
+    time_range = {"$gt": start} if start else {"$exists": True}
+    if end:
+        time_range["$lt"] = end
+    dictionary = AccountDictionary()
+    await dictionary.load()
+    cursor = legacy.find(
+        {"real_mana": {"$ne": None}, "timestamp": time_range}, {"_id": 0}
+    ).sort("timestamp", 1)
+    batch: List[dict] = []
+
+    async def flush():
+        ids = await dictionary.ids_for(doc["account"] for doc in batch)
+        docs = [to_compact(doc, ids[doc["account"]]) for doc in batch]
+        await compact.insert_many(docs, ordered=False)
+        report.documents += len(docs)
+        report.legacy_bytes += sum(len(bson.encode(doc)) for doc in batch)
+        report.compact_bytes += sum(len(bson.encode(doc)) for doc in docs)
+        report.last_timestamp = batch[-1]["timestamp"]
+        logging.info(f"{report.documents:,} readings up to {report.last_timestamp}")
+        batch.clear()
+
+    async for doc in cursor.batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    report.seconds = timer() - began
+    return report
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Convert the RC history to the compact schema"
+    )
+    parser.add_argument("--batch", type=int, default=5000, help="Documents a batch")
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Start (ISO format, UTC), defaults to after the newest compact reading",
+    )
+    parser.add_argument(
+        "--end", type=datetime.fromisoformat, default=None, help="End (ISO, UTC)"
+    )
+    parsed = parser.parse_args(args)
+    setup_mongo_db()
+    setup_indexes()
+    report = asyncio.run(migrate(parsed.batch, parsed.start, parsed.end))
+    report.log_output(logging.info)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(module)-14s %(lineno) 5d : %(message)s",
+        datefmt="%m-%dT%H:%M:%S",
+    )
+    main()
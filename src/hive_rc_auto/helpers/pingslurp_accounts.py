@@ -1,154 +1,147 @@
 import os
+import re
 from datetime import datetime
+from typing import List
 
 import pandas as pd
 import streamlit as st
-from pymongo import MongoClient
-from pymongo.command_cursor import CommandCursor
+
+from hive_rc_auto.helpers.dashboard_cache import cached_aggregate
 
 DB_CONNECTION = os.getenv("PINGSLURP_DB_CONNECTION")
-CLIENT = MongoClient(DB_CONNECTION)
 TIME_FRAME = "hour"
+LIVETEST_FILTERS = {
+    "Exclude Live Tests": {"$match": {"metadata.id": re.compile(r"pp_.*")}},
+    "Include Live Tests": {"$match": {}},
+    "Only Live Tests": {"$match": {"metadata.id": re.compile(r"pplt_.*")}},
+}
+
+
+def since_match(since: datetime) -> dict:
+    return {"$match": {"timestamp": {"$gte": since}}}
+
+
+def transactions_pipeline(
+    time_range: dict, livetest_filter: dict, time_frame: str, by_account: bool
+) -> List[dict]:
+    """Podpings, IRIs and sizes per `time_frame` (and account), newest first"""
+    group_id = {
+        "timestamp": {
+            "$dateTrunc": {
+                "date": "$timestamp",
+                "unit": time_frame,
+                "timezone": "Asia/Jerusalem",
+            }
+        }
+    }
+    fields = {"timestamp": {"$first": "$timestamp"}}
+    if by_account:
+        group_id = {"account": "$metadata.posting_auth", **group_id}
+        fields["account"] = {"$first": "$metadata.posting_auth"}
+    return [
+        time_range,
+        livetest_filter,
+        {
+            "$group": {
+                "_id": group_id,
+                **fields,
+                "avg_size": {"$avg": "$json_size"},
+                "total_size": {"$sum": "$json_size"},
+                "total_podpings": {"$sum": 1},
+                "total_iris": {"$sum": "$num_iris"},
+            }
+        },
+        {"$sort": {"_id.timestamp": -1}},
+    ]
+
+
+def iris_per_hour_pipeline(
+    since: datetime, by_host: bool, time_frame: str = "minute", bin_size: int = 60
+) -> List[dict]:
+    """IRIs per `bin_size` `time_frame`s (and host) from `since`, oldest first"""
+    group_id = {
+        "timestamp": {
+            "$dateTrunc": {
+                "date": "$timestamp",
+                "unit": time_frame,
+                "timezone": "Asia/Jerusalem",
+                "binSize": bin_size,
+            }
+        }
+    }
+    fields = {"timestamp": {"$first": "$timestamp"}, "total_iris": {"$sum": 1}}
+    if by_host:
+        group_id["host"] = "$metadata.host"
+        fields["host"] = {"$first": "$metadata.host"}
+    return [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {"_id": group_id, **fields}},
+        {"$sort": {"_id.timestamp": 1}},
+    ]
 
 
 def all_trans_by_account(
     time_frame: str = TIME_FRAME, time_range: str = None, livetest_filter: str = None
-) -> CommandCursor:
+) -> List[dict]:
     if not time_range:
         time_range = st.session_state.time_range
     if not livetest_filter:
         livetest_filter = st.session_state.livetest_filter
 
-    result = CLIENT["pingslurp"]["meta_ts"].aggregate(
-        [
-            time_range,
-            livetest_filter,
-            {
-                "$group": {
-                    "_id": {
-                        "account": "$metadata.posting_auth",
-                        "timestamp": {
-                            "$dateTrunc": {
-                                "date": "$timestamp",
-                                "unit": time_frame,
-                                "timezone": "Asia/Jerusalem",
-                            }
-                        },
-                    },
-                    "timestamp": {"$first": "$timestamp"},
-                    "account": {"$first": "$metadata.posting_auth"},
-                    "avg_size": {"$avg": "$json_size"},
-                    "total_size": {"$sum": "$json_size"},
-                    "total_podpings": {"$sum": 1},
-                    "total_iris": {"$sum": "$num_iris"},
-                }
-            },
-            {"$sort": {"_id.timestamp": -1}},
-        ]
+    result = cached_aggregate(
+        DB_CONNECTION,
+        "pingslurp",
+        "meta_ts",
+        transactions_pipeline(time_range, livetest_filter, time_frame, by_account=True),
     )
     return result
 
 
 def all_trans_no_account(
     time_frame: str = TIME_FRAME, time_range: str = None, livetest_filter: str = None
-) -> CommandCursor:
+) -> List[dict]:
     if not time_range:
         time_range = st.session_state.time_range
     if not livetest_filter:
         livetest_filter = st.session_state.livetest_filter
 
-    result_no_account = CLIENT["pingslurp"]["meta_ts"].aggregate(
-        [
-            time_range,
-            livetest_filter,
-            {
-                "$group": {
-                    "_id": {
-                        "timestamp": {
-                            "$dateTrunc": {
-                                "date": "$timestamp",
-                                "unit": time_frame,
-                                "timezone": "Asia/Jerusalem",
-                            }
-                        }
-                    },
-                    "timestamp": {"$first": "$timestamp"},
-                    "avg_size": {"$avg": "$json_size"},
-                    "total_size": {"$sum": "$json_size"},
-                    "total_podpings": {"$sum": 1},
-                    "total_iris": {"$sum": "$num_iris"},
-                }
-            },
-            {"$sort": {"_id.timestamp": -1}},
-        ]
+    result_no_account = cached_aggregate(
+        DB_CONNECTION,
+        "pingslurp",
+        "meta_ts",
+        transactions_pipeline(
+            time_range, livetest_filter, time_frame, by_account=False
+        ),
     )
     return result_no_account
 
 
-def hour_trans_by_account(time_limit: datetime, time_frame: str) -> CommandCursor:
-    result = CLIENT["pingslurp"]["meta_ts"].aggregate(
-        [
-            {
-                "$match": {
-                    "timestamp": {"$gt": time_limit},
-                }
-            },
+def hour_trans_by_account(time_limit: datetime, time_frame: str) -> List[dict]:
+    result = cached_aggregate(
+        DB_CONNECTION,
+        "pingslurp",
+        "meta_ts",
+        transactions_pipeline(
+            {"$match": {"timestamp": {"$gt": time_limit}}},
             st.session_state.livetest_filter,
-            {
-                "$group": {
-                    "_id": {
-                        "account": "$metadata.posting_auth",
-                        "timestamp": {
-                            "$dateTrunc": {
-                                "date": "$timestamp",
-                                "unit": time_frame,
-                                "timezone": "Asia/Jerusalem",
-                            }
-                        },
-                    },
-                    "timestamp": {"$first": "$timestamp"},
-                    "account": {"$first": "$metadata.posting_auth"},
-                    "avg_size": {"$avg": "$json_size"},
-                    "total_size": {"$sum": "$json_size"},
-                    "total_podpings": {"$sum": 1},
-                    "total_iris": {"$sum": "$num_iris"},
-                }
-            },
-            {"$sort": {"_id.timestamp": -1}},
-        ]
+            time_frame,
+            by_account=True,
+        ),
     )
     return result
 
 
-def hour_trans_no_account(time_limit: datetime, time_frame: str) -> CommandCursor:
-    result = CLIENT["pingslurp"]["meta_ts"].aggregate(
-        [
-            {
-                "$match": {
-                    "timestamp": {"$gt": time_limit},
-                }
-            },
+def hour_trans_no_account(time_limit: datetime, time_frame: str) -> List[dict]:
+    result = cached_aggregate(
+        DB_CONNECTION,
+        "pingslurp",
+        "meta_ts",
+        transactions_pipeline(
+            {"$match": {"timestamp": {"$gt": time_limit}}},
             st.session_state.livetest_filter,
-            {
-                "$group": {
-                    "_id": {
-                        "timestamp": {
-                            "$dateTrunc": {
-                                "date": "$timestamp",
-                                "unit": time_frame,
-                                "timezone": "Asia/Jerusalem",
-                            }
-                        }
-                    },
-                    "timestamp": {"$first": "$timestamp"},
-                    "avg_size": {"$avg": "$json_size"},
-                    "total_size": {"$sum": "$json_size"},
-                    "total_podpings": {"$sum": 1},
-                    "total_iris": {"$sum": "$num_iris"},
-                }
-            },
-            {"$sort": {"_id.timestamp": -1}},
-        ]
+            time_frame,
+            by_account=False,
+        ),
     )
     return result
 
@@ -0,0 +1,189 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from timeit import default_timer as timer
+from typing import Optional, Tuple
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import REGISTRY, Counter
+
+EVENT_LOOP_BLOCKED_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "rc_bot_event_loop_blocked_total",
+        "Times the event loop was blocked for longer than the slow threshold.",
+    )
+)
+
+
+def report_timestamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+class CycleProfiler:
+    """
+    Profile whole update cycles with cProfile. Either every Nth cycle
+    (`every_n`) or the next N cycles, which can be armed at start up
+    (`next_n`) or at any time by sending the process SIGUSR1.
+
+    Each profiled cycle writes a raw `.prof` (for snakeviz or pstats) and a
+    text summary sorted by cumulative time into `report_dir`. The profiler
+    sees everything the thread runs while the cycle is in progress, including
+    other tasks on the loop, which is what's wanted to find blocking calls.
+    """
+
+    def __init__(
+        self,
+        every_n: int = None,
+        next_n: int = None,
+        report_dir: str = None,
+        top: int = 60,
+    ) -> None:
+        self.every_n = Config.PROFILE_EVERY_N if every_n is None else every_n
+        self.armed = Config.PROFILE_NEXT_N if next_n is None else next_n
+        self.report_dir = report_dir or Config.PROFILE_DIR
+        self.top = top
+        # Cycle number, profile and start time of the cycle being profiled
+        self.running: Optional[Tuple[int, cProfile.Profile, float]] = None
+
+    def arm(self, cycles: int = None):
+        cycles = cycles or Config.PROFILE_NEXT_N or 1
+        self.armed += cycles
+        logging.info(f"Profiling the next {self.armed} cycles")
+
+    def should_profile(self, cycle_number: int) -> bool:
+        if self.armed > 0:
+            return True
+        return bool(self.every_n) and cycle_number % self.every_n == 0
+
+    def install_signal_handler(self, sig: int = signal.SIGUSR1):
+        """kill -USR1 <pid> profiles the next cycles"""
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, self.arm)
+        except (NotImplementedError, RuntimeError, AttributeError) as ex:
+            logging.warning(f"Profiling signal handler not installed: {ex}")
+
+    def start(self, cycle_number: int) -> Optional[cProfile.Profile]:
+        """
+        Start profiling `cycle_number` if it's one to profile, until `stop`.
+        One cycle at a time: cProfile can't run two profiles at once, and
+        the one running sees any overlapping cycle's stages anyway.
+        """
+        if self.running or not self.should_profile(cycle_number):
+            return None
+        if self.armed > 0:
+            self.armed -= 1
+        profile = cProfile.Profile()
+        self.running = (cycle_number, profile, timer())
+        profile.enable()
+        return profile
+
+    def stop(self, cycle_number: int) -> Optional[str]:
+        """Stop profiling `cycle_number` and write its report"""
+        if not self.running or self.running[0] != cycle_number:
+            return None
+        _, profile, start = self.running
+        self.running = None
+        profile.disable()
+        return self.write_report(profile, cycle_number, timer() - start)
+
+    @contextmanager
+    def cycle(self, cycle_number: int):
+        profile = self.start(cycle_number)
+        try:
+            yield profile
+        finally:
+            if profile:
+                self.stop(cycle_number)
+
+    def write_report(
+        self, profile: cProfile.Profile, cycle_number: int, elapsed: float
+    ) -> str:
+        os.makedirs(self.report_dir, exist_ok=True)
+        base = os.path.join(
+            self.report_dir, f"cycle_{report_timestamp()}_{cycle_number:06d}"
+        )
+        profile.dump_stats(f"{base}.prof")
+        out = io.StringIO()
+        out.write(f"Cycle {cycle_number} took {elapsed:.3f}s\n\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        with open(f"{base}.txt", "w") as f:
+            f.write(out.getvalue())
+        logging.info(f"Profile of cycle {cycle_number} ({elapsed:.2f}s): {base}.txt")
+        return base
+
+
+class LoopBlockMonitor:
+    """
+    Watch for the event loop being blocked. A task on the loop updates a
+    heartbeat, a thread checks it and when the loop has been stuck for more
+    than `threshold` seconds it captures the loop thread's stack, which points
+    straight at the synchronous call doing the blocking.
+    """
+
+    def __init__(
+        self,
+        threshold: float = None,
+        report_dir: str = None,
+        interval: float = None,
+    ) -> None:
+        self.threshold = Config.SLOW_CALLBACK_SECS if threshold is None else threshold
+        self.report_dir = report_dir or Config.PROFILE_DIR
+        self.interval = interval or max(self.threshold / 4, 0.01)
+        self.heartbeat = timer()
+        self.loop_thread_id: Optional[int] = None
+        self.blocked_reported = False
+        self.blocks = 0
+        self._stop = threading.Event()
+
+    async def _beat(self):
+        while not self._stop.is_set():
+            self.heartbeat = timer()
+            self.blocked_reported = False
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            blocked_for = timer() - self.heartbeat
+            if blocked_for > self.threshold and not self.blocked_reported:
+                self.blocked_reported = True
+                self.report(blocked_for)
+
+    def report(self, blocked_for: float):
+        self.blocks += 1
+        EVENT_LOOP_BLOCKED_TOTAL.inc()
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "(no stack)\n"
+        message = (
+            f"Event loop blocked for more than {blocked_for:.2f}s "
+            f"(threshold {self.threshold}s) at:\n{stack}"
+        )
+        logging.warning(message)
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(os.path.join(self.report_dir, "slow_callbacks.log"), "a") as f:
+                f.write(f"{report_timestamp()} {message}\n")
+        except OSError as ex:
+            logging.error(f"Could not write slow callback report: {ex}")
+
+    def start(self) -> Optional[asyncio.Task]:
+        """Call from inside the running loop, a threshold of 0 turns this off"""
+        if not self.threshold:
+            return None
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = timer()
+        threading.Thread(target=self._watch, daemon=True).start()
+        logging.info(f"Watching for event loop blocks over {self.threshold}s")
+        return asyncio.create_task(self._beat())
+
+    def stop(self):
+        self._stop.set()
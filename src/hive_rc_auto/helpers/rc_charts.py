@@ -0,0 +1,257 @@
+"""
+Traces and figures for the RC overview charts built from whole columns at
+once, from the data split up by account once per page load.
+"""
+import logging
+from datetime import datetime
+from timeit import default_timer as timer
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from hive_rc_auto.helpers.downsample import capped
+
+CUT_COLOUR = "red"
+INCREASE_COLOUR = "green"
+STATUSES = pd.CategoricalDtype(["target", "delegating"])
+SIZE_WINDOW = "4h"
+
+
+def typed(df: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """
+    A copy of `df` (indexed by timestamp) with categorical `account` and
+    `delegating` columns and `age_hours` filled in where missing.
+    """
+    columns = {"account": df["account"].astype("category")}
+    if "delegating" in df:
+        columns["delegating"] = df["delegating"].astype(STATUSES)
+    if "age_hours" not in df:
+        columns["age_hours"] = (now - df.index).total_seconds() / 3600
+    return df.assign(**columns)
+
+
+def split_accounts(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Each account's rows in one pass, in order of first appearance"""
+    if df is None or df.empty:
+        return {}
+    return {
+        account: part
+        for account, part in df.groupby("account", observed=True, sort=False)
+    }
+
+
+class AccountFrames:
+    """
+    The overview's readings, bytes a minute and delegation changes split by
+    account once. Each chart then looks its rows up instead of scanning
+    every account's rows again.
+    """
+
+    def __init__(
+        self,
+        readings: pd.DataFrame,
+        changes: pd.DataFrame = None,
+        size: pd.DataFrame = None,
+        now: datetime = None,
+    ) -> None:
+        now = now or datetime.utcnow()
+        start = timer()
+        self.readings = split_accounts(typed(readings, now))
+        self.changes = {}
+        if changes is not None and not changes.empty:
+            self.changes = split_accounts(typed(changes, now))
+        self.size = {}
+        if size is not None and not size.empty:
+            # Oldest first within each account, so one rolling pass covers all
+            size = typed(size, now).rename_axis("timestamp")
+            size = size.sort_values(["account", "timestamp"], kind="stable")
+            rolled = size.groupby("account", observed=True, sort=False)[
+                "total_size"
+            ].rolling(SIZE_WINDOW, closed="neither")
+            size["size_avg"] = rolled.mean().to_numpy()
+            self.size = split_accounts(size)
+        logging.info(
+            f"Split {len(readings):,} readings for {len(self.readings)} accounts "
+            f"- {timer() - start:.4f}s"
+        )
+
+    def with_status(self, status: str) -> List[str]:
+        """Accounts with any reading as `status`, in order of first appearance"""
+        return [
+            account
+            for account, dfa in self.readings.items()
+            if (dfa["delegating"] == status).any()
+        ]
+
+    @property
+    def delegating(self) -> List[str]:
+        return self.with_status("delegating")
+
+    def receiving(self, below: float = 95) -> List[str]:
+        """Targets, alphabetically, whose last reading is under `below` %"""
+        return [
+            account
+            for account in sorted(self.with_status("target"))
+            if self.readings[account]["real_mana_percent"].iloc[-1] < below
+            and self.readings[account]["delegating"].iloc[-1] != "delegating"
+        ]
+
+
+def delegation_trace(changes: pd.DataFrame, y_top: float) -> go.Scatter:
+    """
+    Every delegation change in `changes` (rows from the delegations
+    collection with `age_hours`) as one trace of dashed vertical segments
+    from 0 to `y_top`, marked at the top red for a cut and green for an
+    increase. Hovering gives the amount, direction and transaction.
+    One trace instead of a layout shape per change, which plotly lays out
+    and draws one by one.
+    """
+    n = len(changes)
+    age_hours = changes["age_hours"].to_numpy(dtype=float)
+    cut = changes["cut"].fillna(False).to_numpy(dtype=bool)
+    direction = np.where(cut, "Cut", "Increase")
+    amount = changes["delegated_rc"].fillna(0).to_numpy(dtype=float) / 1e6
+    trx_id = changes["trx_id"].fillna("").astype(str).str[:10]
+    hover = (
+        changes["acc_from"].fillna("").astype(str)
+        + " → "
+        + changes["acc_to"].fillna("").astype(str)
+        + "<br>"
+        + pd.Series(amount, index=changes.index).map("{:,.0f} M".format)
+        + " | "
+        + direction
+        + "<br>trx "
+        + trx_id
+    ).to_numpy()
+    # Each change is three points: bottom, top and a gap before the next
+    x = np.full(3 * n, np.nan)
+    x[0::3] = age_hours
+    x[1::3] = age_hours
+    y = np.tile([0.0, y_top, np.nan], n)
+    # Numbers and customdata, plotly checks string arrays element by element
+    colours = np.repeat(cut.astype(float), 3)
+    sizes = np.tile([0, 8, 0], n)
+    return go.Scatter(
+        x=x,
+        y=y,
+        mode="lines+markers",
+        name="Delegations",
+        line=dict(color=INCREASE_COLOUR, width=0.6, dash="dash"),
+        marker=dict(
+            color=colours,
+            colorscale=[[0, INCREASE_COLOUR], [1, CUT_COLOUR]],
+            cmin=0,
+            cmax=1,
+            size=sizes,
+            symbol="triangle-down",
+        ),
+        customdata=np.repeat(hover, 3),
+        hovertemplate="-%{x:.1f} hours<br>%{customdata}<extra></extra>",
+        connectgaps=False,
+    )
+
+
+def hover_times(times: pd.DatetimeIndex) -> np.ndarray:
+    return pd.DatetimeIndex(times).strftime("%d %H:%M").to_numpy()
+
+
+def build_rc_graph(
+    frames: AccountFrames, hive_acc: str, show_size: bool = False
+) -> go.Figure:
+    """
+    RC % of `hive_acc` with either its bytes a minute (`show_size`) or its
+    RC, and its delegation changes.
+    """
+    start = timer()
+    dfa = frames.readings[hive_acc]
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    x, y, times = capped(dfa.age_hours, dfa["real_mana_percent"], dfa.index)
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=y,
+            name="RC %",
+            text=hover_times(times),
+            hovertemplate="-%{x:.1f} hours<br>%{text}" + "<br>%{y:,.1f}%",
+            line=dict(color="blue"),
+        ),
+        secondary_y=True,
+    )
+    show_size = show_size and bool(frames.size)
+    if show_size:
+        df_size_a = frames.size.get(hive_acc)
+        if df_size_a is not None:
+            fig.update_yaxes(title_text="<b>Bytes/min</b>", secondary_y=False)
+            x, y, times = capped(
+                df_size_a.age_hours, df_size_a["size_avg"], df_size_a.index
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=x,
+                    y=y,
+                    name="Bytes/min",
+                    text=hover_times(times),
+                    hovertemplate="-%{x:.1f} hours<br>%{text}" + "<br>%{y:,.0f} bytes",
+                    line=dict(color="lightgreen"),
+                ),
+                secondary_y=False,
+            )
+    else:
+        fig.update_yaxes(title_text="<b>RC</b>", secondary_y=False)
+        x, y, times = capped(dfa.age_hours, dfa["real_mana"], dfa.index)
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=y,
+                name="RC",
+                text=hover_times(times),
+                hovertemplate="-%{x:.1f} hours<br>%{text}" + "<br>%{y:,.3s}",
+                line=dict(color="red"),
+            ),
+            secondary_y=False,
+        )
+
+    # Each change as one segment trace on the RC % axis
+    yaxes_range_max = dfa["real_mana_percent"].max() + 5
+    df_rc_change = frames.changes.get(hive_acc)
+    if df_rc_change is not None:
+        marker_start = timer()
+        fig.add_trace(
+            delegation_trace(df_rc_change, y_top=yaxes_range_max),
+            secondary_y=True,
+        )
+        logging.info(
+            f"Delegation markers {hive_acc}: {len(df_rc_change)} "
+            f"- {timer() - marker_start:.4f}s"
+        )
+
+    # Set x-axis title
+    fig.update_xaxes(title_text=f"Age (hours) - {hive_acc}")
+
+    last_reading = dfa.real_mana_percent.iloc[-1]
+    fig.update_layout(
+        title_text=(
+            f"<b>{hive_acc}</b> RC's<br>"
+            f"Last reading: <b>{last_reading:.1f}%</b><br>"
+            f"Time: {dfa.last_valid_index():%H:%M:%S}"
+        )
+    )
+    # Set y-axes titles
+    fig.update_yaxes(title_text="<b>RC %</b>", secondary_y=True)
+
+    fig.update_yaxes(range=[0, yaxes_range_max], secondary_y=True)
+
+    fig.update_layout(
+        showlegend=True,
+    )
+    # Position Text
+    fig.update_layout(legend_x=0.2, legend_y=0.85)
+    fig.update_layout(title_x=0.2, title_y=0.2)
+
+    fig.update_layout(margin={"autoexpand": True, "b": 0, "t": 0, "l": 0, "r": 0})
+    fig.update_xaxes(autorange="reversed")
+    logging.info(f"Time to build graph {hive_acc} - {timer()-start:.4f}s")
+    return fig
@@ -0,0 +1,499 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from hive_rc_auto.helpers.broadcast_queue import BroadcastQueue
+from hive_rc_auto.helpers.checkpoint import Checkpoint, RCReading
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.delegation_state import DelegationState
+from hive_rc_auto.helpers.hive_calls import get_rcs, send_custom_json
+from hive_rc_auto.helpers.hysteresis import DelegationGovernor
+from hive_rc_auto.helpers.metrics import (
+    ACCOUNTS_BY_STATUS,
+    ALARM_TO_INCLUSION_SECONDS,
+    CYCLE_STAGE_SECONDS,
+    MONGO_QUEUE_DEPTH,
+)
+from hive_rc_auto.helpers.profiling import CycleProfiler
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCAllData,
+    RCDirectDelegation,
+    RCListOfAccounts,
+    RCPolicy,
+    RCStatus,
+    get_utc_now_timestamp,
+    store_readings,
+)
+from hive_rc_auto.helpers.rc_schema import store_compact
+from hive_rc_auto.helpers.scheduler import (
+    FixedRateScheduler,
+    StageDeadlineExceeded,
+    with_deadline,
+)
+from hive_rc_auto.helpers.sharding import ShardLeases
+from hive_rc_auto.helpers.store_filter import ReadingFilter
+from hive_rc_auto.helpers.tracing import Span, attach, end_span, span, start_span
+from hive_rc_auto.helpers.trend import RCTrend
+
+
+async def store_in_background(rcs: List[RCAccount]):
+    """Store the readings, tracking how many writes are waiting"""
+    MONGO_QUEUE_DEPTH.inc()
+    try:
+        with span("store_all_data"), CYCLE_STAGE_SECONDS.time(stage="store_all_data"):
+            if Config.RC_HISTORY_SCHEMA == "compact":
+                await store_compact(rcs)
+            else:
+                await store_readings(rcs)
+    finally:
+        MONGO_QUEUE_DEPTH.dec()
+
+
+def unique_rcs(all_datas: List[RCAllData]) -> List[RCAccount]:
+    """One reading per account even when several primaries track it"""
+    return list({rc.account: rc for d in all_datas for rc in d.rcs}.values())
+
+
+def build_apps(policies: List[RCPolicy]) -> List[Tuple[RCListOfAccounts, RCPolicy]]:
+    """Find the delegating and receiving accounts of each primary account"""
+    return [
+        (
+            RCListOfAccounts(
+                policy.primary_account, fallback_delegating=policy.delegating_accounts
+            ),
+            policy,
+        )
+        for policy in policies
+    ]
+
+
+async def broadcast_alarms(
+    all_datas: List[RCAllData],
+    send_json: bool = True,
+    delegator_lock: Callable = None,
+    deleg_state: DelegationState = None,
+    broadcaster: Callable = send_custom_json,
+    store_delegations: bool = True,
+):
+    """
+    The alarm fast path: delegate to alarmed accounts and broadcast at once,
+    recording how long from the alarmed reading until the delegation is in a
+    block (broadcast_sync returns once it's included).
+    """
+    for all_data in all_datas:
+        with span("alarm_fast_path") as alarm_span:
+            alarmed = await all_data.update_alarm_delegations()
+            if deleg_state:
+                alarmed = deleg_state.drop_no_ops(alarmed)
+                all_data.alarm_delegations = alarmed
+            if not alarmed:
+                continue
+            if alarm_span:
+                alarm_span.set_attribute("accounts", [dd.acc_to for dd in alarmed])
+            read_at = {rc.account: rc.timestamp for rc in all_data.rcs}
+            sent_by = set()
+
+            def included(delegator: str, trx):
+                sent_by.add(delegator)
+                if deleg_state:
+                    deleg_state.record_sent(delegator, alarmed)
+                now = get_utc_now_timestamp()
+                for dd in alarmed:
+                    if dd.acc_from == delegator:
+                        ALARM_TO_INCLUSION_SECONDS.observe(
+                            (now - read_at[dd.acc_to]).total_seconds()
+                        )
+
+            await all_data.get_payload_for_pending_delegations(
+                send_json=send_json,
+                delegator_lock=delegator_lock,
+                delegations=alarmed,
+                on_sent=included,
+                broadcaster=broadcaster,
+                store_delegations=store_delegations,
+            )
+            # Any which weren't included are left to the rest of the cycle
+            all_data.alarm_delegations = [
+                dd for dd in alarmed if dd.acc_from in sent_by
+            ]
+
+
+async def fetch_and_decide(
+    apps: List[Tuple[RCListOfAccounts, RCPolicy]],
+    old_all_rcs: List[RCAccount] = None,
+    send_json: bool = True,
+    delegator_lock: Callable = None,
+    governor: DelegationGovernor = None,
+    deleg_state: DelegationState = None,
+    trend: RCTrend = None,
+    broadcaster: Callable = send_custom_json,
+    store_delegations: bool = True,
+) -> List[RCAllData]:
+    """
+    Fetch the RCs of every tracked account and work out the delegations.
+    All the primaries share one `find_rc_accounts` call over the union of
+    their accounts and each delegator's delegation lookup. Alarmed accounts
+    are delegated to and broadcast for before anything else is decided.
+    `governor` holds back changes which would churn, `deleg_state` supplies
+    the delegations so they aren't read from the chain every cycle and
+    `trend` replaces the two point deltas with a fitted trend. `broadcaster`
+    and `store_delegations` are passed on to the alarm broadcasts.
+    """
+    union = sorted(set().union(*(accounts.all for accounts, _ in apps)))
+    all_datas = [
+        RCAllData(accounts=accounts, policy=policy) for accounts, policy in apps
+    ]
+    with span("fill_data", accounts=len(union)), CYCLE_STAGE_SECONDS.time(
+        stage="fill_data"
+    ):
+        # In a thread so earlier cycles can broadcast and store meanwhile
+        response = await asyncio.to_thread(get_rcs, union)
+        rc_accounts = response.get("rc_accounts") or []
+        deleg_cache: Dict[str, List[RCDirectDelegation]] = {}
+        if deleg_state:
+            for accounts, _ in apps:
+                for delegator in accounts.delegating:
+                    if delegator not in deleg_cache:
+                        deleg_cache[delegator] = await deleg_state.delegations_of(
+                            delegator
+                        )
+        for all_data in all_datas:
+            await all_data.fill_data(
+                old_all_rcs=old_all_rcs,
+                rc_accounts=rc_accounts,
+                deleg_cache=deleg_cache,
+            )
+    if trend:
+        trend.retain(union)
+        trend.update(unique_rcs(all_datas))
+        for all_data in all_datas:
+            trend.apply(all_data.rcs)
+    if Config.ALARM_FAST_PATH:
+        await broadcast_alarms(
+            all_datas,
+            send_json=send_json,
+            delegator_lock=delegator_lock,
+            deleg_state=deleg_state,
+            broadcaster=broadcaster,
+            store_delegations=store_delegations,
+        )
+    rcs = unique_rcs(all_datas)
+    for status in RCStatus:
+        ACCOUNTS_BY_STATUS.set(
+            len([rc for rc in rcs if rc.status == status]), status=status.value
+        )
+    with span("update_delegations"), CYCLE_STAGE_SECONDS.time(
+        stage="update_delegations"
+    ):
+        for all_data in all_datas:
+            await all_data.update_delegations()
+            if governor:
+                governor.apply(all_data)
+    for all_data in all_datas:
+        if len(all_datas) > 1:
+            logging.info(f"-------- {all_data.policy.primary_account} --------")
+        all_data.log_output(logger=logging.info)
+    return all_datas
+
+
+async def broadcast_delegations(
+    all_datas: List[RCAllData],
+    send_json: bool = True,
+    delegator_lock: Callable = None,
+    deleg_state: DelegationState = None,
+    queue: BroadcastQueue = None,
+    broadcaster: Callable = send_custom_json,
+    store_delegations: bool = True,
+):
+    """
+    Send the pending delegations, one custom_json per delegator, through
+    `queue` so the accounts closest to running out go first. With
+    `deleg_state` the ones which wouldn't change anything are dropped first.
+    """
+    queue = BroadcastQueue() if queue is None else queue
+    with span("broadcast"), CYCLE_STAGE_SECONDS.time(stage="broadcast"):
+        for all_data in all_datas:
+            if deleg_state:
+                all_data.pending_delegations = deleg_state.drop_no_ops(
+                    all_data.pending_delegations
+                )
+            queue.push_all(all_data)
+        await queue.dispatch(
+            send_json=send_json,
+            delegator_lock=delegator_lock,
+            on_sent=deleg_state.record_sent if deleg_state else None,
+            broadcaster=broadcaster,
+            store_delegations=store_delegations,
+        )
+
+
+async def run_multi_update_cycle(
+    apps: List[Tuple[RCListOfAccounts, RCPolicy]],
+    old_all_rcs: List[RCAccount] = None,
+    send_json: bool = True,
+    store: bool = True,
+    delegator_lock: Callable = None,
+    governor: DelegationGovernor = None,
+    deleg_state: DelegationState = None,
+    trend: RCTrend = None,
+    broadcaster: Callable = send_custom_json,
+    store_delegations: bool = True,
+) -> List[RCAllData]:
+    """
+    One pass of the bot for one or more primary accounts: fetch RCs, work out
+    delegations, broadcast them and hand the readings off to be stored in the
+    background. `delegator_lock` is held around each delegator's broadcast
+    (see sharding), `governor`, `deleg_state` and `trend` keep their state
+    between calls. Broadcasts go through `broadcaster` and are recorded in
+    the delegation history if `store_delegations`.
+    """
+    union = set().union(*(accounts.all for accounts, _ in apps))
+    with span("update_cycle", accounts=len(union), apps=len(apps)) as cycle_span:
+        all_datas = await fetch_and_decide(
+            apps,
+            old_all_rcs=old_all_rcs,
+            send_json=send_json,
+            delegator_lock=delegator_lock,
+            governor=governor,
+            deleg_state=deleg_state,
+            trend=trend,
+            broadcaster=broadcaster,
+            store_delegations=store_delegations,
+        )
+        await broadcast_delegations(
+            all_datas,
+            send_json=send_json,
+            delegator_lock=delegator_lock,
+            deleg_state=deleg_state,
+            broadcaster=broadcaster,
+            store_delegations=store_delegations,
+        )
+        if cycle_span:
+            cycle_span.set_attribute(
+                "delegations", sum(len(d.pending_delegations) for d in all_datas)
+            )
+        if store:
+            # The task copies the context so its spans join this cycle's trace
+            asyncio.create_task(store_in_background(unique_rcs(all_datas)))
+    return all_datas
+
+
+async def run_update_cycle(
+    all_accounts: RCListOfAccounts,
+    old_all_rcs: List[RCAccount] = None,
+    send_json: bool = True,
+    store: bool = True,
+    policy: RCPolicy = None,
+    broadcaster: Callable = send_custom_json,
+    store_delegations: bool = True,
+) -> RCAllData:
+    """One pass of the bot for a single primary account"""
+    all_datas = await run_multi_update_cycle(
+        [(all_accounts, policy or RCPolicy())],
+        old_all_rcs=old_all_rcs,
+        send_json=send_json,
+        store=store,
+        broadcaster=broadcaster,
+        store_delegations=store_delegations,
+    )
+    return all_datas[0]
+
+
+# Tick number, the cycle's root span and its data, passed between stages
+CycleItem = Tuple[int, Optional[Span], List[RCAllData]]
+
+
+class CyclePipeline:
+    """
+    Run cycles at a fixed rate as three stages joined by bounded queues:
+    fetch and decide, broadcast, store. The next cycle's fetch starts on
+    schedule while the previous one is still broadcasting or storing; when a
+    later stage falls `queue_size` cycles behind, fetching waits for it.
+    Broadcasts keep cycle order and set absolute amounts, so a cycle decided
+    before the previous one's broadcast landed at worst repeats it.
+
+    A cycle whose stage runs past that stage's deadline is dropped from that
+    point on. With `leases` this is a sharded worker (see sharding). With
+    `checkpoint` each stored cycle is saved for a warm restart, pass the
+    restored readings in as `old_all_rcs`. Only readings which changed are
+    stored, see `store_filter`.
+    """
+
+    def __init__(
+        self,
+        apps: List[Tuple[RCListOfAccounts, RCPolicy]],
+        scheduler: FixedRateScheduler = None,
+        leases: ShardLeases = None,
+        send_json: bool = True,
+        store: bool = True,
+        queue_size: int = None,
+        deadlines: Dict[str, float] = None,
+        profiler: CycleProfiler = None,
+        governor: DelegationGovernor = None,
+        deleg_state: DelegationState = None,
+        trend: RCTrend = None,
+        store_filter: ReadingFilter = None,
+        queue: BroadcastQueue = None,
+        on_cycle: Callable[[List[RCAllData]], None] = None,
+        checkpoint: Checkpoint = None,
+        old_all_rcs: List[RCReading] = None,
+    ) -> None:
+        self.apps = apps
+        self.scheduler = scheduler
+        self.leases = leases
+        self.send_json = send_json
+        self.store = store
+        self.queue_size = queue_size or Config.PIPELINE_QUEUE_SIZE
+        self.deadlines = {
+            "fetch": Config.FETCH_DEADLINE_SECS,
+            "broadcast": Config.BROADCAST_DEADLINE_SECS,
+            "store": Config.STORE_DEADLINE_SECS,
+        } | (deadlines or {})
+        self.profiler = profiler
+        self.governor = governor or DelegationGovernor()
+        self.deleg_state = deleg_state or DelegationState()
+        self.trend = trend or RCTrend()
+        self.store_filter = store_filter or ReadingFilter()
+        # Kept between cycles so a broadcast abandoned at its deadline
+        # leaves the rest queued for the next cycle to replace or send
+        self.queue = BroadcastQueue() if queue is None else queue
+        self.on_cycle = on_cycle
+        self.checkpoint = checkpoint
+        self.old_all_rcs: List[Union[RCAccount, RCReading]] = old_all_rcs
+        if old_all_rcs:
+            self.trend.update(old_all_rcs)
+
+    async def run(self, cycles: int = None):
+        """Run `cycles` cycles, for ever if None"""
+        self.scheduler = self.scheduler or FixedRateScheduler()
+        to_broadcast: asyncio.Queue = asyncio.Queue(self.queue_size)
+        to_store: asyncio.Queue = asyncio.Queue(self.queue_size)
+        await asyncio.gather(
+            self._fetch_stage(to_broadcast, cycles),
+            self._broadcast_stage(to_broadcast, to_store),
+            self._store_stage(to_store),
+        )
+
+    async def refresh_apps(
+        self, lookup: Awaitable[List[Tuple[RCListOfAccounts, RCPolicy]]]
+    ):
+        """
+        Switch to the accounts from `lookup` when it finishes, after starting
+        with a checkpoint's or the fallback accounts.
+        """
+        try:
+            self.apps = await lookup
+        except Exception as ex:
+            logging.error(f"Account lookup failed, keeping the accounts: {ex}")
+
+    async def _fetch(self) -> List[RCAllData]:
+        apps = self.apps
+        if self.leases:
+            await self.leases.rebalance()
+            apps = [(self.leases.filter_accounts(a), p) for a, p in apps]
+        return await fetch_and_decide(
+            apps,
+            old_all_rcs=self.old_all_rcs,
+            send_json=self.send_json,
+            delegator_lock=self.leases.delegator_lock if self.leases else None,
+            governor=self.governor,
+            deleg_state=self.deleg_state,
+            trend=self.trend,
+        )
+
+    async def _fetch_stage(self, out: asyncio.Queue, cycles: Optional[int]):
+        count = 0
+        try:
+            while cycles is None or count < cycles:
+                tick = await self.scheduler.wait_next()
+                count += 1
+                # The cycle's root span, ended by the store stage after the
+                # broadcast and store have added their spans to it
+                cycle_span = start_span("update_cycle", tick=tick)
+                # Likewise profiled from here until it's stored
+                if self.profiler:
+                    self.profiler.start(tick + 1)
+                with attach(cycle_span):
+                    try:
+                        all_datas = await with_deadline(
+                            "fetch", self._fetch(), self.deadlines["fetch"]
+                        )
+                    except StageDeadlineExceeded as ex:
+                        self._end_cycle(tick, cycle_span, ex)
+                        continue
+                    except Exception as ex:
+                        logging.exception(f"Cycle {tick} fetch failed: {ex}")
+                        self._end_cycle(tick, cycle_span, ex)
+                        continue
+                if cycle_span:
+                    cycle_span.set_attribute(
+                        "delegations",
+                        sum(len(d.pending_delegations) for d in all_datas),
+                    )
+                self.old_all_rcs = unique_rcs(all_datas)
+                await out.put((tick, cycle_span, all_datas))
+        finally:
+            await out.put(None)
+
+    def _end_cycle(
+        self, tick: int, cycle_span: Optional[Span], ex: BaseException = None
+    ):
+        """The cycle's done, end its trace and profile"""
+        end_span(cycle_span, ex)
+        if self.profiler:
+            self.profiler.stop(tick + 1)
+
+    async def _broadcast_stage(self, inbox: asyncio.Queue, out: asyncio.Queue):
+        delegator_lock = self.leases.delegator_lock if self.leases else None
+        try:
+            while (item := await inbox.get()) is not None:
+                tick, cycle_span, all_datas = item
+                with attach(cycle_span):
+                    try:
+                        await with_deadline(
+                            "broadcast",
+                            broadcast_delegations(
+                                all_datas,
+                                send_json=self.send_json,
+                                delegator_lock=delegator_lock,
+                                deleg_state=self.deleg_state,
+                                queue=self.queue,
+                            ),
+                            self.deadlines["broadcast"],
+                        )
+                    except StageDeadlineExceeded:
+                        pass
+                    except Exception as ex:
+                        logging.exception(f"Cycle {tick} broadcast failed: {ex}")
+                if self.on_cycle:
+                    self.on_cycle(all_datas)
+                await out.put(item)
+        finally:
+            await out.put(None)
+
+    async def _store_stage(self, inbox: asyncio.Queue):
+        while (item := await inbox.get()) is not None:
+            tick, cycle_span, all_datas = item
+            try:
+                await self._store(cycle_span, all_datas)
+            finally:
+                # The last stage: the cycle's trace and profile are complete
+                self._end_cycle(tick, cycle_span)
+
+    async def _store(self, cycle_span: Optional[Span], all_datas: List[RCAllData]):
+        rcs = unique_rcs(all_datas)
+        if self.checkpoint:
+            await self.checkpoint.save(self.apps, rcs)
+        if not self.store:
+            return
+        if self.leases:
+            rcs = self.leases.owned_readings(rcs)
+        rcs = self.store_filter.select(rcs)
+        with attach(cycle_span):
+            try:
+                await with_deadline(
+                    "store", store_in_background(rcs), self.deadlines["store"]
+                )
+            except StageDeadlineExceeded:
+                pass
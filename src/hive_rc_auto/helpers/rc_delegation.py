@@ -1,11 +1,16 @@
+import asyncio
+import json
 import logging
+import math
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Callable, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 from pydantic import BaseModel, Field
 from pymongo import MongoClient
+from pymongo.database import Database
 from pymongo.errors import ServerSelectionTimeoutError
 
 from hive_rc_auto.helpers.config import Config
@@ -18,35 +23,101 @@ from hive_rc_auto.helpers.hive_calls import (
     make_lighthive_call,
     send_custom_json,
 )
+from hive_rc_auto.helpers.metrics import (
+    BROADCASTS_TOTAL,
+    MONGO_WRITE_ERRORS_TOTAL,
+    MONGO_WRITE_SECONDS,
+)
+from hive_rc_auto.helpers.tracing import span
 
 DB_NAME = "rc_podping"
 
 
+# One Motor client per event loop, shared by every writer in the process
+_motor_clients: Dict[int, AsyncIOMotorClient] = {}
+
+
+def get_motor_client() -> AsyncIOMotorClient:
+    try:
+        loop_id = id(asyncio.get_running_loop())
+    except RuntimeError:
+        return AsyncIOMotorClient(Config.DB_CONNECTION)
+    if loop_id not in _motor_clients:
+        _motor_clients[loop_id] = AsyncIOMotorClient(Config.DB_CONNECTION)
+    return _motor_clients[loop_id]
+
+
 def get_mongo_db(collection: str) -> AsyncIOMotorCollection:
     """Returns the MongoDB"""
-    return AsyncIOMotorClient(Config.DB_CONNECTION)[DB_NAME][collection]
+    return get_motor_client()[DB_NAME][collection]
+
+
+def delegations_query(since: datetime) -> dict:
+    """The stored delegations from `since`, the dashboard's markers"""
+    return {"timestamp": {"$gte": since}}
 
 
 def setup_mongo_db() -> int:
     """Check if the DB exists and set it up if needed. Returns number of new DBs"""
-    count = 0
-    for db_name in [Config.DB_NAME, Config.DB_NAME_DELEG]:
-        if check_setup_db(db_name):
-            count += 1
-    return count
+    client = MongoClient(Config.DB_CONNECTION)
+    try:
+        db = client[DB_NAME]
+        collection_names = db.list_collection_names()
+        count = 0
+        for db_name in [
+            Config.DB_NAME,
+            Config.DB_NAME_DELEG,
+            Config.DB_NAME_COMPACT,
+            Config.DB_NAME_ROLLUP,
+        ]:
+            if check_setup_db(db_name, db=db, collection_names=collection_names):
+                count += 1
+        return count
+    finally:
+        client.close()
+
+
+def granularity_for(interval_secs: float) -> str:
+    """
+    Timeseries bucket granularity closest to how often each series (one
+    account, one delegation pair) is written, so buckets fill up instead of
+    holding one or two documents each.
+    """
+    if interval_secs < 60:
+        return "seconds"
+    if interval_secs < 3600:
+        return "minutes"
+    return "hours"
 
 
-def check_setup_db(db_name: str) -> bool:
-    db = MongoClient(Config.DB_CONNECTION)[DB_NAME]
-    collection_names = db.list_collection_names()
+def check_setup_db(
+    db_name: str, db: Database = None, collection_names: List[str] = None
+) -> bool:
+    """
+    Create the timeseries collection `db_name` if it's missing. Pass `db` and
+    its `collection_names` to check several with one connection and listing.
+    """
+    if db is None:
+        db = MongoClient(Config.DB_CONNECTION)[DB_NAME]
+    if collection_names is None:
+        collection_names = db.list_collection_names()
     if db_name in collection_names:
         logging.info(f"DB: {db_name} found in DB: {collection_names}")
         return False
 
     if "deleg" in db_name.lower():
         meta_field = "deleg"
+        # Delegations are occasional, hours apart for any one pair
+        interval = 3600
+    elif db_name == Config.DB_NAME_COMPACT:
+        meta_field = "a"
+        interval = Config.UPDATE_FREQUENCY_SECS
+    elif db_name == Config.DB_NAME_ROLLUP:
+        meta_field = "account"
+        interval = 3600
     else:
         meta_field = "account"
+        interval = Config.UPDATE_FREQUENCY_SECS
 
     # Create timeseries collection:
     db.create_collection(
@@ -54,14 +125,28 @@ def check_setup_db(db_name: str) -> bool:
         timeseries={
             "timeField": "timestamp",
             "metaField": meta_field,
-            "granularity": "seconds",
+            "granularity": granularity_for(interval),
         },
     )
     logging.info(f"DB: {db_name} created in database")
     return True
 
 
+_clock: Optional[Callable[[], datetime]] = None
+
+
+def set_clock(clock: Optional[Callable[[], datetime]] = None) -> None:
+    """
+    Replace the source of "now" used for RC regeneration and timestamps.
+    Used by the replay engine to run on a simulated clock, pass None to reset.
+    """
+    global _clock
+    _clock = clock
+
+
 def get_utc_now_timestamp() -> datetime:
+    if _clock:
+        return _clock()
     return datetime.now(timezone.utc)
 
 
@@ -76,6 +161,11 @@ class RCAccType(str, Enum):
     TARGET = "target"
 
 
+@asynccontextmanager
+async def no_lock():
+    yield
+
+
 def mill(input: float) -> int:
     """Divide by 1 million retuns int"""
     return round(input / 1e6)
@@ -87,6 +177,41 @@ def mill_s(input: float) -> str:
     return f"{m:>12,} M"
 
 
+class RCPolicy(BaseModel):
+    """
+    Which accounts and thresholds one primary account is managed with.
+    Anything not given comes from the .env settings.
+    """
+
+    primary_account: str = Config.PRIMARY_ACCOUNT
+    delegating_accounts: List[str] = Config.DELEGATING_ACCOUNTS
+    posting_key: str = Config.POSTING_KEY
+    rc_base_level: int = Config.RC_BASE_LEVEL
+    rc_pct_lower_target: float = Config.RC_PCT_LOWER_TARGET
+    rc_pct_upper_target: float = Config.RC_PCT_UPPER_TARGET
+    rc_pct_alarm_level: float = Config.RC_PCT_ALARM_LEVEL
+    minimum_delegation: int = Config.MINIMUM_DELEGATION
+    hysteresis_pct: float = Config.HYSTERESIS_PCT
+    account_bands: Dict[str, float] = {}
+    min_dwell_secs: float = Config.MIN_DWELL_SECS
+    coalesce_secs: float = Config.COALESCE_SECS
+
+
+def load_policies(path: str = None) -> List[RCPolicy]:
+    """
+    Read the primary accounts to manage from the JSON file in RC_APPS_FILE,
+    a list of objects with the fields of RCPolicy. Without one there's a
+    single primary account from the .env.
+    """
+    path = path or Config.RC_APPS_FILE
+    if not path:
+        return [RCPolicy()]
+    with open(path, "r") as f:
+        policies = [RCPolicy.parse_obj(item) for item in json.load(f)]
+    logging.info(f"Managing {[p.primary_account for p in policies]}")
+    return policies
+
+
 class RCManabar(BaseModel):
     current_mana: int
     last_update_time: datetime
@@ -183,6 +308,9 @@ class RCAccount(BaseModel):
     old_mana_percent: float = Field(
         0.0, title="RC Last", description="Previous RC Mana Percentage."
     )
+    old_timestamp: Optional[datetime] = Field(
+        None, title="RC Last At", description="Timestamp of the previous reading."
+    )
     status: RCStatus = 0
     alarm_set: bool = Field(
         False, title="Alarm", description="Flag for raising an alarm."
@@ -197,6 +325,11 @@ class RCAccount(BaseModel):
         title="Delegations made",
         description="Outgoing delegations from this account",
     )
+    policy: RCPolicy = Field(
+        default_factory=RCPolicy,
+        title="Policy",
+        description="Thresholds of the primary account managing this account",
+    )
 
     def __init__(__pydantic_self__, **data: Any) -> None:
         super().__init__(**data)
@@ -204,11 +337,12 @@ class RCAccount(BaseModel):
             # Handle correct transfer of mutable strings
             __pydantic_self__.deleg_out = data["deleg_out"].copy()
 
+        policy = __pydantic_self__.policy
         # Calculate real_mana (RC) as a percentage allowing for regeneration
         last_mana = __pydantic_self__.rc_manabar.current_mana
         max_mana = __pydantic_self__.max_rc
         updated_at = __pydantic_self__.rc_manabar.last_update_time
-        time_since_last = datetime.now(timezone.utc) - updated_at
+        time_since_last = get_utc_now_timestamp() - updated_at
         regenerated_mana = (
             time_since_last.total_seconds()
             * max_mana
@@ -221,12 +355,12 @@ class RCAccount(BaseModel):
         )
         # Filter for too_high and too_low
         if (
-            not __pydantic_self__.account in Config.DELEGATING_ACCOUNTS
+            not __pydantic_self__.account in policy.delegating_accounts
             and __pydantic_self__.received_delegated_rc
-            and real_mana_percent > Config.RC_PCT_UPPER_TARGET
+            and real_mana_percent > policy.rc_pct_upper_target
         ):
             __pydantic_self__.status = RCStatus.HIGH
-        elif real_mana_percent < Config.RC_PCT_LOWER_TARGET:
+        elif real_mana_percent < policy.rc_pct_lower_target:
             __pydantic_self__.status = RCStatus.LOW
         else:
             __pydantic_self__.status = RCStatus.OK
@@ -236,17 +370,23 @@ class RCAccount(BaseModel):
             if __pydantic_self__.old_mana_percent != 0.0
             else 0.0
         )
-        # Extrapolate RC Delta to 1 hour
-        __pydantic_self__.delta_percent *= 3600 / Config.UPDATE_FREQUENCY_SECS
+        # Extrapolate RC Delta to 1 hour, over the real gap when it's known
+        # (the previous reading can be from before a restart)
+        elapsed = Config.UPDATE_FREQUENCY_SECS
+        if __pydantic_self__.old_timestamp:
+            gap = __pydantic_self__.timestamp - __pydantic_self__.old_timestamp
+            if gap.total_seconds() > 0:
+                elapsed = gap.total_seconds()
+        __pydantic_self__.delta_percent *= 3600 / elapsed
 
         if (
             __pydantic_self__.real_mana_percent + __pydantic_self__.delta_percent
-            < Config.RC_PCT_ALARM_LEVEL
+            < policy.rc_pct_alarm_level
         ):
             __pydantic_self__.alarm_set = True
 
         __pydantic_self__.rc_deleg_available = __pydantic_self__.real_mana - (
-            Config.RC_BASE_LEVEL + __pydantic_self__.received_delegated_rc
+            policy.rc_base_level + __pydantic_self__.received_delegated_rc
         )
 
     class Config:
@@ -272,6 +412,23 @@ class RCAccount(BaseModel):
     def rc_percent(self):
         return self.rc * 100
 
+    @property
+    def seconds_to_empty(self) -> float:
+        """
+        Projected seconds until RC runs out at the current rate. `delta_percent`
+        is the hourly change net of regeneration, inf if it isn't falling.
+        """
+        if self.delta_percent >= 0:
+            return math.inf
+        return self.real_mana_percent / -self.delta_percent * 3600
+
+    def set_delta(self, delta_percent: float):
+        """Replace the two point delta (see trend) and check the alarm again"""
+        self.delta_percent = delta_percent
+        self.alarm_set = (
+            self.real_mana_percent + self.delta_percent < self.policy.rc_pct_alarm_level
+        )
+
     async def fill_delegations(self):
         self.deleg_out = await list_rc_direct_delegations(self.account)
 
@@ -282,17 +439,31 @@ class RCAccount(BaseModel):
         If delegation is going DOWN, returns the amount it must go down by as a negative.
         """
         if self.status == RCStatus.LOW:
-            percent_gap = Config.RC_PCT_LOWER_TARGET - self.real_mana_percent
+            percent_gap = self.policy.rc_pct_lower_target - self.real_mana_percent
             new_amount = self.max_rc * (1 + ((percent_gap) / 100))
-            if new_amount < Config.MINIMUM_DELEGATION:
+            if new_amount < self.policy.minimum_delegation:
                 new_amount = 0
             return new_amount
         if self.status == RCStatus.HIGH and self.delta_percent > 0:
-            percent_gap = (self.real_mana_percent - Config.RC_PCT_UPPER_TARGET) + 2
+            percent_gap = (self.real_mana_percent - self.policy.rc_pct_upper_target) + 2
             delta = -(self.max_rc * (((percent_gap) / 100))) * 1.3
             return delta
         return 0
 
+    def calculate_alarm_delegation(self) -> int:
+        """
+        Delegation for an account heading below the alarm level: enough to
+        bring the RC projected an hour out back up to the lower target.
+        """
+        projected = self.real_mana_percent + min(self.delta_percent, 0)
+        percent_gap = self.policy.rc_pct_lower_target - projected
+        if percent_gap <= 0:
+            return 0
+        new_amount = self.max_rc * (1 + ((percent_gap) / 100))
+        if new_amount < self.policy.minimum_delegation:
+            new_amount = 0
+        return new_amount
+
     @property
     def db_format(self) -> dict:
         """Return fields to stor in the database"""
@@ -359,11 +530,15 @@ class RCListOfAccounts(BaseModel):
     delegating: List[str] = []
     receiving: List[str] = []
 
-    def __init__(__pydantic_self__, primary_account=Config.PRIMARY_ACCOUNT) -> None:
+    def __init__(
+        __pydantic_self__,
+        primary_account=Config.PRIMARY_ACCOUNT,
+        fallback_delegating: List[str] = None,
+    ) -> None:
         # Slow and expensive operation. Run on startup and rarely.
         super().__init__()
         __pydantic_self__.delegating = get_delegated_posting_auth_accounts(
-            primary_account
+            primary_account, fallback_accounts=fallback_delegating
         )
         __pydantic_self__.receiving = get_tracking_accounts(primary_account)
         __pydantic_self__.all = list(
@@ -382,35 +557,80 @@ class RCAllData(BaseModel):
         [], title="All RC Accounts", description="All the tracked accounts RC details"
     )
     accounts: RCListOfAccounts
+    policy: RCPolicy = Field(default_factory=RCPolicy, title="Policy")
     pending_delegations: List[RCDirectDelegation] = Field(
         [], title="List of pending delegations"
     )
+    alarm_delegations: List[RCDirectDelegation] = Field(
+        [],
+        title="Alarm delegations",
+        description="Delegations for alarmed accounts sent ahead of the cycle",
+    )
 
     def __init__(__pydantic_self__, **data: Any) -> None:
         super().__init__(**data)
 
     def pending_delegations_by(self, delegator: str) -> int:
         """Return just the pending delegations for a specific delgator account"""
-        return int(sum([dd.delegated_rc for dd in self.pending_delegations]))
+        return int(
+            sum(
+                [
+                    dd.delegated_rc
+                    for dd in self.pending_delegations + self.alarm_delegations
+                ]
+            )
+        )
 
-    async def fill_data(self, old_all_rcs: List[RCAccount] = None):
+    async def fill_data(
+        self,
+        old_all_rcs: List[RCAccount] = None,
+        rc_accounts: List[dict] = None,
+        deleg_cache: Dict[str, List[RCDirectDelegation]] = None,
+    ):
         """
-        Fills in the data
+        Fills in the data. `rc_accounts` and `deleg_cache` let several primary
+        accounts share one `find_rc_accounts` call and the delegation lookups.
         """
-        self.timestamp = datetime.now(timezone.utc)
-        self.rcs = await get_rc_of_accounts(self.accounts, old_all_rcs=old_all_rcs)
-        pass
+        self.timestamp = get_utc_now_timestamp()
+        self.rcs = await get_rc_of_accounts(
+            self.accounts,
+            old_all_rcs=old_all_rcs,
+            policy=self.policy,
+            rc_accounts=rc_accounts,
+            deleg_cache=deleg_cache,
+        )
+
+    async def update_alarm_delegations(self) -> List[RCDirectDelegation]:
+        """
+        Work out delegations for the target accounts with an alarm set, ahead
+        of everything else so they can be sent straight away.
+        """
+        for rc in self.rcs:
+            if rc.account in self.accounts.receiving and rc.alarm_set:
+                new_amount = rc.calculate_alarm_delegation()
+                if new_amount > 0:
+                    logging.warning(
+                        f"Alarm: {rc.account} at {rc.real_mana_percent:.1f}% "
+                        f"delegating {mill_s(new_amount)}"
+                    )
+                    await self._plan_delegation(
+                        rc.account, new_amount, self.alarm_delegations
+                    )
+        return self.alarm_delegations
 
     async def update_delegations(self):
         """
-        Implement rules to update the delegations of high or low accounts
+        Implement rules to update the delegations of high or low accounts,
+        leaving out any already handled by the alarm fast path.
         """
+        already_sent = {dd.acc_to for dd in self.alarm_delegations}
         new_delegations = []
         if self.rcs:
             for rc in self.rcs:
                 if (
                     rc.account in self.accounts.receiving
                     and not rc.status == RCStatus.OK
+                    and rc.account not in already_sent
                 ):
                     new_amount = rc.calculate_new_delegation()
                     new_delegations.append((rc.account, new_amount))
@@ -418,80 +638,119 @@ class RCAllData(BaseModel):
 
             new_delegations.sort(key=lambda x: x[1], reverse=True)
             for deleg in new_delegations:
-                if deleg[1] > 0:
-                    delegate_from = await self.which_account_to_delegate_from(
-                        deleg[0], amount=deleg[1]
-                    )
-                    new_dd = RCDirectDelegation.parse_obj(
-                        {
-                            "from": delegate_from,
-                            "to": deleg[0],
-                            "delegated_rc": deleg[1],
-                            "cut": False,
-                        }
-                    )
-                    self.pending_delegations.append(new_dd)
-                    logging.debug(f"Deleg from {delegate_from} {deleg[0]} {deleg[1]}")
-                elif deleg[1] < 0:
-                    (
-                        cut_delegate_from,
-                        new_amount,
-                    ) = await self.which_account_to_cut_delegation_from(
-                        deleg[0], amount=deleg[1]
-                    )
-                    if not cut_delegate_from == "external_delegation":
-                        # This account has a delegation we can coontrol Podping
-                        new_dd = RCDirectDelegation.parse_obj(
-                            {
-                                "from": cut_delegate_from,
-                                "to": deleg[0],
-                                "delegated_rc": new_amount,
-                                "cut": True,
-                            }
-                        )
-                        self.pending_delegations.append(new_dd)
-                        logging.debug(
-                            f"Cut Deleg from {cut_delegate_from} {deleg[0]} {deleg[1]}"
-                        )
+                await self._plan_delegation(
+                    deleg[0], deleg[1], self.pending_delegations
+                )
+
+    async def _plan_delegation(
+        self, target: str, amount: int, pending: List[RCDirectDelegation]
+    ):
+        """Pick the delegator to increase or cut `target` and add it to `pending`"""
+        if amount > 0:
+            delegate_from = await self.which_account_to_delegate_from(
+                target, amount=amount
+            )
+            new_dd = RCDirectDelegation.parse_obj(
+                {
+                    "from": delegate_from,
+                    "to": target,
+                    "delegated_rc": amount,
+                    "cut": False,
+                }
+            )
+            pending.append(new_dd)
+            logging.debug(f"Deleg from {delegate_from} {target} {amount}")
+        elif amount < 0:
+            (
+                cut_delegate_from,
+                new_amount,
+            ) = await self.which_account_to_cut_delegation_from(target, amount=amount)
+            if not cut_delegate_from == "external_delegation":
+                # This account has a delegation we can coontrol Podping
+                new_dd = RCDirectDelegation.parse_obj(
+                    {
+                        "from": cut_delegate_from,
+                        "to": target,
+                        "delegated_rc": new_amount,
+                        "cut": True,
+                    }
+                )
+                pending.append(new_dd)
+                logging.debug(f"Cut Deleg from {cut_delegate_from} {target} {amount}")
+
+    def build_payloads(
+        self, delegations: List[RCDirectDelegation] = None
+    ) -> Dict[str, List]:
+        """
+        Sorts through the pending delegations (or `delegations`) and returns a
+        payload for each delegator, keyed by the delegating account.
+        """
+        if delegations is None:
+            delegations = self.pending_delegations
+        payloads: Dict[str, List] = {}
+        for dd in delegations:
+            # Each item in payload must be a list with one item in it
+            payloads.setdefault(dd.acc_from, []).append(dd.payload_item)
+        return payloads
 
     async def get_payload_for_pending_delegations(
-        self, send_json: bool = False
+        self,
+        send_json: bool = False,
+        broadcaster: Callable = send_custom_json,
+        store_delegations: bool = True,
+        delegator_lock: Callable = None,
+        delegations: List[RCDirectDelegation] = None,
+        on_sent: Callable[[str, HiveTrx], None] = None,
     ) -> List:
         """
-        Sorts through the pending delegations and returns separate payloads
-        one for each delegator. If send_json is True, send the jsons
+        Sorts through the pending delegations (or `delegations`) and returns
+        separate payloads one for each delegator. If send_json is True, send
+        the jsons using `broadcaster` (anything with the signature of
+        `send_custom_json`). `delegator_lock(delegator)` is an async context
+        manager held around each delegator's broadcast, used by sharded
+        workers. `on_sent(delegator, trx)` is called for each one included.
         """
-        payloads = []
         hive_operation_id = "rc"
-        client = get_client(
-            nodes=["https://rpc.podping.org"], posting_keys=[Config.POSTING_KEY]
-        )
-        different_delegators = {dd.acc_from for dd in self.pending_delegations}
-        for delegator in different_delegators:
-            payload = []
-            for dd in [
-                dd for dd in self.pending_delegations if dd.acc_from == delegator
-            ]:
-                # Each item in payload must be a list with one item in it
-                payload += [dd.payload_item]
-            payloads.append(payload)
-            if send_json:
-                try:
-                    trx = await send_custom_json(
+        if delegations is None:
+            delegations = self.pending_delegations
+        payloads = self.build_payloads(delegations)
+        if not send_json:
+            return list(payloads.values())
+        client = None
+        if broadcaster is send_custom_json:
+            client = get_client(
+                nodes=["https://rpc.podping.org"],
+                posting_keys=[self.policy.posting_key],
+            )
+        for delegator, payload in payloads.items():
+            lock = delegator_lock(delegator) if delegator_lock else no_lock()
+            try:
+                async with lock:
+                    trx = await broadcaster(
                         client=client,
                         payload=payload,
                         hive_operation_id=hive_operation_id,
-                        required_posting_auth=dd.acc_from,
+                        required_posting_auth=delegator,
                     )
-                    if trx:
-                        logging.info(f"Custom Json: {trx.trx_num}")
-                        db_delegations = get_mongo_db(Config.DB_NAME_DELEG)
-                        await db_delegations.insert_many(
-                            [pd.db_format(trx=trx) for pd in self.pending_delegations]
-                        )
-                except Exception as ex:
-                    logging.error(ex)
-        return payloads
+            except Exception as ex:
+                BROADCASTS_TOTAL.inc(result="failed")
+                logging.error(ex)
+                continue
+            BROADCASTS_TOTAL.inc(result="sent" if trx else "unchanged")
+            if not trx:
+                continue
+            logging.info(f"Custom Json: {trx.trx_num}")
+            if on_sent:
+                on_sent(delegator, trx)
+            if store_delegations:
+                await store_delegation_history(
+                    [
+                        pd.db_format(trx=trx)
+                        for pd in delegations
+                        if pd.acc_from == delegator
+                    ]
+                )
+        return list(payloads.values())
 
     def log_output(self, logger: Callable):
         """
@@ -510,6 +769,9 @@ class RCAllData(BaseModel):
                 for rc in self.rcs
                 if rc.delegating == RCAccType.TARGET
             ]
+        if self.alarm_delegations:
+            logger("-------- Alarm delegations    -----------")
+            [dd.log_line_output(logger) for dd in self.alarm_delegations]
         if self.pending_delegations:
             logger("-------- Pending delegations  -----------")
             [dd.log_line_output(logger) for dd in self.pending_delegations]
@@ -577,44 +839,95 @@ class RCAllData(BaseModel):
 
     async def store_all_data(self):
         """Store all this item's relevant data in a MongoDB"""
-        db_rc_history = get_mongo_db(Config.DB_NAME)
-        data = [rc.db_format for rc in self.rcs]
-        try:
+        await store_readings(self.rcs)
+
+
+async def store_delegation_history(docs: List[dict]):
+    """Record broadcast delegations, a failed write doesn't undo the broadcast"""
+    if not docs:
+        return
+    try:
+        with span(
+            "mongo_insert", collection=Config.DB_NAME_DELEG, documents=len(docs)
+        ), MONGO_WRITE_SECONDS.time(collection=Config.DB_NAME_DELEG):
+            await get_mongo_db(Config.DB_NAME_DELEG).insert_many(docs)
+    except ServerSelectionTimeoutError as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME_DELEG)
+        logging.error("Can't reach Database")
+        logging.error(ex)
+    except Exception as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME_DELEG)
+        logging.error("problem writing delegations to Database")
+        logging.error(ex)
+
+
+async def store_readings(rcs: List[RCAccount]):
+    """Write one reading per account to the RC history collection"""
+    if not rcs:
+        return
+    db_rc_history = get_mongo_db(Config.DB_NAME)
+    data = [rc.db_format for rc in rcs]
+    try:
+        with span(
+            "mongo_insert", collection=Config.DB_NAME, documents=len(data)
+        ), MONGO_WRITE_SECONDS.time(collection=Config.DB_NAME):
             ans = await db_rc_history.insert_many(data)
-        except ServerSelectionTimeoutError as ex:
-            logging.error("Can't reach Database")
-            logging.error(ex)
-        except Exception as ex:
-            logging.error("problem writing to Database")
-            logging.error(ex)
+    except ServerSelectionTimeoutError as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME)
+        logging.error("Can't reach Database")
+        logging.error(ex)
+    except Exception as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME)
+        logging.error("problem writing to Database")
+        logging.error(ex)
 
 
 async def get_rc_of_accounts(
-    check_accounts: RCListOfAccounts, old_all_rcs: List[RCAccount] = None
+    check_accounts: RCListOfAccounts,
+    old_all_rcs: List[RCAccount] = None,
+    policy: RCPolicy = None,
+    rc_accounts: List[dict] = None,
+    deleg_cache: Dict[str, List[RCDirectDelegation]] = None,
 ) -> List[RCAccount]:
     """
-    Performs the lookup and fills in the RC data for all accounts
+    Performs the lookup and fills in the RC data for all accounts. Pass in
+    `rc_accounts` from an earlier `find_rc_accounts` call to skip the lookup,
+    `deleg_cache` holds each delegator's delegations so they're fetched once.
     """
-
-    response = get_rcs(check_accounts.all)
-    old_current_percents = (
-        {i.account: i.real_mana_percent for i in old_all_rcs} if old_all_rcs else None
+    if rc_accounts is None:
+        response = get_rcs(check_accounts.all)
+        rc_accounts = response.get("rc_accounts") or []
+    if deleg_cache is None:
+        deleg_cache = {}
+    old_readings = (
+        {i.account: (i.real_mana_percent, i.timestamp) for i in old_all_rcs}
+        if old_all_rcs
+        else None
     )
+    wanted = set(check_accounts.all)
     ans: List[RCAccount] = []
-    if rc_accounts := response.get("rc_accounts"):
-        for a in rc_accounts:
-            if old_current_percents:  # and old_current_percents[a.get("account")]:
-                a["old_mana_percent"] = old_current_percents[a.get("account")]
-
-            if a["account"] in check_accounts.delegating:
-                # Now fill in delegations FROM all delegating accounts
-                dd_list = await list_rc_direct_delegations(a["account"])
-                a["deleg_out"] = dd_list
-                [dd.log_line_output(logging.debug) for dd in dd_list]
-                a["delegating"] = RCAccType.DELEGATING
-            else:
-                a["delegating"] = RCAccType.TARGET
-            ans.append(RCAccount.parse_obj(a))
+    for raw in rc_accounts:
+        if raw.get("account") not in wanted:
+            continue
+        a = dict(raw)
+        if policy:
+            a["policy"] = policy
+        if old_readings and a["account"] in old_readings:
+            a["old_mana_percent"], a["old_timestamp"] = old_readings[a["account"]]
+
+        if a["account"] in check_accounts.delegating:
+            # Now fill in delegations FROM all delegating accounts
+            if a["account"] not in deleg_cache:
+                deleg_cache[a["account"]] = await list_rc_direct_delegations(
+                    a["account"]
+                )
+            dd_list = deleg_cache[a["account"]]
+            a["deleg_out"] = dd_list
+            [dd.log_line_output(logging.debug) for dd in dd_list]
+            a["delegating"] = RCAccType.DELEGATING
+        else:
+            a["delegating"] = RCAccType.TARGET
+        ans.append(RCAccount.parse_obj(a))
     return ans
 
 
@@ -628,10 +941,13 @@ async def list_rc_direct_delegations(
     """
     client_rc = get_client(api_type="rc_api")
     query = {"start": [acc_from, acc_to], "limit": limit}
-    response = make_lighthive_call(
+    # In a thread so other stages of the pipeline carry on during the call
+    response = await asyncio.to_thread(
+        make_lighthive_call,
         client=client_rc,
         call_to_make=client_rc.list_rc_direct_delegations,
         params=query,
+        method_name="list_rc_direct_delegations",
     )
     if response.get("rc_direct_delegations"):
         ans = [
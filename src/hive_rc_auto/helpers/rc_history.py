@@ -0,0 +1,90 @@
+"""
+Reading the RC history back for the dashboard.
+"""
+from datetime import datetime
+from typing import List
+
+import pandas as pd
+
+from hive_rc_auto.helpers.config import Config
+
+
+def fill_forward(
+    df: pd.DataFrame, until: datetime = None, period: float = None
+) -> pd.DataFrame:
+    """
+    Readings are only stored when they change (see store_filter) so a gap
+    means nothing moved. Put the step back: a copy of the reading before
+    each gap just ahead of the reading after it, and one at `until` when the
+    last reading is older than a cycle. `df` has a `timestamp` column.
+    """
+    if df.empty:
+        return df
+    period = period or Config.UPDATE_FREQUENCY_SECS
+    step = pd.Timedelta(seconds=period)
+    df = df.sort_values("timestamp", kind="stable")
+    parts = [df]
+    for _, dfa in df.groupby("account", sort=False):
+        gaps = dfa.timestamp.diff() > 1.5 * step
+        if gaps.any():
+            carried = dfa.shift(1)[gaps].copy()
+            carried["timestamp"] = dfa.timestamp[gaps] - step
+            parts.append(carried)
+        if until is not None and until - dfa.timestamp.iloc[-1] > 1.5 * step:
+            last = dfa.iloc[[-1]].copy()
+            last["timestamp"] = until
+            parts.append(last)
+    return pd.concat(parts, ignore_index=True).sort_values("timestamp", kind="stable")
+
+
+def combine_history(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Readings from the archive, rollups and the live collection as one frame.
+    Where they overlap (the archive grace days) a reading is kept once.
+    """
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts, ignore_index=True)
+    df = df.drop_duplicates(["account", "timestamp"], keep="last")
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+# $dateTrunc counts bins of binSize from here
+BUCKET_ORIGIN = pd.Timestamp("2000-01-01")
+
+
+def bucket_secs_for(span_secs: float, points: int = None) -> int:
+    """
+    Bucket size (whole minutes, in seconds) which keeps a range of
+    `span_secs` to about `points` per account, 0 when every reading fits.
+    """
+    points = points or Config.DASHBOARD_POINTS
+    if span_secs / points <= Config.UPDATE_FREQUENCY_SECS:
+        return 0
+    return int(-(-span_secs // (points * 60))) * 60
+
+
+def bucket_frame(df: pd.DataFrame, bucket_secs: int) -> pd.DataFrame:
+    """
+    Readings averaged into the buckets the database query uses (see
+    `rc_schema.find_bucketed`), for the parts of the history not in Mongo.
+    """
+    if df.empty or not bucket_secs:
+        return df
+    step = pd.Timedelta(seconds=bucket_secs)
+    df = df.sort_values("timestamp", kind="stable")
+    bucket = BUCKET_ORIGIN + (df.timestamp - BUCKET_ORIGIN) // step * step
+    grouped = df.drop(columns=["account", "timestamp"]).groupby(
+        [df.account, bucket.rename("timestamp")], sort=False
+    )
+    means = [
+        field
+        for field in ("real_mana", "real_mana_percent", "delta_percent")
+        if field in df
+    ]
+    out = grouped.last()
+    out[means] = grouped[means].mean()
+    out["min_percent"] = grouped.real_mana_percent.min()
+    out["max_percent"] = grouped.real_mana_percent.max()
+    return out.reset_index()
@@ -0,0 +1,343 @@
+"""
+Compact, versioned schema for the RC history. A legacy reading document
+repeats the account name, its type and status as strings and the
+`delta_icon` emoji, and stores fields which can be worked out from the rest.
+A compact one holds integers with short keys and the account as a number
+from the account dictionary (Config.DB_NAME_ACCOUNTS):
+
+    timestamp   timestamp
+    a           account id, the timeseries metaField
+    v           schema version
+    k           0 target, 1 delegating
+    s           status: 0 ok, 1 low, 2 high
+    m           max_rc
+    r           real_mana
+    dr          delegated_rc
+    rr          received_delegated_rc
+    dp          delta_percent x 100
+
+`real_mana_percent`, `delta_icon` and `rc_deleg_available` are worked out
+again on reading (`from_compact`), so readers keep seeing the legacy shape.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import MONGO_WRITE_ERRORS_TOTAL, MONGO_WRITE_SECONDS
+from hive_rc_auto.helpers.rc_delegation import RCAccount, get_mongo_db
+from hive_rc_auto.helpers.tracing import span
+
+SCHEMA_VERSION = 2
+DELTA_SCALE = 100
+STATUS_CODES = {"ok": 0, "low": 1, "high": 2}
+KIND_CODES = {"target": 0, "delegating": 1}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+KIND_NAMES = {code: name for name, code in KIND_CODES.items()}
+# The account dictionary's counter, never a valid Hive account name
+COUNTER_ID = "__next_id__"
+
+
+def to_compact(doc: dict, account_id: int) -> dict:
+    """A legacy reading document (`RCAccount.db_format`) in the compact schema"""
+    compact = {
+        "timestamp": doc["timestamp"],
+        "a": account_id,
+        "v": SCHEMA_VERSION,
+        "k": KIND_CODES.get(doc.get("delegating"), 0),
+        "s": STATUS_CODES.get(doc.get("status"), 0),
+        "m": int(doc["max_rc"]),
+        "r": int(round(doc["real_mana"])),
+        "dr": int(doc.get("delegated_rc") or 0),
+        "rr": int(doc.get("received_delegated_rc") or 0),
+        "dp": int(round((doc.get("delta_percent") or 0) * DELTA_SCALE)),
+    }
+    if doc.get("testnet"):
+        compact["tn"] = 1
+    return compact
+
+
+def delta_icon(status: str, delta_percent: float) -> str:
+    """As `RCAccount.delta_icon`"""
+    if status == "low":
+        return "🔴"
+    if delta_percent > 0:
+        return "✅"
+    if delta_percent < 0:
+        return "🟡"
+    return "🟦"
+
+
+def from_compact(doc: dict, names: Dict[int, str]) -> dict:
+    """
+    A compact document in the legacy shape. `rc_deleg_available` uses
+    RC_BASE_LEVEL, the primary account's own base level isn't stored.
+    """
+    real_mana = doc["r"]
+    real_mana_percent = min(real_mana * 100 / doc["m"], 100.0) if doc["m"] else 0.0
+    delta_percent = doc["dp"] / DELTA_SCALE
+    status = STATUS_NAMES[doc["s"]]
+    legacy = {
+        "timestamp": doc["timestamp"],
+        "account": names.get(doc["a"], str(doc["a"])),
+        "delegating": KIND_NAMES[doc["k"]],
+        "status": status,
+        "max_rc": doc["m"],
+        "delegated_rc": doc["dr"],
+        "received_delegated_rc": doc["rr"],
+        "real_mana": real_mana,
+        "real_mana_percent": real_mana_percent,
+        "delta_percent": delta_percent,
+        "rc_deleg_available": real_mana - (Config.RC_BASE_LEVEL + doc["rr"]),
+        "delta_icon": delta_icon(status, delta_percent),
+    }
+    if doc.get("tn"):
+        legacy["testnet"] = True
+    return legacy
+
+
+class AccountDictionary:
+    """
+    Account name to id, one document per account (`_id` the name, `n` the
+    id) numbered from a counter document. Safe with several writers: an id
+    is only ever given to the first writer to insert the name.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+
+    async def load(self) -> Dict[str, int]:
+        cursor = get_mongo_db(Config.DB_NAME_ACCOUNTS).find(
+            {"_id": {"$ne": COUNTER_ID}}
+        )
+        self.ids.update({doc["_id"]: doc["n"] async for doc in cursor})
+        return self.ids
+
+    async def names(self) -> Dict[int, str]:
+        return {n: name for name, n in (await self.load()).items()}
+
+    async def ids_for(self, accounts: Iterable[str]) -> Dict[str, int]:
+        accounts = list(dict.fromkeys(accounts))
+        if any(acc not in self.ids for acc in accounts):
+            # Another worker may have added them
+            await self.load()
+        collection = get_mongo_db(Config.DB_NAME_ACCOUNTS)
+        for acc in accounts:
+            if acc in self.ids:
+                continue
+            counter = await collection.find_one_and_update(
+                {"_id": COUNTER_ID},
+                {"$inc": {"n": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            try:
+                await collection.insert_one({"_id": acc, "n": counter["n"]})
+                self.ids[acc] = counter["n"]
+            except DuplicateKeyError:
+                doc = await collection.find_one({"_id": acc})
+                self.ids[acc] = doc["n"]
+        return {acc: self.ids[acc] for acc in accounts}
+
+
+_dictionary = AccountDictionary()
+
+
+def account_names(db: Database) -> Dict[int, str]:
+    """Account id to name, for synchronous readers"""
+    return {
+        doc["n"]: doc["_id"]
+        for doc in db[Config.DB_NAME_ACCOUNTS].find({"_id": {"$ne": COUNTER_ID}})
+    }
+
+
+async def store_compact(rcs: List[RCAccount]):
+    """Write one compact reading per account, as `store_readings`"""
+    if not rcs:
+        return
+    try:
+        ids = await _dictionary.ids_for(rc.account for rc in rcs)
+        data = [to_compact(rc.db_format, ids[rc.account]) for rc in rcs]
+        with span(
+            "mongo_insert", collection=Config.DB_NAME_COMPACT, documents=len(data)
+        ), MONGO_WRITE_SECONDS.time(collection=Config.DB_NAME_COMPACT):
+            await get_mongo_db(Config.DB_NAME_COMPACT).insert_many(data)
+    except ServerSelectionTimeoutError as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME_COMPACT)
+        logging.error("Can't reach Database")
+        logging.error(ex)
+    except Exception as ex:
+        MONGO_WRITE_ERRORS_TOTAL.inc(collection=Config.DB_NAME_COMPACT)
+        logging.error("problem writing to Database")
+        logging.error(ex)
+
+
+def readings_query(
+    start: datetime, end: datetime = None, compact: bool = None
+) -> Tuple[str, dict]:
+    """
+    The collection and filter for the readings from `start` (to `end`), in
+    the schema RC_HISTORY_SCHEMA says is current unless `compact` is given.
+    """
+    if compact is None:
+        compact = Config.RC_HISTORY_SCHEMA == "compact"
+    time_range = {"$gte": start}
+    if end:
+        time_range["$lt"] = end
+    if compact:
+        return Config.DB_NAME_COMPACT, {"timestamp": time_range}
+    return Config.DB_NAME, {"real_mana": {"$ne": None}, "timestamp": time_range}
+
+
+def iter_readings(
+    db: Database, start: datetime, end: datetime = None, batch_size: int = 10_000
+) -> Iterator[dict]:
+    """
+    The readings from `start` (to `end`) in the legacy shape, oldest first,
+    from whichever collection RC_HISTORY_SCHEMA says is current. Streamed
+    from the cursor, for synchronous readers.
+    """
+    collection, query = readings_query(start, end)
+    if Config.RC_HISTORY_SCHEMA != "compact":
+        yield from db[collection].find(query, {"_id": 0}).sort(
+            "timestamp", 1
+        ).batch_size(batch_size)
+        return
+    names = account_names(db)
+    for doc in db[collection].find(query).sort("timestamp", 1).batch_size(batch_size):
+        yield from_compact(doc, names)
+
+
+def find_readings(db: Database, start: datetime, end: datetime = None) -> List[dict]:
+    """As `iter_readings`, all at once. For the dashboard."""
+    return list(iter_readings(db, start, end))
+
+
+# The fields of a reading in each schema, as aggregation expressions
+LEGACY_FIELDS = {
+    "account": "$account",
+    "real_mana": "$real_mana",
+    "real_mana_percent": "$real_mana_percent",
+    "delta_percent": "$delta_percent",
+    "max_rc": "$max_rc",
+    "delegated_rc": "$delegated_rc",
+    "received_delegated_rc": "$received_delegated_rc",
+    "status": "$status",
+    "delegating": "$delegating",
+}
+COMPACT_FIELDS = {
+    "account": "$a",
+    "real_mana": "$r",
+    "real_mana_percent": {
+        "$cond": [
+            {"$gt": ["$m", 0]},
+            {"$min": [{"$multiply": [{"$divide": ["$r", "$m"]}, 100]}, 100]},
+            0,
+        ]
+    },
+    "delta_percent": {"$divide": ["$dp", DELTA_SCALE]},
+    "max_rc": "$m",
+    "delegated_rc": "$dr",
+    "received_delegated_rc": "$rr",
+    "status": "$s",
+    "delegating": "$k",
+}
+
+
+def bucket_pipeline(
+    fields: Dict[str, Any], match: dict, bucket_secs: int
+) -> List[dict]:
+    """
+    Readings averaged per account into `bucket_secs` buckets with
+    `$dateTrunc`, keeping each bucket's lowest and highest RC %.
+    """
+    averaged = ("real_mana", "real_mana_percent", "delta_percent")
+    return [
+        {"$match": match},
+        {"$sort": {"timestamp": 1}},
+        {
+            "$group": {
+                "_id": {
+                    "account": fields["account"],
+                    "timestamp": {
+                        "$dateTrunc": {
+                            "date": "$timestamp",
+                            "unit": "minute",
+                            "binSize": bucket_secs // 60,
+                        }
+                    },
+                },
+                **{name: {"$avg": fields[name]} for name in averaged},
+                "min_percent": {"$min": fields["real_mana_percent"]},
+                "max_percent": {"$max": fields["real_mana_percent"]},
+                **{
+                    name: {"$last": expression}
+                    for name, expression in fields.items()
+                    if name not in averaged and name != "account"
+                },
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "account": "$_id.account",
+                "timestamp": "$_id.timestamp",
+                **{name: 1 for name in fields if name != "account"},
+                "min_percent": 1,
+                "max_percent": 1,
+            }
+        },
+        {"$sort": {"timestamp": 1}},
+    ]
+
+
+def bucketed_query(
+    start: datetime, end: datetime = None, bucket_secs: int = 60, compact: bool = None
+) -> Tuple[str, List[dict]]:
+    """The collection and `bucket_pipeline` for `find_bucketed`"""
+    if compact is None:
+        compact = Config.RC_HISTORY_SCHEMA == "compact"
+    collection, match = readings_query(start, end, compact)
+    fields = COMPACT_FIELDS if compact else LEGACY_FIELDS
+    return collection, bucket_pipeline(fields, match, bucket_secs)
+
+
+def find_bucketed(
+    db: Database, start: datetime, end: datetime = None, bucket_secs: int = 0
+) -> List[dict]:
+    """
+    As `find_readings` with the averaging done by the database, so a long
+    range comes back as a bounded number of points per account. A bucket of
+    0 (or under a minute) returns every reading.
+    """
+    if bucket_secs < 60:
+        return find_readings(db, start, end)
+    collection, pipeline = bucketed_query(start, end, bucket_secs)
+    if Config.RC_HISTORY_SCHEMA != "compact":
+        return list(db[collection].aggregate(pipeline))
+    names = account_names(db)
+    docs = list(db[collection].aggregate(pipeline))
+    for doc in docs:
+        doc["account"] = names.get(doc["account"], str(doc["account"]))
+        doc["status"] = STATUS_NAMES[doc["status"]]
+        doc["delegating"] = KIND_NAMES[doc["delegating"]]
+        doc["delta_icon"] = delta_icon(doc["status"], doc["delta_percent"])
+    return docs
+
+
+async def load_readings(start: datetime, end: datetime) -> List[dict]:
+    """
+    The readings between `start` and `end` in the legacy shape, oldest
+    first, for async readers (replay).
+    """
+    collection, query = readings_query(start, end)
+    if Config.RC_HISTORY_SCHEMA != "compact":
+        cursor = get_mongo_db(collection).find(query, {"_id": 0})
+        return await cursor.sort("timestamp", 1).to_list(length=None)
+    names = await _dictionary.names()
+    cursor = get_mongo_db(collection).find(query)
+    return [from_compact(doc, names) async for doc in cursor.sort("timestamp", 1)]
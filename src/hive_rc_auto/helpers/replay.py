@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from timeit import default_timer as timer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.hive_calls import HiveTrx
+from hive_rc_auto.helpers.hysteresis import DelegationGovernor
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCAccType,
+    RCAllData,
+    RCDirectDelegation,
+    RCListOfAccounts,
+    get_mongo_db,
+    set_clock,
+)
+from hive_rc_auto.helpers.rc_schema import load_readings
+
+# Readings stored by `store_all_data` don't include the creation adjustment
+# which RCAccount needs but never uses in its calculations.
+EMPTY_CREATION_ADJUSTMENT = {"amount": 0, "precision": 6, "nai": "@@000000037"}
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Mongo hands back naive datetimes which are in UTC"""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+class SimulatedClock:
+    """
+    A clock which only moves when the replay tells it to. Without a `start`
+    it reads the real time until the first `advance_to` sets it.
+    """
+
+    def __init__(self, start: datetime = None) -> None:
+        self.now: Optional[datetime] = as_utc(start) if start else None
+
+    def __call__(self) -> datetime:
+        return self.now or datetime.now(timezone.utc)
+
+    def advance_to(self, timestamp: datetime):
+        timestamp = as_utc(timestamp)
+        if self.now is None or timestamp > self.now:
+            self.now = timestamp
+
+
+class FakeBroadcastSink:
+    """
+    Stands in for `send_custom_json`. Records every payload and hands back a
+    fake transaction so the rest of the pipeline behaves as if the broadcast
+    was included in a block.
+    """
+
+    def __init__(self, clock: SimulatedClock = None) -> None:
+        self.clock = clock
+        self.broadcasts: List[Dict[str, Any]] = []
+
+    async def __call__(
+        self,
+        client: Any,
+        payload: List,
+        hive_operation_id: str,
+        required_auth: str = None,
+        required_posting_auth: str = None,
+    ) -> HiveTrx:
+        self.broadcasts.append(
+            {
+                "timestamp": self.clock() if self.clock else None,
+                "required_posting_auth": required_posting_auth,
+                "hive_operation_id": hive_operation_id,
+                "payload": payload,
+            }
+        )
+        return HiveTrx.parse_obj(
+            {
+                "id": f"replay_{len(self.broadcasts):08d}",
+                "block_num": len(self.broadcasts),
+                "trx_num": 0,
+                "expired": False,
+            }
+        )
+
+
+class ReplayDecision(BaseModel):
+    timestamp: datetime
+    acc_from: str
+    acc_to: str
+    delegated_rc: int
+    cut: bool = None
+
+
+class ReplayReport(BaseModel):
+    start: datetime = None
+    end: datetime = None
+    cycles: int = 0
+    readings: int = 0
+    broadcasts: int = 0
+    decisions: List[ReplayDecision] = []
+    seconds_below_alarm: Dict[str, float] = Field(
+        {},
+        title="Time below alarm",
+        description="Seconds each account spent below RC_PCT_ALARM_LEVEL",
+    )
+    suppressed: Dict[str, int] = Field(
+        {},
+        title="Suppressed",
+        description="Changes held back by the hysteresis policy by reason",
+    )
+    wall_seconds: float = 0.0
+
+    @property
+    def replayed_seconds(self) -> float:
+        if self.start and self.end:
+            return (self.end - self.start).total_seconds()
+        return 0.0
+
+    @property
+    def days_per_second(self) -> float:
+        """How many days of history are replayed for each second of wall time"""
+        if not self.wall_seconds:
+            return 0.0
+        return self.replayed_seconds / 86400 / self.wall_seconds
+
+    def log_output(self, logger=logging.info):
+        logger(f"Replayed {self.start} -> {self.end}")
+        logger(
+            f"Cycles: {self.cycles:>8,} | Readings: {self.readings:>10,} | "
+            f"Broadcasts: {self.broadcasts:>6,} | Decisions: {len(self.decisions):>6,}"
+        )
+        cuts = len([d for d in self.decisions if d.cut])
+        logger(f"Increases: {len(self.decisions) - cuts:>6,} | Cuts: {cuts:>6,}")
+        if self.suppressed:
+            logger(f"Suppressed: {self.suppressed}")
+        for account, seconds in sorted(
+            self.seconds_below_alarm.items(), key=lambda x: x[1], reverse=True
+        ):
+            logger(f"{account:<16} | below alarm {timedelta(seconds=int(seconds))}")
+        logger(
+            f"Wall time: {self.wall_seconds:.2f}s | "
+            f"{self.days_per_second:,.1f} days of data per second"
+        )
+
+
+def group_snapshots(readings: Iterable[dict]) -> Iterator[List[dict]]:
+    """
+    Split a time ordered stream of stored readings into one snapshot per bot
+    cycle. A new snapshot starts when an account repeats or half a cycle has
+    passed, as unchanged readings aren't stored (see store_filter).
+    """
+    snapshot: List[dict] = []
+    seen = set()
+    started = None
+    for reading in readings:
+        if reading.get("real_mana") is None:
+            continue
+        timestamp = as_utc(reading["timestamp"])
+        if reading["account"] in seen or (
+            started
+            and (timestamp - started).total_seconds() > Config.UPDATE_FREQUENCY_SECS / 2
+        ):
+            yield snapshot
+            snapshot = []
+            seen = set()
+            started = None
+        started = started or timestamp
+        seen.add(reading["account"])
+        snapshot.append(reading)
+    if snapshot:
+        yield snapshot
+
+
+def reading_to_rc_account(
+    reading: dict,
+    old_mana_percent: float = 0.0,
+    deleg_out: List[RCDirectDelegation] = None,
+    old_timestamp: datetime = None,
+) -> RCAccount:
+    """Rebuild an RCAccount from a document written by `store_all_data`"""
+    timestamp = as_utc(reading["timestamp"])
+    data = {
+        "timestamp": timestamp,
+        "account": reading["account"],
+        "delegating": reading.get("delegating", RCAccType.TARGET),
+        "rc_manabar": {
+            "current_mana": int(reading["real_mana"]),
+            "last_update_time": timestamp,
+        },
+        "max_rc_creation_adjustment": EMPTY_CREATION_ADJUSTMENT,
+        "max_rc": reading["max_rc"],
+        "delegated_rc": reading["delegated_rc"],
+        "received_delegated_rc": reading["received_delegated_rc"],
+        "old_mana_percent": old_mana_percent,
+        "old_timestamp": old_timestamp,
+    }
+    if deleg_out:
+        data["deleg_out"] = deleg_out
+    return RCAccount.parse_obj(data)
+
+
+class RCReplay:
+    """
+    Feeds historical snapshots through RCAccount, RCAllData.update_delegations
+    and the payload builder on a simulated clock. Decisions go to a fake
+    broadcast sink and are applied to the replay's own view of the outgoing
+    delegations. The readings themselves are history so they don't react to
+    the decisions made: this measures what the policy would have done.
+    """
+
+    def __init__(
+        self,
+        accounts: RCListOfAccounts = None,
+        delegations: List[RCDirectDelegation] = None,
+        governor: DelegationGovernor = None,
+    ) -> None:
+        self.accounts = accounts
+        self.governor = governor
+        self.clock = SimulatedClock()
+        self.sink = FakeBroadcastSink(clock=self.clock)
+        self.deleg_state: Dict[Tuple[str, str], int] = {}
+        for dd in delegations or []:
+            self.deleg_state[(dd.acc_from, dd.acc_to)] = dd.delegated_rc
+
+    def deleg_out(self, delegator: str) -> List[RCDirectDelegation]:
+        return [
+            RCDirectDelegation.parse_obj(
+                {"from": acc_from, "to": acc_to, "delegated_rc": amount}
+            )
+            for (acc_from, acc_to), amount in self.deleg_state.items()
+            if acc_from == delegator and amount
+        ]
+
+    def accounts_from_snapshot(self, snapshot: List[dict]) -> RCListOfAccounts:
+        """
+        The given list of accounts, less any not read yet, or without one
+        worked out from the readings
+        """
+        if self.accounts:
+            read = {r["account"] for r in snapshot}
+            delegating = [acc for acc in self.accounts.delegating if acc in read]
+            receiving = [acc for acc in self.accounts.receiving if acc in read]
+        else:
+            delegating = [
+                r["account"] for r in snapshot if r.get("delegating") == "delegating"
+            ]
+            receiving = [
+                r["account"] for r in snapshot if r["account"] not in delegating
+            ]
+        return RCListOfAccounts.construct(
+            all=delegating + receiving, delegating=delegating, receiving=receiving
+        )
+
+    @staticmethod
+    def fill_forward(
+        snapshot: List[dict], last_readings: Dict[str, dict], snapshot_time: datetime
+    ) -> List[dict]:
+        """
+        Only changed readings are stored (see store_filter): every account
+        read before and missing from `snapshot` is as it was last stored,
+        carried forward to the snapshot's time as `rc_history.fill_forward`
+        does for the dashboard.
+        """
+        in_snapshot = {r["account"] for r in snapshot}
+        carried = [
+            {**reading, "timestamp": snapshot_time}
+            for account, reading in last_readings.items()
+            if account not in in_snapshot
+        ]
+        for reading in snapshot:
+            last_readings[reading["account"]] = reading
+        return carried + snapshot
+
+    async def run(self, snapshots: Iterable[List[dict]]) -> ReplayReport:
+        report = ReplayReport()
+        # Only changed readings are stored, the previous one can be up to a
+        # heartbeat back: its time keeps the delta's extrapolation honest
+        old_percents: Dict[str, float] = {}
+        old_timestamps: Dict[str, datetime] = {}
+        last_seen: Dict[str, Tuple[datetime, float]] = {}
+        last_readings: Dict[str, dict] = {}
+        start = timer()
+        set_clock(self.clock)
+        try:
+            for snapshot in snapshots:
+                if not snapshot:
+                    continue
+                snapshot_time = max(as_utc(r["timestamp"]) for r in snapshot)
+                self.clock.advance_to(snapshot_time)
+                report.start = report.start or min(
+                    as_utc(r["timestamp"]) for r in snapshot
+                )
+                report.end = snapshot_time
+                report.readings += len(snapshot)
+                snapshot = self.fill_forward(snapshot, last_readings, snapshot_time)
+                accounts = self.accounts_from_snapshot(snapshot)
+
+                rcs = []
+                for reading in snapshot:
+                    account = reading["account"]
+                    deleg_out = (
+                        self.deleg_out(account)
+                        if account in accounts.delegating
+                        else None
+                    )
+                    rc = reading_to_rc_account(
+                        reading,
+                        old_percents.get(account, 0.0),
+                        deleg_out,
+                        old_timestamps.get(account),
+                    )
+                    rc.delegating = (
+                        RCAccType.DELEGATING
+                        if account in accounts.delegating
+                        else RCAccType.TARGET
+                    )
+                    rcs.append(rc)
+                    self._track_alarm(report, rc, last_seen)
+                    old_percents[account] = rc.real_mana_percent
+                    old_timestamps[account] = rc.timestamp
+
+                all_data = RCAllData(accounts=accounts, rcs=rcs)
+                all_data.timestamp = snapshot_time
+                await all_data.update_delegations()
+                if self.governor:
+                    self.governor.apply(all_data)
+                await all_data.get_payload_for_pending_delegations(
+                    send_json=True, broadcaster=self.sink, store_delegations=False
+                )
+                for dd in all_data.pending_delegations:
+                    self.deleg_state[(dd.acc_from, dd.acc_to)] = int(dd.delegated_rc)
+                    report.decisions.append(
+                        ReplayDecision(
+                            timestamp=snapshot_time,
+                            acc_from=dd.acc_from,
+                            acc_to=dd.acc_to,
+                            delegated_rc=int(dd.delegated_rc),
+                            cut=dd.cut,
+                        )
+                    )
+                report.cycles += 1
+        finally:
+            set_clock(None)
+        report.broadcasts = len(self.sink.broadcasts)
+        if self.governor:
+            report.suppressed = dict(self.governor.suppressed)
+        report.wall_seconds = timer() - start
+        return report
+
+    @staticmethod
+    def _track_alarm(
+        report: ReplayReport,
+        rc: RCAccount,
+        last_seen: Dict[str, Tuple[datetime, float]],
+    ):
+        """Time between readings counts as below alarm if the earlier one was"""
+        previous = last_seen.get(rc.account)
+        if previous and previous[1] < Config.RC_PCT_ALARM_LEVEL:
+            seconds = (rc.timestamp - previous[0]).total_seconds()
+            report.seconds_below_alarm[rc.account] = (
+                report.seconds_below_alarm.get(rc.account, 0.0) + seconds
+            )
+        last_seen[rc.account] = (rc.timestamp, rc.real_mana_percent)
+
+
+async def load_delegations(before: datetime) -> List[RCDirectDelegation]:
+    """The most recent stored delegation for each delegator and target pair"""
+    db_delegations = get_mongo_db(Config.DB_NAME_DELEG)
+    cursor = db_delegations.aggregate(
+        [
+            {"$match": {"timestamp": {"$lt": before}}},
+            {"$sort": {"timestamp": 1}},
+            {
+                "$group": {
+                    "_id": {"acc_from": "$acc_from", "acc_to": "$acc_to"},
+                    "delegated_rc": {"$last": "$delegated_rc"},
+                }
+            },
+        ]
+    )
+    return [
+        RCDirectDelegation.parse_obj(
+            {
+                "from": doc["_id"]["acc_from"],
+                "to": doc["_id"]["acc_to"],
+                "delegated_rc": doc["delegated_rc"],
+            }
+        )
+        async for doc in cursor
+    ]
+
+
+async def replay_from_db(
+    start: datetime, end: datetime, hysteresis: bool = False
+) -> ReplayReport:
+    readings = await load_readings(start, end)
+    delegations = await load_delegations(before=start)
+    logging.info(f"Replaying {len(readings):,} readings from {start} to {end}")
+    replay = RCReplay(
+        delegations=delegations,
+        governor=DelegationGovernor() if hysteresis else None,
+    )
+    return await replay.run(group_snapshots(readings))
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Replay stored RC readings through the delegation policy"
+    )
+    parser.add_argument("--days", type=float, default=7, help="Days of history")
+    parser.add_argument(
+        "--end",
+        type=datetime.fromisoformat,
+        default=None,
+        help="End of the replay (ISO format, UTC), defaults to now",
+    )
+    parser.add_argument(
+        "--hysteresis",
+        action="store_true",
+        help="Put the decisions through the hysteresis policy",
+    )
+    parsed = parser.parse_args(args)
+    end = parsed.end or datetime.utcnow()
+    start = end - timedelta(days=parsed.days)
+    report = asyncio.run(replay_from_db(start, end, hysteresis=parsed.hysteresis))
+    report.log_output(logging.info)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Retention tiers for the RC history. Raw readings expire from Mongo after
+RETENTION_DAYS (a TTL on the timeseries collection), hourly rollups of them
+are kept for ROLLUP_RETENTION_DAYS and delegations for DELEG_RETENTION_DAYS.
+With ARCHIVE_DIR set, readings and delegations are written to Parquet (see
+archive) before they expire: the TTL is pushed back by ARCHIVE_GRACE_DAYS so
+the archiver always gets there first.
+
+The bot runs this every RETENTION_CHECK_SECS, or run it once:
+
+    python -m hive_rc_auto.helpers.retention
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from statistics import fmean
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from pydantic import BaseModel
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from hive_rc_auto.helpers.archive import (
+    READING_SCHEMA,
+    READINGS,
+    days_between,
+    partition_path,
+    read_archive,
+    write_partition,
+)
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import DB_NAME, get_utc_now_timestamp
+from hive_rc_auto.helpers.rc_history import bucket_frame, combine_history
+from hive_rc_auto.helpers.rc_schema import find_bucketed, iter_readings
+
+DAY_SECS = 24 * 3600
+HOUR = timedelta(hours=1)
+
+
+class RetentionPolicy(BaseModel):
+    collection: str
+    days: float
+    # Archive directory for the collection, empty isn't archived
+    archive: str = ""
+
+    @property
+    def expire_after_secs(self) -> Optional[int]:
+        """The TTL for the collection, None keeps documents for ever"""
+        if not self.days:
+            return None
+        grace = Config.ARCHIVE_GRACE_DAYS if self.archive and Config.ARCHIVE_DIR else 0
+        return int((self.days + grace) * DAY_SECS)
+
+
+def readings_collection() -> str:
+    if Config.RC_HISTORY_SCHEMA == "compact":
+        return Config.DB_NAME_COMPACT
+    return Config.DB_NAME
+
+
+def policies() -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy(
+            collection=readings_collection(),
+            days=Config.RETENTION_DAYS,
+            archive=READINGS,
+        ),
+        RetentionPolicy(
+            collection=Config.DB_NAME_ROLLUP, days=Config.ROLLUP_RETENTION_DAYS
+        ),
+        RetentionPolicy(
+            collection=Config.DB_NAME_DELEG,
+            days=Config.DELEG_RETENTION_DAYS,
+            archive="deleg",
+        ),
+    ]
+
+
+def apply_ttl(db: Database, policy: RetentionPolicy) -> bool:
+    """Set (or clear) the collection's TTL if it has changed, True if it had"""
+    info = list(db.list_collections(filter={"name": policy.collection}))
+    if not info:
+        return False
+    current = info[0].get("options", {}).get("expireAfterSeconds")
+    wanted = policy.expire_after_secs
+    if current == wanted:
+        return False
+    db.command(
+        "collMod",
+        policy.collection,
+        expireAfterSeconds=wanted if wanted is not None else "off",
+    )
+    logging.info(f"TTL on {policy.collection}: {current} -> {wanted} seconds")
+    return True
+
+
+def rollup(readings: Iterable[dict], hour: datetime) -> List[dict]:
+    """One document per account for `hour` from its readings (legacy shape)"""
+    by_account: Dict[str, List[dict]] = {}
+    for reading in readings:
+        by_account.setdefault(reading["account"], []).append(reading)
+    rollups = []
+    for account, account_readings in by_account.items():
+        last = account_readings[-1]
+        percents = [r["real_mana_percent"] for r in account_readings]
+        rollups.append(
+            {
+                "timestamp": hour,
+                "account": account,
+                "delegating": last.get("delegating"),
+                "status": last.get("status"),
+                "max_rc": last["max_rc"],
+                "delegated_rc": last.get("delegated_rc"),
+                "received_delegated_rc": last.get("received_delegated_rc"),
+                "real_mana": fmean(r["real_mana"] for r in account_readings),
+                "real_mana_percent": fmean(percents),
+                "min_percent": min(percents),
+                "max_percent": max(percents),
+                "readings": len(account_readings),
+            }
+        )
+    return rollups
+
+
+def floor_hour(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def build_rollups(db: Database, now: datetime) -> int:
+    """Roll up each whole hour since the last one rolled up, returns the hours"""
+    newest = db[Config.DB_NAME_ROLLUP].find_one({}, sort=[("timestamp", -1)])
+    if newest:
+        hour = newest["timestamp"] + HOUR
+    else:
+        oldest = next(iter_readings(db, datetime.min, batch_size=1), None)
+        if oldest is None:
+            return 0
+        hour = floor_hour(oldest["timestamp"])
+    hours = 0
+    while hour + HOUR <= now:
+        docs = rollup(iter_readings(db, hour, hour + HOUR), hour)
+        if docs:
+            db[Config.DB_NAME_ROLLUP].insert_many(docs)
+        hour += HOUR
+        hours += 1
+    if hours:
+        logging.info(f"Rolled up {hours} hours to {hour:%Y-%m-%d %H:%M}")
+    return hours
+
+
+def archive_expiring(db: Database, policy: RetentionPolicy, now: datetime) -> int:
+    """
+    Write each whole day older than the policy's retention and not yet
+    archived to Parquet, returns the documents written.
+    """
+    if not (Config.ARCHIVE_DIR and policy.archive and policy.days):
+        return 0
+    collection = db[policy.collection]
+    oldest = collection.find_one({}, sort=[("timestamp", 1)])
+    if oldest is None:
+        return 0
+    written = 0
+    for day in days_between(oldest["timestamp"], now - timedelta(days=policy.days)):
+        path = partition_path(policy.archive, day)
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        if policy.archive == READINGS:
+            docs = iter_readings(db, start, end)
+            schema = READING_SCHEMA
+        else:
+            docs = collection.find(
+                {"timestamp": {"$gte": start, "$lt": end}}, {"_id": 0}
+            ).sort("timestamp", 1)
+            schema = None
+        try:
+            if not os.path.exists(path):
+                rows = write_partition(docs, path, schema=schema)
+                written += rows
+                logging.info(f"Archived {rows:,} from {policy.collection} {day}")
+        except OSError as ex:
+            # Stop here rather than leave a gap: the TTL grace allows retries
+            logging.error(f"Archiving {policy.collection} {day} failed: {ex}")
+            break
+    return written
+
+
+def run_retention(now: datetime = None):
+    """Apply the TTLs, archive what's due and bring the rollups up to date"""
+    now = now or get_utc_now_timestamp().replace(tzinfo=None)
+    client = MongoClient(Config.DB_CONNECTION)
+    try:
+        db = client[DB_NAME]
+        build_rollups(db, now)
+        for policy in policies():
+            archive_expiring(db, policy, now)
+            apply_ttl(db, policy)
+    finally:
+        client.close()
+
+
+def rollups_query(start: datetime, end: datetime) -> dict:
+    """The hourly rollups `read_history` falls back on before the live ones"""
+    return {"timestamp": {"$gte": start, "$lt": end}}
+
+
+def read_history(
+    db: Database, start: datetime, end: datetime = None, bucket_secs: int = 0
+) -> pd.DataFrame:
+    """
+    The readings from `start` (to `end`) wherever they are now: the live
+    collection, and before its oldest reading the Parquet archive or, without
+    one, the hourly rollups. Averaged into `bucket_secs` buckets if given.
+    """
+    live = pd.DataFrame(find_bucketed(db, start, end, bucket_secs))
+    parts = [live]
+    oldest_live = (
+        live.timestamp.min().to_pydatetime()
+        if not live.empty
+        else end or datetime.utcnow()
+    )
+    if start < oldest_live:
+        older = pd.DataFrame()
+        if Config.ARCHIVE_DIR:
+            older = read_archive(READINGS, start, oldest_live)
+        if older.empty:
+            older = pd.DataFrame(
+                db[Config.DB_NAME_ROLLUP].find(
+                    rollups_query(start, oldest_live), {"_id": 0}
+                )
+            )
+        parts.insert(0, bucket_frame(older, bucket_secs))
+    return combine_history(parts)
+
+
+async def keep_maintaining_history():
+    """Run the retention tiers in a thread every RETENTION_CHECK_SECS"""
+    while True:
+        try:
+            await asyncio.to_thread(run_retention)
+        except Exception as ex:
+            logging.error(f"Retention run failed: {ex}")
+        await asyncio.sleep(Config.RETENTION_CHECK_SECS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(module)-14s %(lineno) 5d : %(message)s",
+        datefmt="%m-%dT%H:%M:%S",
+    )
+    run_retention()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import (
+    CYCLE_LAG_SECONDS,
+    MISSED_TICKS_TOTAL,
+    STAGE_DEADLINE_EXCEEDED_TOTAL,
+)
+
+T = TypeVar("T")
+
+
+class MissedTickPolicy(str, Enum):
+    SKIP = "skip"  # Drop the missed starts and carry on along the grid
+    CATCH_UP = "catch_up"  # Run every missed start back to back
+    RESET = "reset"  # Start now and move the grid to here
+
+
+class StageDeadlineExceeded(Exception):
+    pass
+
+
+class FixedRateScheduler:
+    """
+    Cycle starts on a fixed grid, `period` seconds apart, however long each
+    cycle takes, so the sampling interval doesn't drift by the time the work
+    takes. `policy` decides what happens to starts missed while a cycle ran
+    late. `clock` and `sleep` can be replaced to drive it from a test.
+    """
+
+    def __init__(
+        self,
+        period: float = None,
+        policy: MissedTickPolicy = None,
+        start: float = None,
+        clock: Callable[[], float] = None,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+    ) -> None:
+        self.period = period or Config.UPDATE_FREQUENCY_SECS
+        self.policy = MissedTickPolicy(policy or Config.MISSED_TICK_POLICY)
+        self.clock = clock or asyncio.get_running_loop().time
+        self.sleep = sleep
+        self.next_time = self.clock() if start is None else start
+        self.tick = 0
+        self.missed = 0
+        # The last missed start counted, catching up runs the same late
+        # starts back to back and mustn't count them again
+        self.counted_until = self.next_time
+
+    async def wait_next(self) -> int:
+        """Wait for the next start and return its tick number"""
+        now = self.clock()
+        if now < self.next_time:
+            await self.sleep(self.next_time - now)
+        else:
+            late_from = max(self.next_time, self.counted_until)
+            missed = int((now - late_from) // self.period)
+            if missed:
+                self.counted_until = late_from + missed * self.period
+                self.missed += missed
+                MISSED_TICKS_TOTAL.inc(missed)
+                logging.warning(
+                    f"Cycle running late: {missed} start(s) missed "
+                    f"({self.policy.value})"
+                )
+                if self.policy == MissedTickPolicy.SKIP:
+                    self.tick += missed
+                    self.next_time += missed * self.period
+                elif self.policy == MissedTickPolicy.RESET:
+                    self.next_time = now
+        CYCLE_LAG_SECONDS.set(max(self.clock() - self.next_time, 0))
+        tick = self.tick
+        self.tick += 1
+        self.next_time += self.period
+        return tick
+
+
+async def with_deadline(stage: str, work: Awaitable[T], deadline: Optional[float]) -> T:
+    """
+    Await `work`, giving up after `deadline` seconds (None or 0 waits for
+    ever). Work running in a thread carries on to the end in the background,
+    only the wait for it is abandoned.
+    """
+    if not deadline:
+        return await work
+    try:
+        return await asyncio.wait_for(work, timeout=deadline)
+    except asyncio.TimeoutError:
+        STAGE_DEADLINE_EXCEEDED_TOTAL.inc(stage=stage)
+        logging.error(f"Stage {stage} abandoned after its {deadline}s deadline")
+        raise StageDeadlineExceeded(stage)
@@ -0,0 +1,212 @@
+"""
+Split the tracked accounts between several bot workers.
+
+Accounts map to shards on a consistent hash ring so changing the number of
+shards only moves a few accounts. Workers claim shards through lease
+documents in Mongo, renewing them every cycle: when a worker dies its leases
+expire and the others pick the shards up, when a worker joins the others
+give back anything over their fair share.
+
+Every worker reads the delegating accounts (it needs their RC and existing
+delegations to decide) but a broadcast from a delegator is only made while
+holding that delegator's lease, so only one worker at a time ever writes
+delegations for it.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import socket
+from bisect import bisect
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Set
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCListOfAccounts,
+    get_mongo_db,
+)
+
+
+class LeaseTimeout(Exception):
+    pass
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of `num_shards` shards with virtual nodes"""
+
+    def __init__(self, num_shards: int, replicas: int = 64) -> None:
+        self.num_shards = num_shards
+        points = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(num_shards)
+            for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_of(self, account: str) -> int:
+        index = bisect(self._keys, _hash(account)) % len(self._keys)
+        return self._shards[index]
+
+    def accounts_in(self, accounts: Iterable[str], shards: Set[int]) -> List[str]:
+        return [acc for acc in accounts if self.shard_of(acc) in shards]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardLeases:
+    """
+    Lease documents, one per shard (`shard:<n>`), per worker (`worker:<id>`,
+    a heartbeat used to work out the fair share) and per delegator while it
+    broadcasts (`delegator:<name>`). A lease is held while `owner` is this
+    worker and `expires` is in the future.
+    """
+
+    def __init__(
+        self,
+        num_shards: int = None,
+        worker_id: str = None,
+        lease_secs: float = None,
+        collection: AsyncIOMotorCollection = None,
+    ) -> None:
+        self.ring = HashRing(num_shards or Config.WORKER_SHARDS)
+        self.worker_id = worker_id or Config.WORKER_ID or default_worker_id()
+        self.lease_secs = lease_secs or Config.LEASE_SECS
+        self.collection = collection
+        self.owned: Set[int] = set()
+        # A lease is shared by every task of this worker, these keep them
+        # out of each other (the alarm fast path and last cycle's broadcast)
+        self._delegator_locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def leases(self) -> AsyncIOMotorCollection:
+        if self.collection is None:
+            self.collection = get_mongo_db(Config.DB_NAME_LEASES)
+        return self.collection
+
+    @staticmethod
+    def now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def claim(self, key: str, lease_secs: float = None) -> bool:
+        """Take or renew the lease on `key`, False if someone else holds it"""
+        now = self.now()
+        expires = now + timedelta(seconds=lease_secs or self.lease_secs)
+        try:
+            doc = await self.leases.find_one_and_update(
+                {
+                    "_id": key,
+                    "$or": [{"owner": self.worker_id}, {"expires": {"$lt": now}}],
+                },
+                {"$set": {"owner": self.worker_id, "expires": expires}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The document exists and is held by another worker
+            return False
+        return bool(doc) and doc["owner"] == self.worker_id
+
+    async def release(self, key: str):
+        await self.leases.delete_one({"_id": key, "owner": self.worker_id})
+
+    async def live_workers(self) -> int:
+        return await self.leases.count_documents(
+            {"_id": {"$regex": "^worker:"}, "expires": {"$gte": self.now()}}
+        )
+
+    async def rebalance(self) -> Set[int]:
+        """
+        Call once a cycle: heartbeat, renew the shards still held, give back
+        any over the fair share and claim free or expired ones up to it.
+        """
+        await self.claim(f"worker:{self.worker_id}")
+        fair_share = math.ceil(self.ring.num_shards / max(await self.live_workers(), 1))
+        owned = set()
+        for shard in sorted(self.owned):
+            if len(owned) < fair_share and await self.claim(f"shard:{shard}"):
+                owned.add(shard)
+            else:
+                await self.release(f"shard:{shard}")
+        # Start from a different shard on each worker so they don't all
+        # contend for the same free ones
+        start = _hash(self.worker_id) % self.ring.num_shards
+        for i in range(self.ring.num_shards):
+            if len(owned) >= fair_share:
+                break
+            shard = (start + i) % self.ring.num_shards
+            if shard not in owned and await self.claim(f"shard:{shard}"):
+                owned.add(shard)
+        if owned != self.owned:
+            logging.info(f"Worker {self.worker_id} shards: {sorted(owned)}")
+        self.owned = owned
+        return owned
+
+    async def release_all(self):
+        """Hand everything back on a clean shutdown"""
+        for shard in self.owned:
+            await self.release(f"shard:{shard}")
+        await self.release(f"worker:{self.worker_id}")
+        self.owned = set()
+
+    def owns(self, account: str) -> bool:
+        return self.ring.shard_of(account) in self.owned
+
+    def filter_accounts(self, accounts: RCListOfAccounts) -> RCListOfAccounts:
+        """Every delegator (needed to decide) and the targets in owned shards"""
+        receiving = self.ring.accounts_in(accounts.receiving, self.owned)
+        return RCListOfAccounts.construct(
+            all=list(set(accounts.delegating + receiving)),
+            delegating=accounts.delegating,
+            receiving=receiving,
+        )
+
+    def owned_readings(self, rcs: List[RCAccount]) -> List[RCAccount]:
+        """Each reading is stored by the worker owning the account's shard"""
+        return [rc for rc in rcs if self.owns(rc.account)]
+
+    @asynccontextmanager
+    async def delegator_lock(
+        self, delegator: str, timeout: float = None
+    ) -> AsyncIterator[None]:
+        """
+        Hold the delegator's lease for the length of a broadcast, first
+        waiting for any other task of this worker broadcasting for it.
+        """
+        timeout = Config.UPDATE_FREQUENCY_SECS / 2 if timeout is None else timeout
+        key = f"delegator:{delegator}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        local = self._delegator_locks.setdefault(delegator, asyncio.Lock())
+        if local.locked():
+            try:
+                await asyncio.wait_for(local.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise LeaseTimeout(f"{key} held by another task of this worker")
+        else:
+            await local.acquire()
+        try:
+            while not await self.claim(key, lease_secs=max(timeout, 30)):
+                if loop.time() > deadline:
+                    raise LeaseTimeout(f"{key} held by another worker")
+                await asyncio.sleep(0.5)
+            try:
+                yield
+            finally:
+                await self.release(key)
+        finally:
+            local.release()
@@ -0,0 +1,48 @@
+"""
+Startup phases: each one is timed and reported in
+`rc_bot_startup_phase_seconds`, so the time to the first cycle can be seen
+and the slow phases found. Phases which don't depend on each other are run
+at the same time by the bot.
+"""
+import logging
+from time import perf_counter
+from typing import Awaitable, List, Tuple, TypeVar
+
+from hive_rc_auto.helpers.metrics import STARTUP_PHASE_SECONDS
+from hive_rc_auto.helpers.rc_delegation import RCListOfAccounts, RCPolicy
+
+T = TypeVar("T")
+
+
+async def timed_phase(phase: str, work: Awaitable[T]) -> T:
+    """Await one phase of startup, reporting how long it took"""
+    start = perf_counter()
+    try:
+        return await work
+    finally:
+        seconds = perf_counter() - start
+        STARTUP_PHASE_SECONDS.set(seconds, phase=phase)
+        logging.info(f"Startup {phase}: {seconds:.2f}s")
+
+
+def fallback_apps(
+    policies: List[RCPolicy],
+) -> List[Tuple[RCListOfAccounts, RCPolicy]]:
+    """
+    Accounts to start with when the lookup is too slow and there's no
+    checkpoint: the configured delegating accounts and no targets yet.
+    """
+    apps = []
+    for policy in policies:
+        delegating = [policy.primary_account] + [
+            acc for acc in policy.delegating_accounts if acc != policy.primary_account
+        ]
+        apps.append(
+            (
+                RCListOfAccounts.construct(
+                    all=list(delegating), delegating=delegating, receiving=[]
+                ),
+                policy,
+            )
+        )
+    return apps
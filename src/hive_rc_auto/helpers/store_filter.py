@@ -0,0 +1,83 @@
+"""
+Change-only storage of RC readings. Most targets sit at or near 100% doing
+nothing and writing the same reading for them every cycle is most of the
+history collection. A reading is only stored when it has moved since the
+last one stored for that account, or when the heartbeat is due so the
+dashboard can tell a quiet account from one that's no longer tracked. The
+dashboard fills the gaps forward (see `rc_history.fill_forward`).
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import bson
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import STORED_BYTES_TOTAL, STORED_READINGS_TOTAL
+from hive_rc_auto.helpers.rc_delegation import RCAccount
+
+# Any change in these is stored
+EXACT_FIELDS = (
+    "status",
+    "delegating",
+    "max_rc",
+    "delegated_rc",
+    "received_delegated_rc",
+)
+
+
+class ReadingFilter:
+    """
+    Picks the readings worth storing: `tolerance` is how far (percentage
+    points) `real_mana_percent` may move before it's stored again,
+    `heartbeat_secs` how long an account can go without a reading stored.
+    A heartbeat of 0 stores everything.
+    """
+
+    def __init__(self, tolerance: float = None, heartbeat_secs: float = None) -> None:
+        self.tolerance = Config.STORE_TOLERANCE_PCT if tolerance is None else tolerance
+        self.heartbeat_secs = (
+            Config.STORE_HEARTBEAT_SECS if heartbeat_secs is None else heartbeat_secs
+        )
+        self.last_stored: Dict[str, Tuple[datetime, dict]] = {}
+
+    def changed(self, rc: RCAccount) -> bool:
+        last = self.last_stored.get(rc.account)
+        if not last or not self.heartbeat_secs:
+            return True
+        stored_at, stored = last
+        if (rc.timestamp - stored_at).total_seconds() >= self.heartbeat_secs:
+            return True
+        if abs(rc.real_mana_percent - stored["real_mana_percent"]) > self.tolerance:
+            return True
+        return any(getattr(rc, field) != stored[field] for field in EXACT_FIELDS)
+
+    def select(self, rcs: List[RCAccount]) -> List[RCAccount]:
+        """The readings to store this cycle, counting what's saved"""
+        keep = []
+        written_bytes = skipped_bytes = 0
+        for rc in rcs:
+            size = len(bson.encode(rc.db_format))
+            if self.changed(rc):
+                keep.append(rc)
+                written_bytes += size
+                self.last_stored[rc.account] = (
+                    rc.timestamp,
+                    {
+                        "real_mana_percent": rc.real_mana_percent,
+                        **{field: getattr(rc, field) for field in EXACT_FIELDS},
+                    },
+                )
+            else:
+                skipped_bytes += size
+        STORED_READINGS_TOTAL.inc(len(keep), result="written")
+        STORED_READINGS_TOTAL.inc(len(rcs) - len(keep), result="skipped")
+        STORED_BYTES_TOTAL.inc(written_bytes, result="written")
+        STORED_BYTES_TOTAL.inc(skipped_bytes, result="skipped")
+        if rcs:
+            logging.info(
+                f"Storing {len(keep)}/{len(rcs)} readings, "
+                f"{skipped_bytes / 1024:.1f} kB of "
+                f"{(written_bytes + skipped_bytes) / 1024:.1f} kB unchanged"
+            )
+        return keep
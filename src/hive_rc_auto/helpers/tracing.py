@@ -0,0 +1,312 @@
+"""
+OpenTelemetry style tracing for the bot.
+
+Spans nest through a context variable so tasks created inside a span (the
+background store) become its children. Finished spans are handed to a worker
+thread which writes them as JSON lines to a file or posts them in batches to a
+collector. `TRACE_EXPORT` in the config picks where they go:
+
+    TRACE_EXPORT=file:/app/traces/traces.jsonl
+    TRACE_EXPORT=http://collector:4318/v1/traces
+
+Run this module to start a stand-in collector or to show the slowest cycles
+from a trace file broken down span by span.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from hive_rc_auto.helpers.config import Config
+
+
+class Span:
+    def __init__(
+        self, name: str, parent: Optional["Span"] = None, **attributes: Any
+    ) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any):
+        self.events.append(
+            {"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes}
+        )
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            # Copies: the span is exported as it was when it ended
+            "attributes": dict(self.attributes),
+            "events": list(self.events),
+            "status": self.status,
+        }
+
+
+class FileSpanExporter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + "\n")
+
+
+class HttpSpanExporter:
+    def __init__(self, url: str, timeout: float = 5.0) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    def export(self, spans: List[Dict[str, Any]]):
+        try:
+            httpx.post(
+                self.url,
+                content=json.dumps({"spans": spans}, default=str),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+            )
+        except httpx.HTTPError as ex:
+            logging.warning(f"Trace export to {self.url} failed: {ex}")
+
+
+class SpanProcessor:
+    """Batch finished spans and export them from a worker thread"""
+
+    def __init__(self, exporter, max_batch: int = 256) -> None:
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def on_end(self, span: Span):
+        self.queue.put(span.to_dict())
+
+    def _worker(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            spans = [span for span in batch if span is not None]
+            if spans:
+                try:
+                    self.exporter.export(spans)
+                except Exception as ex:
+                    logging.warning(f"Trace export failed: {ex}")
+            if None in batch:
+                return
+
+    def shutdown(self, timeout: float = 5.0):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_processor: Optional[SpanProcessor] = None
+
+
+def configure_tracing(export: str = None) -> Optional[SpanProcessor]:
+    """Set up the exporter from `export` or Config.TRACE_EXPORT, empty is off"""
+    global _processor
+    export = Config.TRACE_EXPORT if export is None else export
+    if _processor:
+        _processor.shutdown()
+        _processor = None
+    if not export:
+        return None
+    if export.startswith("file:"):
+        exporter = FileSpanExporter(export[len("file:") :])
+    elif export.startswith(("http://", "https://")):
+        exporter = HttpSpanExporter(export)
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORT: {export}")
+    _processor = SpanProcessor(exporter)
+    logging.info(f"Tracing spans exported to {export}")
+    return _processor
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """
+    A child of the current span which stays open until `end_span`, for work
+    which carries on past the block that started it. None when tracing is off.
+    """
+    if not _processor:
+        return None
+    return Span(name, parent=_current_span.get(), **attributes)
+
+
+def end_span(ended: Optional[Span], error: BaseException = None):
+    if ended is None:
+        return
+    if error is not None:
+        ended.status = "error"
+        ended.set_attribute("error", f"{type(error).__name__}: {error}")
+    ended.end_ns = time.time_ns()
+    if _processor:
+        _processor.on_end(ended)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time the `with` block as a child of the current span. Yields None and does
+    nothing else when tracing is off.
+    """
+    new_span = start_span(name, **attributes)
+    if new_span is None:
+        yield None
+        return
+    token = _current_span.set(new_span)
+    error = None
+    try:
+        yield new_span
+    except BaseException as ex:
+        error = ex
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(new_span, error)
+
+
+@contextmanager
+def attach(parent: Optional[Span]) -> Iterator[Optional[Span]]:
+    """
+    Make `parent` the current span inside the `with` block, so work done for
+    a cycle by another task (a later pipeline stage) joins the cycle's trace.
+    """
+    token = _current_span.set(parent)
+    try:
+        yield parent
+    finally:
+        _current_span.reset(token)
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_trace(spans: List[Dict[str, Any]]) -> List[str]:
+    """One line per span, children indented under their parents"""
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        parent = s["parentSpanId"] if s["parentSpanId"] in ids else None
+        children.setdefault(parent, []).append(s)
+    lines = []
+
+    def walk(parent_id: Optional[str], depth: int):
+        for s in sorted(
+            children.get(parent_id, []), key=lambda x: x["startTimeUnixNano"]
+        ):
+            duration = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6
+            detail = " ".join(
+                f"{k}={v}" for k, v in s["attributes"].items() if k != "error"
+            )
+            error = (
+                f" ERROR {s['attributes'].get('error')}" if s["status"] != "ok" else ""
+            )
+            lines.append(
+                f"{duration:>10.1f} ms {'  ' * depth}{s['name']} {detail}{error}"
+            )
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+    return lines
+
+
+def slowest_traces(
+    spans: List[Dict[str, Any]], root_name: str = "update_cycle", count: int = 3
+) -> List[List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        traces.setdefault(s["traceId"], []).append(s)
+    roots = sorted(
+        (s for s in spans if s["name"] == root_name and not s["parentSpanId"]),
+        key=lambda s: s["endTimeUnixNano"] - s["startTimeUnixNano"],
+        reverse=True,
+    )
+    return [traces[root["traceId"]] for root in roots[:count]]
+
+
+def run_collector(host: str, port: int, path: str):
+    """A stand-in collector which appends every span it's sent to a file"""
+    exporter = FileSpanExporter(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            exporter.export(body.get("spans", []))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"Collector listening on {host}:{port} writing to {path}")
+    server.serve_forever()
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bot trace tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    collector = commands.add_parser("collector", help="Run a stand-in collector")
+    collector.add_argument("--host", default="0.0.0.0")
+    collector.add_argument("--port", type=int, default=4318)
+    collector.add_argument("--out", default="traces.jsonl")
+    show = commands.add_parser("slowest", help="Break down the slowest cycles")
+    show.add_argument("path")
+    show.add_argument("--count", type=int, default=3)
+    parsed = parser.parse_args(args)
+    if parsed.command == "collector":
+        run_collector(parsed.host, parsed.port, parsed.out)
+    else:
+        for trace in slowest_traces(load_spans(parsed.path), count=parsed.count):
+            print("\n".join(format_trace(trace)))
+            print()
+
+
+if __name__ == "__main__":
+    main()
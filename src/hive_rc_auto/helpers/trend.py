@@ -0,0 +1,113 @@
+"""
+RC trend per account from the last few readings instead of just the last
+two. The two point `delta_percent` jumps about with every burst of posting
+and each jump can trigger a delegation; a least squares slope over a short
+window follows the real drain.
+
+Readings live in fixed size NumPy ring buffers, one row per account, so the
+memory used per account doesn't grow however long the bot runs and the
+slopes of every account are worked out in one go.
+"""
+import math
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+
+from hive_rc_auto.helpers.checkpoint import RCReading
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import RCAccount
+
+Reading = Union[RCAccount, RCReading]
+
+
+class RCTrend:
+    """
+    The last `window` readings of every account and their slopes in percent
+    per hour. A window under 2 turns it off and the two point delta stays.
+    """
+
+    def __init__(self, window: int = None) -> None:
+        self.window = Config.TREND_WINDOW if window is None else window
+        self.rows: Dict[str, int] = {}
+        self.times = np.full((0, max(self.window, 1)), np.nan)
+        self.percents = np.full((0, max(self.window, 1)), np.nan)
+        self.next_slot = np.zeros(0, dtype=int)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window >= 2
+
+    def _rows_for(self, accounts: List[str]) -> np.ndarray:
+        new = [acc for acc in dict.fromkeys(accounts) if acc not in self.rows]
+        if new:
+            start = len(self.rows)
+            for i, acc in enumerate(new):
+                self.rows[acc] = start + i
+            blank = np.full((len(new), self.window), np.nan)
+            self.times = np.vstack([self.times, blank])
+            self.percents = np.vstack([self.percents, blank.copy()])
+            self.next_slot = np.concatenate([self.next_slot, np.zeros(len(new), int)])
+        return np.array([self.rows[acc] for acc in accounts], dtype=int)
+
+    def retain(self, accounts: Iterable[str]):
+        """Drop the accounts no longer tracked"""
+        accounts = set(accounts)
+        keep = [acc for acc in self.rows if acc in accounts]
+        if len(keep) == len(self.rows):
+            return
+        rows = np.array([self.rows[acc] for acc in keep], dtype=int)
+        self.times = self.times[rows]
+        self.percents = self.percents[rows]
+        self.next_slot = self.next_slot[rows]
+        self.rows = {acc: i for i, acc in enumerate(keep)}
+
+    def update(self, readings: List[Reading]):
+        """Add one reading per account, the oldest in its row drops out"""
+        if not self.enabled or not readings:
+            return
+        readings = list({r.account: r for r in readings}.values())
+        rows = self._rows_for([r.account for r in readings])
+        times = np.array([r.timestamp.timestamp() for r in readings])
+        # A reading already held (a restored checkpoint) isn't added twice
+        last = self.times[rows, (self.next_slot[rows] - 1) % self.window]
+        fresh = ~(times <= last)
+        rows, times = rows[fresh], times[fresh]
+        percents = np.array([r.real_mana_percent for r in readings])[fresh]
+        slots = self.next_slot[rows]
+        self.times[rows, slots] = times
+        self.percents[rows, slots] = percents
+        self.next_slot[rows] = (slots + 1) % self.window
+
+    def slopes(self, accounts: List[str]) -> np.ndarray:
+        """
+        Least squares slope of each account's readings in percent per hour,
+        nan for an account with fewer than two readings.
+        """
+        result = np.full(len(accounts), np.nan)
+        known = [i for i, acc in enumerate(accounts) if acc in self.rows]
+        if not known:
+            return result
+        rows = np.array([self.rows[accounts[i]] for i in known], dtype=int)
+        t = self.times[rows]
+        y = self.percents[rows]
+        valid = ~np.isnan(t)
+        n = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t_mean = np.nansum(t, axis=1) / n
+            y_mean = np.nansum(y, axis=1) / n
+            dt = np.where(valid, t - t_mean[:, None], 0.0)
+            dy = np.where(valid, y - y_mean[:, None], 0.0)
+            var = (dt * dt).sum(axis=1)
+            slope = (dt * dy).sum(axis=1) / var * 3600
+        slope[(n < 2) | (var == 0)] = np.nan
+        result[known] = slope
+        return result
+
+    def apply(self, rcs: List[RCAccount]):
+        """Replace each account's two point delta with its trend"""
+        if not self.enabled or not rcs:
+            return
+        slopes = self.slopes([rc.account for rc in rcs])
+        for rc, slope in zip(rcs, slopes):
+            if not math.isnan(slope):
+                rc.set_delta(float(slope))
@@ -8,15 +8,25 @@ from typing import Tuple
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
-from plotly.subplots import make_subplots
-from pymongo import MongoClient
+from streamlit_autorefresh import st_autorefresh
 
 from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.dashboard_cache import (
+    cached_find,
+    mongo_client,
+    show_cache_stats,
+    snap,
+    ttl_cache,
+)
+from hive_rc_auto.helpers.incremental import incremental_frame
 from hive_rc_auto.helpers.markdown.static_text import import_text
 from hive_rc_auto.helpers.pingslurp_accounts import (
     dataframe_all_transactions_by_account,
 )
-from hive_rc_auto.helpers.rc_delegation import RCAccount
+from hive_rc_auto.helpers.rc_charts import AccountFrames, build_rc_graph
+from hive_rc_auto.helpers.rc_delegation import DB_NAME, RCAccount, delegations_query
+from hive_rc_auto.helpers.rc_history import bucket_secs_for, fill_forward
+from hive_rc_auto.helpers.retention import read_history
 
 ALL_MARKDOWN = import_text()
 
@@ -54,106 +64,11 @@ def rc_guage(rc: RCAccount):
     return fig
 
 
-def build_rc_graph(
-    df: pd.DataFrame,
-    df_rc_changes: pd.DataFrame,
-    hive_acc: str,
-    df_size: pd.DataFrame = pd.DataFrame(),
-) -> go.Figure:
-    start = timer()
-    dfa = df[df.account == hive_acc]
-    # dfa.resample('10T').mean(numeric_only=True)
-    # logging.info(f"Resample {hive_acc} - {timer()-start:.2f}s")
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(
-        go.Scatter(
-            x=dfa.age_hours,
-            y=dfa["real_mana_percent"],
-            name="RC %",
-            text=[f"{ts:%d %H:%M}" for ts in dfa.index],
-            hovertemplate="-%{x:.1f} hours<br>%{text}" + "<br>%{y:,.1f}%",
-            line=dict(color="blue"),
-        ),
-        secondary_y=True,
-    )
-    if st.session_state.show_size:
-        if not df_size.empty:
-            df_size["age_hours"] = (
-                datetime.utcnow() - df_size.index
-            ).total_seconds() / 3600
-            df_size_a = df_size[df_size.account == hive_acc]
-            if not df_size_a.empty:
-                fig.update_yaxes(title_text="<b>Bytes/min</b>", secondary_y=False)
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_size_a.age_hours,
-                        y=df_size_a["total_size"]
-                        .rolling("4H", closed="neither")
-                        .mean(),
-                        name="Bytes/min",
-                        text=[f"{ts:%d %H:%M}" for ts in df_size_a.index],
-                        hovertemplate="-%{x:.1f} hours<br>%{text}"
-                        + "<br>%{y:,.0f} bytes",
-                        line=dict(color="lightgreen"),
-                    ),
-                    secondary_y=False,
-                )
-    if not st.session_state.show_size or df_size.empty:
-        fig.update_yaxes(title_text="<b>RC</b>", secondary_y=False)
-        fig.add_trace(
-            go.Scatter(
-                x=dfa.age_hours,
-                y=dfa["real_mana"],
-                name="RC",
-                text=[f"{ts:%d %H:%M}" for ts in dfa.index],
-                hovertemplate="-%{x:.1f} hours<br>%{text}" + "<br>%{y:,.3s}",
-                line=dict(color="red"),
-            ),
-            secondary_y=False,
-        )
-
-    # Very expensive shows each change
-    if not df_rc_changes.empty:
-        df_rc_change = df_rc_changes[df_rc_changes.account == hive_acc]
-        if not df_rc_change.empty:
-            for index, row in df_rc_change.iterrows():
-                linecolor = "g" if row.cut else "up"
-                fig.add_vline(
-                    x=row.age_hours,
-                    line_width=0.6,
-                    line_dash="dash",
-                    line_color="green",
-                )
-
-    # Set x-axis title
-    fig.update_xaxes(title_text=f"Age (hours) - {hive_acc}")
-
-    last_reading = dfa.real_mana_percent.iloc[-1]
-    fig.update_layout(
-        title_text=(
-            f"<b>{hive_acc}</b> RC's<br>"
-            f"Last reading: <b>{last_reading:.1f}%</b><br>"
-            f"Time: {dfa.last_valid_index():%H:%M:%S}"
-        )
-    )
-    # Set y-axes titles
-    fig.update_yaxes(title_text="<b>RC %</b>", secondary_y=True)
-
-    yaxes_range_max = dfa["real_mana_percent"].max() + 5
-    fig.update_yaxes(range=[0, yaxes_range_max], secondary_y=True)
-
-    fig.update_layout(
-        showlegend=True,
-    )
-    # Position Text
-    fig.update_layout(legend_x=0.2, legend_y=0.85)
-    fig.update_layout(title_x=0.2, title_y=0.2)
-
-    fig.update_layout(margin={"autoexpand": True, "b": 0, "t": 0, "l": 0, "r": 0})
-    fig.update_xaxes(autorange="reversed")
-    # fig.show()
-    logging.info(f"Time to build graph {hive_acc} - {timer()-start:.4f}s")
-    return fig
+@ttl_cache
+def load_history(earliest_data: datetime, bucket_secs: int) -> pd.DataFrame:
+    """The readings since `earliest_data` (snapped to a cycle), shared by viewers"""
+    client = mongo_client(os.getenv("DB_CONNECTION"))
+    return read_history(client[DB_NAME], earliest_data, bucket_secs=bucket_secs)
 
 
 def get_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
@@ -161,31 +76,43 @@ def get_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
     # df -> main data of rc levels
     # df_rc_changes -> data for changes.
     DB_CONNECTION = os.getenv("DB_CONNECTION")
-    CLIENT = MongoClient(DB_CONNECTION)
-    db_rc_ts = CLIENT["rc_podping"][Config.DB_NAME]
 
     if st.session_state.hours == "All":
         time_limit = timedelta(weeks=4)
     else:
         time_limit = timedelta(hours=st.session_state.hours)
-    earliest_data = datetime.utcnow() - time_limit
 
-    result = db_rc_ts.find(
-        {"real_mana": {"$ne": None}, "timestamp": {"$gte": earliest_data}}, {"_id": 0}
+    # Longer ranges are averaged by Mongo to about DASHBOARD_POINTS an account.
+    # The window is kept between refreshes, each only fetches the newest rows.
+    start = timer()
+    bucket_secs = bucket_secs_for(time_limit.total_seconds())
+    period = max(bucket_secs, Config.UPDATE_FREQUENCY_SECS)
+    readings = incremental_frame(
+        ("rc_readings", time_limit), time_limit, timedelta(seconds=period)
+    )
+    history = readings.update(lambda since: load_history(snap(since), bucket_secs))
+    df = fill_forward(history.copy(), until=datetime.utcnow(), period=period)
+    logging.info(
+        f"{readings.fetched:,} new readings, {len(df):,} in {bucket_secs // 60} "
+        f"minute buckets - {timer() - start:.2f}s"
     )
-
-    df = pd.DataFrame(result)
     if not df.empty:
         df["age"] = datetime.utcnow() - df.timestamp
         df.set_index("timestamp", inplace=True)
         df["age_hours"] = df["age"].dt.total_seconds() / 3600
 
-        db_rc_ts_deleg = CLIENT["rc_podping"][Config.DB_NAME_DELEG]
-        result2 = db_rc_ts_deleg.find(
-            {"timestamp": {"$gte": earliest_data}}, {"_id": 0}
-        )
-
-        df_rc_changes = pd.DataFrame(result2)
+        changes = incremental_frame(("rc_changes", time_limit), time_limit)
+        df_rc_changes = changes.update(
+            lambda since: pd.DataFrame(
+                cached_find(
+                    DB_CONNECTION,
+                    DB_NAME,
+                    Config.DB_NAME_DELEG,
+                    filter=delegations_query(since),
+                    projection={"_id": 0},
+                )
+            )
+        ).copy()
         if not df_rc_changes.empty:
             df_rc_changes["age"] = datetime.utcnow() - df_rc_changes.timestamp
             df_rc_changes.set_index("timestamp", inplace=True)
@@ -233,40 +160,25 @@ def grid(ncol: int = 2):
     df_size = dataframe_all_transactions_by_account(
         time_frame="minute", time_range=time_range, livetest_filter=livetest_filter
     )
-    df_delegating = df[df["delegating"] == "delegating"]
-    del_accounts = df_delegating.account.unique()
-    all_accounts = df[df.delegating == "target"].account.unique()
-    all_accounts.sort()
-    filtered_accounts = []
-
-    for hive_acc in all_accounts:
-        dfa = df[df.account == hive_acc]
-        if dfa.real_mana_percent.iloc[-1] < 95 and (
-            not dfa.delegating.iloc[-1] == "delegating"
-        ):
-            filtered_accounts.append(hive_acc)
+    frames = AccountFrames(df, df_rc_changes, df_size)
 
     st.subheader("Delegating Accounts")
     cols = st.columns(ncol)
     for i, hive_acc in zip(
         cycle(range(ncol)),
-        del_accounts,
+        frames.delegating,
     ):
         col = cols[i % ncol]
-        dfa = df[df.account == hive_acc]
-        col.plotly_chart(
-            build_rc_graph(df, df_rc_changes, hive_acc), use_container_width=True
-        )
+        col.plotly_chart(build_rc_graph(frames, hive_acc), use_container_width=True)
     st.subheader("Receiving Accounts")
     cols2 = st.columns(ncol)
     for i, hive_acc in zip(
         cycle(range(ncol)),
-        filtered_accounts,
+        frames.receiving(),
     ):
         col = cols2[i % ncol]
-        dfa = df[df.account == hive_acc]
         col.plotly_chart(
-            build_rc_graph(df, df_rc_changes, hive_acc, df_size),
+            build_rc_graph(frames, hive_acc, st.session_state.show_size),
             use_container_width=True,
         )
 
@@ -298,6 +210,8 @@ if __name__ == "__main__":
         layout="wide",
         initial_sidebar_state="expanded",
     )
+    # Rerun each cycle, only the new rows are fetched
+    st_autorefresh(interval=Config.UPDATE_FREQUENCY_SECS * 1000, key="rc_overview")
     cols = st.columns(3)
     cols[0].subheader("RC Levels")
     hours_selectbox()
@@ -305,6 +219,7 @@ if __name__ == "__main__":
     st.sidebar.markdown(ALL_MARKDOWN["rc_overview"])
     # try:
     main_loop()
+    show_cache_stats()
 
     df = st.session_state.df_rc_changes
     df.sort_values(by="age", ascending=True, inplace=True)
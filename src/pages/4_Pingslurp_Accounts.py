@@ -1,6 +1,5 @@
 import logging
 import os
-import re
 from datetime import datetime, timedelta
 from timeit import default_timer as timer
 
@@ -9,20 +8,25 @@ import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 from plotly.subplots import make_subplots
-from pymongo import MongoClient
+from streamlit_autorefresh import st_autorefresh
 
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.dashboard_cache import show_cache_stats
+from hive_rc_auto.helpers.downsample import capped
+from hive_rc_auto.helpers.incremental import incremental_frame, update_rolling
 from hive_rc_auto.helpers.markdown.static_text import import_text
 from hive_rc_auto.helpers.pingslurp_accounts import (
+    LIVETEST_FILTERS,
     dataframe_all_transactions_by_account,
     dataframe_all_transactions_no_account,
     hour_trans_by_account,
     hour_trans_no_account,
+    since_match,
 )
 
 ALL_MARKDOWN = import_text()
 
 DB_CONNECTION = os.getenv("PINGSLURP_DB_CONNECTION")
-CLIENT = MongoClient(DB_CONNECTION)
 
 
 start = timer()
@@ -36,12 +40,6 @@ metrics_options = {
 }
 
 
-livetest_filter_options = {
-    "Exclude Live Tests": {"$match": {"metadata.id": re.compile(r"pp_.*")}},
-    "Include Live Tests": {"$match": {}},
-    "Only Live Tests": {"$match": {"metadata.id": re.compile(r"pplt_.*")}},
-}
-
 time_range_days = [10, 30, 60, 90, 120]
 
 
@@ -78,13 +76,15 @@ st.set_page_config(
     initial_sidebar_state="auto",
     menu_items=None,
 )
+# Rerun each cycle, only the new rows are fetched
+st_autorefresh(interval=Config.UPDATE_FREQUENCY_SECS * 1000, key="pingslurp_accounts")
 
 st.session_state.metric = st.sidebar.selectbox(
     label="Metric", options=metrics_options.keys(), help="Metric to show"
 )
 st.session_state.livetest_choice = st.sidebar.selectbox(
     label="Live Tests",
-    options=livetest_filter_options.keys(),
+    options=LIVETEST_FILTERS.keys(),
     index=0,
     help=(
         "Show/Hide Live Tests. "
@@ -103,9 +103,7 @@ st.session_state.display_all_choice = st.sidebar.selectbox(
 )
 st.session_state.display_all = display_all_options[st.session_state.display_all_choice]
 
-st.session_state.livetest_filter = livetest_filter_options[
-    st.session_state.livetest_choice
-]
+st.session_state.livetest_filter = LIVETEST_FILTERS[st.session_state.livetest_choice]
 
 st.session_state.time_range_choice = st.sidebar.selectbox(
     label="Time Range", options=time_range_options.keys()
@@ -121,13 +119,48 @@ metric_desc = choice
 
 time_frame = "hour"
 
-df = dataframe_all_transactions_by_account()
+ROLLING = {"avg24H": "24h", "avg7D": "7D"}
+
+
+def newest_first(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+    return df.set_index("timestamp").sort_index(ascending=False, kind="stable")
+
+
+# Kept between refreshes for this range and filter, each refresh only
+# fetches from the start of the latest hour on
+filters = (st.session_state.time_range_days, st.session_state.livetest_choice)
+window = timedelta(days=st.session_state.time_range_days)
+by_account = incremental_frame(("accounts", *filters), window, timedelta(hours=1))
+no_account = incremental_frame(("accounts_total", *filters), window, timedelta(hours=1))
+df = by_account.update(
+    lambda since: dataframe_all_transactions_by_account(
+        time_range=since_match(since)
+    ).reset_index()
+)
+df = newest_first(df)
 st.title(body=f"{metric_desc} Sent per Hour by each account")
 if df.empty:
     st.markdown(f"## No data")
 
 else:
-    df_no_account = dataframe_all_transactions_no_account()
+    df_no_account = no_account.update(
+        lambda since: dataframe_all_transactions_no_account(
+            time_range=since_match(since)
+        ).reset_index()
+    )
+    for column in metrics_options.values():
+        update_rolling(
+            df_no_account,
+            column,
+            {f"{name}_{column}": offset for name, offset in ROLLING.items()},
+            no_account.since,
+        )
+    df_no_account = newest_first(df_no_account)
+    logging.info(
+        f"Accounts refreshed: {by_account.fetched} + {no_account.fetched} rows"
+    )
 
     all_accounts_desc = (
         df.groupby("account")[metric].describe().sort_values(by="mean", ascending=False)
@@ -138,49 +171,58 @@ else:
     if st.session_state.display_all:
         for account in all_accounts:
             g_start = timer()
+            dfa = df[df.account == account]
+            x, y, text, size = capped(
+                dfa.index,
+                dfa[metric],
+                dfa["account"],
+                5 + dfa.total_size / 2**14,
+                method="minmax",
+            )
             fig.add_trace(
                 go.Scatter(
-                    x=df[df.account == account].index,
-                    y=df[df.account == account][metric],
+                    x=x,
+                    y=y,
                     name=account,
-                    text=df[df.account == account]["account"],
+                    text=text,
                     mode="markers",
-                    marker=dict(
-                        size=5 + df[df.account == account].total_size / 2**14
-                    ),
+                    marker=dict(size=size),
                     hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
                 ),
                 secondary_y=True,
             )
             logging.info(f"Graph for {account}: {timer() - g_start}")
     fig.update_layout(hoverlabel=dict(font_size=12, font_family="Rockwell"))
+    x, y = capped(df_no_account.index, df_no_account[metric])
     fig.add_trace(
         go.Scatter(
-            x=df_no_account.index,
-            y=df_no_account[metric],
+            x=x,
+            y=y,
             name=metric_desc,
-            text=[f"{metric_desc}" for _ in df_no_account.index],
+            text=[f"{metric_desc}" for _ in x],
             hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
         )
     )
 
+    x, y = capped(df_no_account.index, df_no_account[f"avg24H_{metric}"])
     fig.add_trace(
         go.Scatter(
-            x=df_no_account.index[::-1],
-            y=df_no_account[metric][::-1].rolling(24).mean(),
+            x=x,
+            y=y,
             name=f"{metric_desc} (24H avg)",
-            text=[f"{metric_desc} (24H avg)" for _ in df_no_account.index],
+            text=[f"{metric_desc} (24H avg)" for _ in x],
             hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
         )
     )
 
     if st.session_state.time_range_days > 29:
+        x, y = capped(df_no_account.index, df_no_account[f"avg7D_{metric}"])
         fig.add_trace(
             go.Scatter(
-                x=df_no_account.index[::-1],
-                y=df_no_account[metric][::-1].rolling("7D").mean(),
+                x=x,
+                y=y,
                 name=f"{metric_desc} (7 day avg)",
-                text=[f"{metric_desc} (7 day avg)" for _ in df_no_account.index],
+                text=[f"{metric_desc} (7 day avg)" for _ in x],
                 hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
             )
         )
@@ -215,19 +257,30 @@ else:
 number_hours = 4
 
 time_frame = "minute"
-time_limit = datetime.utcnow() - timedelta(hours=number_hours)
-result_hour = hour_trans_by_account(time_limit=time_limit, time_frame=time_frame)
-df_hour = pd.DataFrame(result_hour)
+window_hour = timedelta(hours=number_hours)
+minutes = timedelta(minutes=1)
+by_account_hour = incremental_frame(
+    ("accounts_hour", st.session_state.livetest_choice), window_hour, minutes
+)
+no_account_hour = incremental_frame(
+    ("accounts_hour_total", st.session_state.livetest_choice), window_hour, minutes
+)
+# The queries match after their time, a minute earlier keeps the first one whole
+df_hour = by_account_hour.update(
+    lambda since: pd.DataFrame(hour_trans_by_account(since - minutes, time_frame))
+)
+df_hour = newest_first(df_hour)
 st.title(f"Last {number_hours} hours of {metric_desc} per minute by Accounts")
 if df_hour.empty:
     st.markdown("## No data")
 
 else:
-    df_hour.set_index("timestamp", inplace=True)
     df_hour["total_size_kb"] = df_hour["total_size"] / (1024 * 1)
 
-    df_hour_no_account = pd.DataFrame(hour_trans_no_account(time_limit, time_frame))
-    df_hour_no_account.set_index("timestamp", inplace=True)
+    df_hour_no_account = no_account_hour.update(
+        lambda since: pd.DataFrame(hour_trans_no_account(since - minutes, time_frame))
+    )
+    df_hour_no_account = newest_first(df_hour_no_account)
     df_hour_no_account["total_size_kb"] = df_hour_no_account["total_size"] / (1024 * 1)
 
     all_accounts_desc_hour = (
@@ -242,36 +295,46 @@ else:
     if st.session_state.display_all:
         for account in all_accounts:
             g_start = timer()
+            dfa = df_hour[df_hour.account == account]
+            x, y, text, size = capped(
+                dfa.index,
+                dfa[metric],
+                dfa["account"],
+                10 + dfa["marker_size"],
+                method="minmax",
+            )
             fig2.add_trace(
                 go.Scatter(
-                    x=df_hour[df_hour.account == account].index,
-                    y=df_hour[df_hour.account == account][metric],
+                    x=x,
+                    y=y,
                     name=account,
                     mode="markers",
-                    marker=dict(
-                        size=10 + df_hour[df_hour.account == account]["marker_size"]
-                    ),
-                    text=df_hour[df_hour.account == account]["account"],
+                    marker=dict(size=size),
+                    text=text,
                     hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
                 ),
                 secondary_y=True,
             )
             logging.info(f"Graph for {account}: {timer() - g_start}")
+    x, y = capped(df_hour_no_account.index, df_hour_no_account[metric])
     fig2.add_trace(
         go.Scatter(
-            x=df_hour_no_account.index,
-            y=df_hour_no_account[metric],
+            x=x,
+            y=y,
             name=metric_desc,
-            text=[f"{metric_desc}" for _ in df_no_account.index],
+            text=[f"{metric_desc}" for _ in x],
             hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
         )
     )
+    x, y = capped(
+        df_hour_no_account.index, df_hour_no_account[metric].rolling("1H").mean()
+    )
     fig2.add_trace(
         go.Scatter(
-            x=df_hour_no_account.index,
-            y=df_hour_no_account[metric].rolling("1H").mean(),
+            x=x,
+            y=y,
             name=f"{metric_desc} (1hr Avg)",
-            text=[f"{metric_desc} (1hr Avg)" for _ in df_no_account.index],
+            text=[f"{metric_desc} (1hr Avg)" for _ in x],
             hovertemplate="%{text}" + "<br>%{x}" + "<br>%{y:,.0f}",
         )
     )
@@ -304,3 +367,4 @@ else:
     )
     cols[1].dataframe(all_accounts_desc_hour)
     logging.info(f"Everything done: {timer() - start}")
+show_cache_stats()
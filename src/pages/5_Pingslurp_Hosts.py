@@ -5,104 +5,62 @@ from datetime import datetime, timedelta
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
-from pymongo import MongoClient
+from streamlit_autorefresh import st_autorefresh
 
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.dashboard_cache import cached_aggregate, show_cache_stats
+from hive_rc_auto.helpers.downsample import capped
+from hive_rc_auto.helpers.incremental import incremental_frame, update_rolling
 from hive_rc_auto.helpers.markdown.static_text import import_text
+from hive_rc_auto.helpers.pingslurp_accounts import iris_per_hour_pipeline
 
 ALL_MARKDOWN = import_text()
 
 DB_CONNECTION = os.getenv("PINGSLURP_DB_CONNECTION")
-CLIENT = MongoClient(DB_CONNECTION)
 
 time_frame = "minute"
 bin_size = 60
-start_date = datetime.utcnow() - timedelta(hours=72)
-end_data = datetime.utcnow() - timedelta(hours=0)
-result = CLIENT["pingslurp"]["hosts_ts"].aggregate(
-    [
-        {
-            "$match": {
-                "$and": [
-                    {"timestamp": {"$gt": start_date}},
-                    {"timestamp": {"$lt": end_data}},
-                ]
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "host": "$metadata.host",
-                    "timestamp": {
-                        "$dateTrunc": {
-                            "date": "$timestamp",
-                            "unit": time_frame,
-                            "timezone": "Asia/Jerusalem",
-                            "binSize": bin_size,
-                        }
-                    },
-                },
-                "timestamp": {"$first": "$timestamp"},
-                "host": {"$first": "$metadata.host"},
-                "total_iris": {"$sum": 1},
-            }
-        },
-        {
-            "$sort": {
-                "_id.timestamp": -1,
-            }
-        },
-    ]
-)
+window = timedelta(hours=72)
+ROLLING = {"avg4H": "4h", "avg8H": "8h", "avg24H": "24h"}
 
-result_total = CLIENT["pingslurp"]["hosts_ts"].aggregate(
-    [
-        {
-            "$match": {
-                "$and": [
-                    {"timestamp": {"$gt": start_date}},
-                    {"timestamp": {"$lt": end_data}},
-                ]
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "timestamp": {
-                        "$dateTrunc": {
-                            "date": "$timestamp",
-                            "unit": time_frame,
-                            "timezone": "Asia/Jerusalem",
-                            "binSize": bin_size,
-                        }
-                    }
-                },
-                "timestamp": {"$first": "$timestamp"},
-                "total_iris": {"$sum": 1},
-            }
-        },
-        {
-            "$sort": {
-                "_id.timestamp": -1,
-            }
-        },
-    ]
-)
 
-df = pd.DataFrame(result)
-df.set_index(["timestamp"], inplace=True)
-df_total = pd.DataFrame(result_total)
-df_total.set_index(["timestamp"], inplace=True)
+def iris_per_hour(since: datetime, by_host: bool) -> pd.DataFrame:
+    """IRIs per hour (and host) from `since`, oldest first"""
+    result = cached_aggregate(
+        DB_CONNECTION,
+        "pingslurp",
+        "hosts_ts",
+        iris_per_hour_pipeline(since, by_host, time_frame, bin_size),
+    )
+    return pd.DataFrame(result).drop(columns="_id", errors="ignore")
+
 
-df_total["cum_iris"] = df_total["total_iris"].cumsum()
-df_total["avg4H"] = df_total["total_iris"].rolling(window="4H", center=True).mean()
-df_total["avg8H"] = df_total["total_iris"].rolling(window="8H", center=True).mean()
-df_total["avg24H"] = df_total["total_iris"].rolling(window="24H", center=True).mean()
+st_autorefresh(interval=Config.UPDATE_FREQUENCY_SECS * 1000, key="pingslurp_hosts")
 
-result_recent_ping = CLIENT["pingslurp"]["hosts_ts"].aggregate(
+# Kept between refreshes, each one only fetches the latest hour on
+hosts_frame = incremental_frame("hosts_by_host", window, timedelta(hours=1))
+total_frame = incremental_frame("hosts_total", window, timedelta(hours=1))
+df = hosts_frame.update(lambda since: iris_per_hour(since, by_host=True))
+df = update_rolling(
+    df, "total_iris", ROLLING, hosts_frame.since, by="host", center=True
+)
+df_total = total_frame.update(lambda since: iris_per_hour(since, by_host=False))
+df_total = update_rolling(
+    df_total, "total_iris", ROLLING, total_frame.since, center=True
+)
+logging.info(f"Hosts refreshed: {hosts_frame.fetched} + {total_frame.fetched} rows")
+# Newest first
+df = df.set_index("timestamp").sort_index(ascending=False, kind="stable")
+df_total = df_total.set_index("timestamp").sort_index(ascending=False, kind="stable")
+
+result_recent_ping = cached_aggregate(
+    DB_CONNECTION,
+    "pingslurp",
+    "hosts_ts",
     [
         {"$sort": {"timestamp": -1}},
         {"$group": {"_id": "$metadata.host", "timestamp": {"$first": "$timestamp"}}},
-    ]
+    ],
 )
 df_recent_ping = pd.DataFrame(result_recent_ping)
 df_recent_ping["age"] = datetime.utcnow() - df_recent_ping["timestamp"]
@@ -112,18 +70,6 @@ df_recent_ping.sort_index(inplace=True, ascending=False)
 
 hosts_sorted = df.host.unique()
 
-for host in df.host.unique():
-    df.loc[df.host == host, "cum_iris"] = df[df.host == host]["total_iris"].cumsum()
-    df.loc[df.host == host, "avg4H"] = (
-        df[df.host == host]["total_iris"].rolling(window="4H", center=True).mean()
-    )
-    df.loc[df.host == host, "avg8H"] = (
-        df[df.host == host]["total_iris"].rolling(window="8H", center=True).mean()
-    )
-    df.loc[df.host == host, "avg24H"] = (
-        df[df.host == host]["total_iris"].rolling(window="24H", center=True).mean()
-    )
-
 
 summary = []
 
@@ -239,14 +185,10 @@ for i, host in enumerate(hosts.iloc[1:]):
 
 
 fig_graph = go.Figure()
-fig_graph.add_trace(
-    go.Scatter(x=df_total.index, y=df_total.avg8H, mode="lines", name="8hr Moving Avg")
-)
-fig_graph.add_trace(
-    go.Scatter(
-        x=df_total.index, y=df_total.total_iris, mode="markers", name="Total IRIs/hour"
-    )
-)
+x, y = capped(df_total.index, df_total.avg8H)
+fig_graph.add_trace(go.Scatter(x=x, y=y, mode="lines", name="8hr Moving Avg"))
+x, y = capped(df_total.index, df_total.total_iris, method="minmax")
+fig_graph.add_trace(go.Scatter(x=x, y=y, mode="markers", name="Total IRIs/hour"))
 
 # df_recent_ping.set_index("timestamp", inplace=True)
 # for index, ping in df_recent_ping.iterrows():
@@ -269,3 +211,4 @@ for index, ping in df_recent_ping.iterrows():
 # st.dataframe(df)
 # st.dataframe(df_recent_ping[['host','timestamp']])
 st.dataframe(df_summary)
+show_cache_stats()
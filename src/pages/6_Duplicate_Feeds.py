@@ -8,14 +8,17 @@ import httpx
 import pandas as pd
 import streamlit as st
 import xmltodict
-from pymongo import MongoClient
 
+from hive_rc_auto.helpers.dashboard_cache import (
+    cached_aggregate,
+    cached_find,
+    show_cache_stats,
+)
 from hive_rc_auto.helpers.markdown.static_text import import_text
 from hive_rc_auto.helpers.podcastindex import get_podcast_index_info
 
 ALL_MARKDOWN = import_text()
 DB_CONNECTION = os.getenv("PINGSLURP_DB_CONNECTION")
-CLIENT = MongoClient(DB_CONNECTION)
 
 st.set_page_config(
     page_title="Duplicated Feeds",
@@ -41,7 +44,10 @@ duplicate_count = st.sidebar.slider(
 start_date = datetime.now(timezone.utc) + timedelta(hours=start_hours)
 end_data = datetime.now(timezone.utc) + timedelta(hours=end_hours)
 
-result = CLIENT["pingslurp"]["all_podpings"].aggregate(
+result = cached_aggregate(
+    DB_CONNECTION,
+    "pingslurp",
+    "all_podpings",
     [
         {
             "$match": {
@@ -61,7 +67,7 @@ result = CLIENT["pingslurp"]["all_podpings"].aggregate(
         {"$group": {"_id": "$iris", "count": {"$sum": 1}}},
         {"$match": {"count": {"$gte": duplicate_count}}},
         {"$sort": {"count": -1}},
-    ]
+    ],
 )
 st.sidebar.markdown(ALL_MARKDOWN["duplicated_feeds"])
 st.header(
@@ -166,7 +172,9 @@ async def check_show_period(check_show: str) -> pd.DataFrame:
         ],
     }
     sort = list({"timestamp": -1}.items())
-    one_show = CLIENT["pingslurp"]["all_podpings"].find(filter=filter, sort=sort)
+    one_show = cached_find(
+        DB_CONNECTION, "pingslurp", "all_podpings", filter=filter, sort=sort
+    )
     df_one_show = pd.DataFrame(one_show)
     periodicity = df_one_show.timestamp.diff(periods=-1).agg(
         func=["min", "max", "mean", "median", "std"]
@@ -176,3 +184,4 @@ async def check_show_period(check_show: str) -> pd.DataFrame:
 
 
 asyncio.run(lookup_all(df))
+show_cache_stats()
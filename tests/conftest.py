@@ -5,17 +5,29 @@ def pytest_addoption(parser):
     parser.addoption(
         "--runslow", action="store_true", default=False, help="run slow tests"
     )
+    parser.addoption(
+        "--runmongo",
+        action="store_true",
+        default=False,
+        help="run tests needing a live MongoDB on DB_CONNECTION",
+    )
 
 
 def pytest_configure(config):
     config.addinivalue_line("markers", "slow: mark test as slow to run")
+    config.addinivalue_line(
+        "markers", "mongo: mark test as needing a live MongoDB on DB_CONNECTION"
+    )
 
 
 def pytest_collection_modifyitems(config, items):
-    if config.getoption("--runslow"):
-        # --runslow given in cli: do not skip slow tests
-        return
-    skip_slow = pytest.mark.skip(reason="need --runslow option to run")
+    # Skipped unless asked for with --runslow or --runmongo
+    skips = {}
+    if not config.getoption("--runslow"):
+        skips["slow"] = pytest.mark.skip(reason="need --runslow option to run")
+    if not config.getoption("--runmongo"):
+        skips["mongo"] = pytest.mark.skip(reason="need --runmongo option to run")
     for item in items:
-        if "slow" in item.keywords:
-            item.add_marker(skip_slow)
+        for keyword, skip in skips.items():
+            if keyword in item.keywords:
+                item.add_marker(skip)
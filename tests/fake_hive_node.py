@@ -0,0 +1,352 @@
+"""
+A local stand-in for a Hive API node.
+
+Speaks enough JSON-RPC for the bot: `find_rc_accounts`,
+`list_rc_direct_delegations`, `get_accounts`, `get_following`,
+`get_dynamic_global_properties` and the broadcast calls. Each request can be
+delayed and a share of them failed so node failover and slow nodes can be
+measured repeatably. Lighthive is synchronous so the server runs on its own
+thread rather than on the event loop.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple, Union
+
+from pydantic import BaseModel, Field
+
+ONE_BILLION = 1_000_000_000
+
+
+class FakeAccount(BaseModel):
+    name: str
+    max_rc: int
+    current_mana: int
+    delegated_rc: int = 0
+    received_delegated_rc: int = 0
+    last_update_time: int = Field(
+        default_factory=lambda: int(datetime.now(timezone.utc).timestamp())
+    )
+
+    def rc_account(self) -> dict:
+        return {
+            "account": self.name,
+            "rc_manabar": {
+                "current_mana": self.current_mana,
+                "last_update_time": self.last_update_time,
+            },
+            "max_rc_creation_adjustment": {
+                "amount": "0",
+                "precision": 6,
+                "nai": "@@000000037",
+            },
+            "max_rc": self.max_rc,
+            "delegated_rc": self.delegated_rc,
+            "received_delegated_rc": self.received_delegated_rc,
+        }
+
+    def account(self) -> dict:
+        return {
+            "name": self.name,
+            "posting": {"weight_threshold": 1, "account_auths": [], "key_auths": []},
+            "voting_manabar": {
+                "current_mana": self.current_mana,
+                "last_update_time": self.last_update_time,
+            },
+        }
+
+
+class FakeChain:
+    """The state the fake node serves, shared across all its threads"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.accounts: Dict[str, FakeAccount] = {}
+        self.following: Dict[str, List[str]] = defaultdict(list)
+        self.delegations: Dict[Tuple[str, str], int] = {}
+        self.head_block_number = 70_000_000
+        self.broadcasts: List[dict] = []
+
+    def add_account(self, account: FakeAccount):
+        self.accounts[account.name] = account
+
+    def delegate(self, acc_from: str, acc_to: str, amount: int):
+        old_amount = self.delegations.get((acc_from, acc_to), 0)
+        if old_amount == amount:
+            raise FakeRPCError(
+                f"plugin exception: same amount of RC already exist "
+                f"({acc_from} -> {acc_to})"
+            )
+        self.delegations[(acc_from, acc_to)] = amount
+        change = amount - old_amount
+        if acc_from in self.accounts:
+            self.accounts[acc_from].delegated_rc += change
+        if acc_to in self.accounts:
+            self.accounts[acc_to].received_delegated_rc += change
+            self.accounts[acc_to].max_rc += change
+
+
+class FakeRPCError(Exception):
+    pass
+
+
+def synthetic_chain(
+    num_targets: int,
+    primary_account: str,
+    delegating_accounts: List[str] = None,
+    seed: int = 42,
+) -> FakeChain:
+    """
+    A chain where the primary account follows `num_targets` accounts with a
+    spread of RC levels, some low, some high and most in range.
+    """
+    rng = random.Random(seed)
+    chain = FakeChain()
+    for name in [primary_account] + (delegating_accounts or []):
+        max_rc = 100_000 * ONE_BILLION
+        chain.add_account(
+            FakeAccount(name=name, max_rc=max_rc, current_mana=int(max_rc * 0.95))
+        )
+    for n in range(num_targets):
+        name = f"target-{n:05d}"
+        max_rc = rng.randint(5, 500) * ONE_BILLION
+        percent = rng.choice([5, 15, 25, 28, 40, 60, 90])
+        chain.add_account(
+            FakeAccount(
+                name=name, max_rc=max_rc, current_mana=int(max_rc * percent / 100)
+            )
+        )
+        chain.following[primary_account].append(name)
+        if percent > 30:
+            chain.delegate(primary_account, name, max_rc // 4)
+    return chain
+
+
+class FakeHiveNode:
+    """
+    Run a fake node on a local port. `latency` is either a number of seconds
+    for every call or a dict of method name to seconds. `failure_rate` is the
+    share of requests answered with `failure_mode`: "http" (503) or "rpc"
+    (a JSON-RPC error). `failing_paths` fail every request sent to those paths
+    so a single node in a list can be taken down.
+    """
+
+    def __init__(
+        self,
+        chain: FakeChain,
+        latency: Union[float, Dict[str, float]] = 0.0,
+        failure_rate: float = 0.0,
+        failure_mode: str = "http",
+        failing_paths: List[str] = None,
+        seed: int = 42,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.chain = chain
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.failing_paths = failing_paths or []
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def node_urls(self, count: int) -> List[str]:
+        """Several distinct node urls all served by this fake node"""
+        return [f"{self.url}/node{n}" for n in range(count)]
+
+    def start(self) -> "FakeHiveNode":
+        self.thread.start()
+        logging.info(f"Fake Hive node running at {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeHiveNode":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _delay(self, method: str):
+        if isinstance(self.latency, dict):
+            # Accept either "rc_api.find_rc_accounts" or "find_rc_accounts"
+            seconds = self.latency.get(
+                method, self.latency.get(method.split(".")[-1], 0.0)
+            )
+        else:
+            seconds = self.latency
+        if seconds:
+            time.sleep(seconds)
+
+    def _should_fail(self, path: str) -> bool:
+        if path in self.failing_paths:
+            return True
+        return self.failure_rate > 0 and self.rng.random() < self.failure_rate
+
+    def _handler_class(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                requests = body if isinstance(body, list) else [body]
+                method = requests[0].get("method", "") if requests else ""
+                node._delay(method)
+                if node._should_fail(self.path):
+                    node.failures[method] += 1
+                    if node.failure_mode == "http":
+                        self.send_error(503, "Injected failure")
+                        return
+                    responses = [
+                        node._error(req, "Injected failure") for req in requests
+                    ]
+                else:
+                    responses = [node.handle(req) for req in requests]
+                answer = responses if isinstance(body, list) else responses[0]
+                data = json.dumps(answer).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _error(self, request: dict, message: str) -> dict:
+        return {
+            "jsonrpc": "2.0",
+            "error": {"code": -32000, "message": message},
+            "id": request.get("id"),
+        }
+
+    def handle(self, request: dict) -> dict:
+        method = request.get("method", "")
+        params = request.get("params", [])
+        if method == "call":
+            api, name, params = params
+        elif "." in method:
+            api, name = method.split(".", 1)
+        else:
+            api, name = "condenser_api", method
+        self.calls[name] += 1
+        handler = getattr(self, f"rpc_{name}", None)
+        if not handler:
+            return self._error(request, f"Unknown method {api}.{name}")
+        try:
+            with self.chain.lock:
+                result = handler(params)
+        except FakeRPCError as ex:
+            return self._error(request, str(ex))
+        return {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+
+    @staticmethod
+    def _arg(params: Any, key: str, position: int, default: Any = None) -> Any:
+        if isinstance(params, dict):
+            return params.get(key, default)
+        if isinstance(params, list) and len(params) > position:
+            return params[position]
+        return default
+
+    def rpc_find_rc_accounts(self, params: Any) -> dict:
+        names = self._arg(params, "accounts", 0, [])
+        return {
+            "rc_accounts": [
+                self.chain.accounts[name].rc_account()
+                for name in names
+                if name in self.chain.accounts
+            ]
+        }
+
+    def rpc_list_rc_direct_delegations(self, params: Any) -> dict:
+        acc_from, acc_to = self._arg(params, "start", 0, ["", ""])
+        limit = self._arg(params, "limit", 1, 100)
+        matches = sorted(
+            (key, amount)
+            for key, amount in self.chain.delegations.items()
+            if key[0] == acc_from and key[1] >= acc_to and amount
+        )
+        return {
+            "rc_direct_delegations": [
+                {"from": key[0], "to": key[1], "delegated_rc": amount}
+                for key, amount in matches[:limit]
+            ]
+        }
+
+    def rpc_get_accounts(self, params: Any) -> list:
+        names = self._arg(params, "accounts", 0, [])
+        return [
+            self.chain.accounts[name].account()
+            for name in names
+            if name in self.chain.accounts
+        ]
+
+    def rpc_get_following(self, params: Any) -> list:
+        account = self._arg(params, "account", 0)
+        start = self._arg(params, "start", 1) or ""
+        limit = self._arg(params, "limit", 3, 1000)
+        following = sorted(self.chain.following.get(account, []))
+        following = [name for name in following if name >= start][:limit]
+        return [
+            {"follower": account, "following": name, "what": ["blog"]}
+            for name in following
+        ]
+
+    def rpc_get_dynamic_global_properties(self, params: Any) -> dict:
+        self.chain.head_block_number += 1
+        return {
+            "head_block_number": self.chain.head_block_number,
+            "head_block_id": f"{self.chain.head_block_number:08x}" + "ab" * 16,
+            "time": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+            "last_irreversible_block_num": self.chain.head_block_number - 20,
+        }
+
+    def _apply_transaction(self, trx: dict):
+        for op in trx.get("operations", []):
+            if isinstance(op, dict):
+                op_type, op_value = op.get("type"), op.get("value", {})
+            else:
+                op_type, op_value = op
+            if op_type not in ("custom_json", "custom_json_operation"):
+                continue
+            if op_value.get("id") != "rc":
+                continue
+            for item in json.loads(op_value["json"]):
+                if item[0] != "delegate_rc":
+                    continue
+                for acc_to in item[1]["delegatees"]:
+                    self.chain.delegate(item[1]["from"], acc_to, item[1]["max_rc"])
+        self.chain.broadcasts.append(trx)
+
+    def rpc_broadcast_transaction_synchronous(self, params: Any) -> dict:
+        trx = self._arg(params, "trx", 0, {})
+        self._apply_transaction(trx)
+        return {
+            "id": f"{len(self.chain.broadcasts):040x}",
+            "block_num": self.chain.head_block_number + 1,
+            "trx_num": 0,
+            "expired": False,
+        }
+
+    def rpc_broadcast_transaction(self, params: Any) -> dict:
+        self._apply_transaction(self._arg(params, "trx", 0, {}))
+        return {}
@@ -0,0 +1,54 @@
+import logging
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+from plotly.subplots import make_subplots
+
+from hive_rc_auto.helpers.rc_charts import delegation_trace
+
+
+def fake_changes(n: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "age_hours": np.linspace(0, 672, n),
+            "cut": np.arange(n) % 3 == 0,
+            "delegated_rc": np.full(n, 25_000_000_000),
+            "acc_from": "podping",
+            "acc_to": "podping.aaa",
+            "trx_id": [f"{i:040x}" for i in range(n)],
+        }
+    )
+
+
+def test_delegation_trace():
+    changes = fake_changes(4)
+    trace = delegation_trace(changes, y_top=105)
+    assert len(trace.x) == 12
+    assert list(trace.y[:3][:2]) == [0, 105] and np.isnan(trace.y[2])
+    assert list(trace.marker.color[:6]) == [1, 1, 1, 0, 0, 0]
+    assert "25,000 M | Cut" in trace.customdata[0]
+
+
+def test_delegation_markers_benchmark():
+    changes = fake_changes(500)
+    timings = {}
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    start = timer()
+    for _, row in changes.iterrows():
+        fig.add_vline(x=row.age_hours, line_width=0.6, line_dash="dash")
+    fig.to_json()
+    timings["add_vline"] = timer() - start
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    start = timer()
+    fig.add_trace(delegation_trace(changes, y_top=105), secondary_y=True)
+    fig.to_json()
+    timings["trace"] = timer() - start
+
+    logging.info(
+        f"500 delegation markers: add_vline {timings['add_vline']:.3f}s "
+        f"| one trace {timings['trace']:.3f}s"
+    )
+    assert timings["trace"] * 10 < timings["add_vline"]
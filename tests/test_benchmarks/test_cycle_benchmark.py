@@ -0,0 +1,181 @@
+import logging
+import pstats
+from timeit import default_timer as timer
+
+import pytest
+
+from hive_rc_auto.helpers import tracing
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.hive_calls import get_tracking_accounts
+from hive_rc_auto.helpers.profiling import CycleProfiler
+from hive_rc_auto.helpers.rc_cycle import (
+    CyclePipeline,
+    run_multi_update_cycle,
+    run_update_cycle,
+)
+from hive_rc_auto.helpers.rc_delegation import RCListOfAccounts, RCPolicy
+from hive_rc_auto.helpers.replay import FakeBroadcastSink
+from hive_rc_auto.helpers.scheduler import FixedRateScheduler
+from hive_rc_auto.helpers.tracing import configure_tracing, load_spans
+from tests.fake_hive_node import FakeHiveNode, synthetic_chain
+
+DELEGATING = ["fake-delegator-1", "fake-delegator-2"]
+
+
+def fake_accounts(node: FakeHiveNode) -> RCListOfAccounts:
+    """Skip HiveSQL: the delegators are known, the targets come from the node"""
+    delegating = [Config.PRIMARY_ACCOUNT] + DELEGATING
+    receiving = get_tracking_accounts(Config.PRIMARY_ACCOUNT)
+    return RCListOfAccounts.construct(
+        all=delegating + receiving, delegating=delegating, receiving=receiving
+    )
+
+
+@pytest.fixture
+def fake_node(request, monkeypatch):
+    num_targets, latency = request.param
+    chain = synthetic_chain(num_targets, Config.PRIMARY_ACCOUNT, DELEGATING)
+    with FakeHiveNode(chain, latency=latency) as node:
+        monkeypatch.setattr(Config, "HIVE_NODES", [node.url])
+        yield node
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "fake_node",
+    [
+        (10, 0.0),
+        (100, 0.0),
+        pytest.param((1_000, 0.0), marks=pytest.mark.slow),
+        pytest.param((10_000, 0.0), marks=pytest.mark.slow),
+        pytest.param((100, 0.05), marks=pytest.mark.slow),
+    ],
+    indirect=True,
+    ids=["10", "100", "1000", "10000", "100-50ms"],
+)
+async def test_update_cycle_benchmark(fake_node: FakeHiveNode):
+    all_accounts = fake_accounts(fake_node)
+    timings = []
+    old_all_rcs = None
+    for _ in range(3):
+        start = timer()
+        all_data = await run_update_cycle(
+            all_accounts,
+            old_all_rcs=old_all_rcs,
+            store=False,
+            # Nothing broadcast or recorded in the configured delegation history
+            broadcaster=FakeBroadcastSink(),
+            store_delegations=False,
+        )
+        timings.append(timer() - start)
+        old_all_rcs = all_data.rcs
+    assert len(all_data.rcs) == len(all_accounts.all)
+    logging.info(
+        f"Accounts: {len(all_accounts.all):>6,} | "
+        f"First: {timings[0]:>7.3f}s | "
+        f"Best: {min(timings):>7.3f}s | "
+        f"Calls: {dict(fake_node.calls)}"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fake_node", [(100, 0.0)], indirect=True, ids=["100"])
+async def test_update_cycle_node_failover(fake_node: FakeHiveNode, monkeypatch):
+    nodes = fake_node.node_urls(3)
+    fake_node.failing_paths = ["/node0"]
+    monkeypatch.setattr(Config, "HIVE_NODES", nodes)
+    all_accounts = fake_accounts(fake_node)
+    start = timer()
+    all_data = await run_update_cycle(
+        all_accounts,
+        store=False,
+        broadcaster=FakeBroadcastSink(),
+        store_delegations=False,
+    )
+    logging.info(
+        f"Cycle with a dead node: {timer() - start:.3f}s | "
+        f"Failures: {dict(fake_node.failures)}"
+    )
+    assert len(all_data.rcs) == len(all_accounts.all)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fake_node", [(100, 0.0)], indirect=True, ids=["100"])
+async def test_multi_update_cycle_shares_calls(fake_node: FakeHiveNode):
+    """Two primaries tracking the same accounts cost one find_rc_accounts"""
+    all_accounts = fake_accounts(fake_node)
+    policies = [RCPolicy(), RCPolicy(rc_pct_upper_target=60)]
+    apps = [(all_accounts, policy) for policy in policies]
+    all_datas = await run_multi_update_cycle(
+        apps,
+        store=False,
+        broadcaster=FakeBroadcastSink(),
+        store_delegations=False,
+    )
+    assert [d.policy for d in all_datas] == policies
+    assert all(len(d.rcs) == len(all_accounts.all) for d in all_datas)
+    assert fake_node.calls["find_rc_accounts"] == 1
+    assert fake_node.calls["list_rc_direct_delegations"] <= len(all_accounts.delegating)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fake_node", [(100, 0.01)], indirect=True, ids=["100-10ms"])
+async def test_pipeline_keeps_fixed_rate(fake_node: FakeHiveNode):
+    """The cycles start on the grid however long each one takes"""
+    finished = []
+    pipeline = CyclePipeline(
+        [(fake_accounts(fake_node), RCPolicy())],
+        scheduler=FixedRateScheduler(period=0.5),
+        # Nothing sent or recorded in the configured delegation history
+        send_json=False,
+        store=False,
+        on_cycle=lambda all_datas: finished.append(timer()),
+    )
+    start = timer()
+    await pipeline.run(cycles=4)
+    assert len(finished) == 4
+    assert finished[-1] - start == pytest.approx(1.5, abs=0.4)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fake_node", [(10, 0.0)], indirect=True, ids=["10"])
+async def test_pipeline_trace_covers_every_stage(fake_node: FakeHiveNode, tmp_path):
+    """The cycle's root span lasts until its last stage is done"""
+    path = tmp_path / "traces.jsonl"
+    processor = configure_tracing(f"file:{path}")
+    pipeline = CyclePipeline(
+        [(fake_accounts(fake_node), RCPolicy())],
+        scheduler=FixedRateScheduler(period=0.1),
+        send_json=False,
+        store=False,
+    )
+    try:
+        await pipeline.run(cycles=2)
+    finally:
+        processor.shutdown()
+        tracing._processor = None
+    spans = load_spans(path)
+    roots = [s for s in spans if s["name"] == "update_cycle"]
+    assert len(roots) == 2
+    for root in roots:
+        children = [s for s in spans if s["parentSpanId"] == root["spanId"]]
+        assert "broadcast" in {s["name"] for s in children}
+        assert all(s["endTimeUnixNano"] <= root["endTimeUnixNano"] for s in children)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fake_node", [(10, 0.0)], indirect=True, ids=["10"])
+async def test_pipeline_profiles_every_stage(fake_node: FakeHiveNode, tmp_path):
+    """A profiled cycle runs from its fetch until it has been stored"""
+    pipeline = CyclePipeline(
+        [(fake_accounts(fake_node), RCPolicy())],
+        scheduler=FixedRateScheduler(period=0.5),
+        send_json=False,
+        store=False,
+        profiler=CycleProfiler(every_n=2, next_n=0, report_dir=str(tmp_path)),
+    )
+    await pipeline.run(cycles=2)
+    reports = list(tmp_path.glob("*.prof"))
+    assert len(reports) == 1
+    called = {func for _, _, func in pstats.Stats(str(reports[0])).stats}
+    assert {"fetch_and_decide", "broadcast_delegations", "_store"} <= called
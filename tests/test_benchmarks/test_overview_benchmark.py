@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from hive_rc_auto.helpers.rc_charts import AccountFrames, build_rc_graph
+
+NOW = datetime(2023, 1, 8)
+
+
+def fake_overview(accounts: int, per_account: int = 288):
+    """A day of 5 minute readings, sizes and a few changes for each account"""
+    names = [f"podping.{i:03d}" for i in range(accounts)]
+    times = pd.date_range(end=NOW, periods=per_account, freq="5min")
+    rng = np.random.default_rng(0)
+    n = accounts * per_account
+    readings = pd.DataFrame(
+        {
+            "timestamp": np.tile(times, accounts),
+            "account": np.repeat(names, per_account),
+            "delegating": np.repeat(
+                ["delegating" if i < 3 else "target" for i in range(accounts)],
+                per_account,
+            ),
+            "real_mana_percent": rng.uniform(20, 100, n),
+            "real_mana": rng.uniform(1e12, 1e13, n),
+        }
+    ).sort_values("timestamp", kind="stable")
+    readings["age_hours"] = (NOW - readings.timestamp).dt.total_seconds() / 3600
+    readings = readings.set_index("timestamp")
+    size = readings[["account"]].assign(total_size=rng.uniform(0, 5000, n))
+    size = size.sort_index(ascending=False)
+    changes = readings.iloc[:: per_account // 2][["account"]].assign(
+        age_hours=1.0,
+        cut=True,
+        delegated_rc=25_000_000_000,
+        acc_from="podping",
+        acc_to="podping.000",
+        trx_id="0" * 40,
+    )
+    return readings, changes, size
+
+
+def filter_each_time(readings, changes, size):
+    """What the grid did: scan every row for each account, again per use"""
+    for hive_acc in readings.account.unique():
+        dfa = readings[readings.account == hive_acc]
+        dfa.real_mana_percent.iloc[-1]
+        dfa = readings[readings.account == hive_acc]
+        size["age_hours"] = (NOW - size.index).total_seconds() / 3600
+        size[size.account == hive_acc]
+        changes[changes.account == hive_acc]
+
+
+def test_account_frames():
+    readings, changes, size = fake_overview(10, per_account=24)
+    readings.loc[readings.account == "podping.005", "real_mana_percent"] = 99.0
+    frames = AccountFrames(readings, changes, size, now=NOW)
+    assert frames.delegating == ["podping.000", "podping.001", "podping.002"]
+    assert "podping.005" not in frames.receiving()
+    # As the grid used to pick them
+    assert frames.receiving() == [
+        hive_acc
+        for hive_acc in sorted(
+            readings[readings.delegating == "target"].account.unique()
+        )
+        if readings[readings.account == hive_acc].real_mana_percent.iloc[-1] < 95
+    ]
+    dfa = frames.readings["podping.007"]
+    pd.testing.assert_frame_equal(
+        dfa.astype({"account": str, "delegating": str}),
+        readings[readings.account == "podping.007"],
+    )
+    assert isinstance(dfa.delegating.dtype, pd.CategoricalDtype)
+    assert frames.size["podping.007"].index.is_monotonic_increasing
+    assert frames.size["podping.007"].age_hours.iloc[-1] == 0
+    fig = build_rc_graph(frames, "podping.006", show_size=True)
+    assert [trace.name for trace in fig.data] == ["RC %", "Bytes/min", "Delegations"]
+
+
+def test_account_frames_benchmark():
+    readings, changes, size = fake_overview(500)
+    timings = {}
+
+    start = timer()
+    filter_each_time(readings, changes, size.copy())
+    timings["filter"] = timer() - start
+
+    start = timer()
+    frames = AccountFrames(readings, changes, size, now=NOW)
+    for hive_acc in frames.readings:
+        frames.readings[hive_acc].real_mana_percent.iloc[-1]
+        frames.size.get(hive_acc)
+        frames.changes.get(hive_acc)
+    timings["grouped"] = timer() - start
+
+    logging.info(
+        f"500 accounts, {len(readings):,} readings: filtering "
+        f"{timings['filter']:.3f}s | grouped once {timings['grouped']:.3f}s"
+    )
+    assert timings["grouped"] * 5 < timings["filter"]
+
+
+@pytest.mark.slow
+def test_build_graphs_benchmark():
+    timings = {}
+    for accounts in (250, 500):
+        frames = AccountFrames(*fake_overview(accounts), now=NOW)
+        start = timer()
+        for hive_acc in frames.readings:
+            build_rc_graph(frames, hive_acc, show_size=True)
+        timings[accounts] = timer() - start
+    logging.info(
+        f"Build graphs: 250 accounts {timings[250]:.2f}s "
+        f"| 500 accounts {timings[500]:.2f}s"
+    )
+    # Linear in the rows: twice the accounts, about twice the time
+    assert timings[500] < 3 * timings[250]
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from hive_rc_auto.helpers.dashboard_cache import STATS, snap, snap_times, ttl_cache
+
+
+def test_snap_to_cycle():
+    assert snap(datetime(2023, 1, 1, 10, 7, 31), 300) == datetime(2023, 1, 1, 10, 5)
+    aware = datetime(2023, 1, 1, 10, 7, 31, tzinfo=timezone.utc)
+    assert snap(aware, 300) == datetime(2023, 1, 1, 10, 5, tzinfo=timezone.utc)
+    # Viewers seconds apart ask the same question
+    now = datetime(2023, 1, 1, 10, 7, 31)
+    pipeline = [
+        {"$match": {"timestamp": {"$gt": now - timedelta(days=10)}}},
+        {"$sort": {"timestamp": -1}},
+    ]
+    later = [
+        {
+            "$match": {
+                "timestamp": {"$gt": now + timedelta(seconds=20) - timedelta(days=10)}
+            }
+        },
+        {"$sort": {"timestamp": -1}},
+    ]
+    assert snap_times(pipeline, 300) == snap_times(later, 300)
+    assert snap_times([("timestamp", -1)]) == [("timestamp", -1)]
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    calls = []
+
+    @ttl_cache(ttl=60)
+    def query(start: datetime, _ignored: object) -> list:
+        calls.append(start)
+        return [start]
+
+    query.clear()
+    before = STATS.totals
+    start = datetime(2023, 1, 1)
+    assert query(start, object()) == [start]
+    assert query(start, object()) == [start]
+    assert query(start + timedelta(hours=1), object()) == [start + timedelta(hours=1)]
+    assert len(calls) == 2
+    after = STATS.totals
+    assert after["misses"] - before["misses"] == 2
+    assert after["hits"] - before["hits"] == 1
@@ -0,0 +1,80 @@
+import pytest
+from pymongo import MongoClient
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.db_indexes import (
+    PINGSLURP_DB,
+    PREFIX,
+    check_plans,
+    collscans,
+    dashboard_queries,
+    declared_indexes,
+    reconcile_indexes,
+    seed,
+)
+from hive_rc_auto.helpers.rc_delegation import DB_NAME
+
+
+def test_collscans_ignores_rejected_plans():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "rcauto_timestamp"},
+            },
+            "rejectedPlans": [{"stage": "COLLSCAN"}],
+        }
+    }
+    assert list(collscans(explain)) == []
+    # Aggregations nest the find plan under stages
+    explain = {
+        "stages": [
+            {
+                "$cursor": {
+                    "queryPlanner": {
+                        "namespace": "rc_podping.system.buckets.meta_ts",
+                        "winningPlan": {"stage": "COLLSCAN"},
+                    }
+                }
+            }
+        ]
+    }
+    assert len(list(collscans(explain))) == 1
+
+
+def test_declared_index_names():
+    names = [(spec.collection, spec.name) for spec in declared_indexes()]
+    assert len(set(names)) == len(names)
+    assert all(name.startswith(PREFIX) for _, name in names)
+
+
+def test_dashboard_queries_have_indexes():
+    queries = dashboard_queries()
+    assert len({query.name for query in queries}) == len(queries)
+    indexed = {(spec.database, spec.collection) for spec in declared_indexes()}
+    assert all((query.database, query.collection) in indexed for query in queries)
+
+
+@pytest.mark.mongo
+def test_seeded_plans_use_indexes():
+    client = MongoClient(Config.DB_CONNECTION)
+    databases = {
+        DB_NAME: client[f"{DB_NAME}_plancheck_test"],
+        PINGSLURP_DB: client[f"{PINGSLURP_DB}_plancheck_test"],
+    }
+    try:
+        seed(databases, accounts=10, hours=6)
+        check_plans(databases, dashboard_queries())
+        for database, db in databases.items():
+            specs = [s for s in declared_indexes() if s.database == database]
+            # Newer servers index (metaField, timeField) themselves
+            created, _ = reconcile_indexes(db, specs)
+            assert 0 < created <= len(specs)
+            # Nothing to do the second time, and stale ones of ours go
+            assert reconcile_indexes(db, specs) == (0, 0)
+            assert reconcile_indexes(db, specs[1:]) == (0, 1)
+            reconcile_indexes(db, specs)
+        assert check_plans(databases, dashboard_queries()) == []
+    finally:
+        for db in databases.values():
+            client.drop_database(db.name)
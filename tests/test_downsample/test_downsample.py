@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from hive_rc_auto.helpers.downsample import capped, lttb_indices, minmax_indices
+
+
+def rc_series(n: int = 10_000) -> pd.Series:
+    """RC % recovering slowly with a few sharp dips"""
+    index = pd.date_range(datetime(2023, 1, 1), periods=n, freq="5min")
+    values = 80 + 10 * np.sin(np.linspace(0, 6, n))
+    values[[1234, 5678, 9000]] = [3.0, 5.0, 8.0]
+    return pd.Series(values, index=index)
+
+
+def test_lttb_keeps_dips():
+    series = rc_series()
+    x = np.arange(len(series), dtype=float)
+    keep = lttb_indices(x, series.to_numpy(), 500)
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == len(series) - 1
+    assert (np.diff(keep) > 0).all()
+    assert {1234, 5678, 9000} <= set(keep)
+    # Plain averaging into as many buckets loses them
+    assert series.to_numpy().reshape(500, 20).mean(axis=1).min() > 60
+
+
+def test_minmax_keeps_extremes():
+    y = rc_series().to_numpy().copy()
+    keep = minmax_indices(y, 200)
+    assert len(keep) <= 200
+    assert y[keep].min() == y.min() and y[keep].max() == y.max()
+    # Missing values aren't picked
+    y[:50] = np.nan
+    assert np.isfinite(y[minmax_indices(y, 200)]).all()
+
+
+def test_capped_slices_everything_alike():
+    series = rc_series()
+    text = [f"{ts:%d %H:%M}" for ts in series.index]
+    x, y, labels = capped(series.index, series, text, max_points=300)
+    assert len(x) == len(y) == len(labels) == 300
+    assert labels[10] == f"{x[10]:%d %H:%M}"
+    assert y.index[10] == x[10]
+    # Short traces go through untouched
+    short = series.iloc[:100]
+    assert capped(short.index, short, max_points=300)[1] is short
+    # Leading NaNs from a rolling mean are dropped
+    x, y = capped(series.index, series.rolling(24).mean(), max_points=300)
+    assert not y.isna().any()
+    assert x[0] == series.index[23]
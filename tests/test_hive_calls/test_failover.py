@@ -0,0 +1,42 @@
+from hive_rc_auto.helpers import tracing
+from hive_rc_auto.helpers.hive_calls import make_lighthive_call
+from hive_rc_auto.helpers.tracing import configure_tracing, load_spans
+
+
+class FlakyClient:
+    """The first node fails, the second answers"""
+
+    api_type = "condenser_api"
+
+    def __init__(self) -> None:
+        self.node_list = ["https://node1", "https://node2"]
+        self.current_node = self.node_list[0]
+
+    def next_node(self):
+        index = self.node_list.index(self.current_node) + 1
+        self.current_node = self.node_list[index % len(self.node_list)]
+
+    def get_dynamic_global_properties(self):
+        if self.current_node == "https://node1":
+            raise ConnectionError("node down")
+        return {"head_block_number": 1}
+
+
+def test_failover_event_exported(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    processor = configure_tracing(f"file:{path}")
+    client = FlakyClient()
+    response = make_lighthive_call(
+        client=client, call_to_make=client.get_dynamic_global_properties
+    )
+    processor.shutdown()
+    tracing._processor = None
+
+    assert response == {"head_block_number": 1}
+    failed, answered = sorted(
+        load_spans(path), key=lambda s: s["attributes"]["attempt"]
+    )
+    assert failed["status"] == "error"
+    assert failed["events"][0]["name"] == "failover"
+    assert failed["events"][0]["attributes"] == {"next_node": "https://node2"}
+    assert answered["status"] == "ok" and not answered["events"]
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.hysteresis import CUT, INCREASE, DelegationGovernor
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAllData,
+    RCDirectDelegation,
+    RCListOfAccounts,
+    RCPolicy,
+    set_clock,
+)
+from hive_rc_auto.helpers.replay import SimulatedClock, reading_to_rc_account
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+TARGET = "governed-target"
+POLICY = RCPolicy(
+    rc_pct_lower_target=20,
+    rc_pct_upper_target=50,
+    hysteresis_pct=5,
+    min_dwell_secs=600,
+    coalesce_secs=0,
+)
+
+
+@pytest.fixture
+def clock():
+    clock = SimulatedClock(START)
+    set_clock(clock)
+    yield clock
+    set_clock(None)
+
+
+def cycle(
+    clock: SimulatedClock,
+    percent: float,
+    cut: bool,
+    amount: int = 10**12,
+    policy: RCPolicy = POLICY,
+) -> RCAllData:
+    """One cycle's decision for TARGET, read at `percent` RC"""
+    max_rc = 10**13
+    rc = reading_to_rc_account(
+        {
+            "timestamp": clock(),
+            "account": TARGET,
+            "max_rc": max_rc,
+            "delegated_rc": 0,
+            "received_delegated_rc": amount,
+            "real_mana": int(max_rc * percent / 100),
+        },
+        old_mana_percent=percent,
+    )
+    rc.alarm_set = False
+    all_data = RCAllData(
+        accounts=RCListOfAccounts.construct(
+            all=[TARGET], delegating=[], receiving=[TARGET]
+        ),
+        policy=policy,
+    )
+    all_data.rcs = [rc]
+    all_data.pending_delegations = [
+        RCDirectDelegation.parse_obj(
+            {
+                "from": Config.PRIMARY_ACCOUNT,
+                "to": TARGET,
+                "delegated_rc": amount,
+                "cut": cut,
+            }
+        )
+    ]
+    return all_data
+
+
+def test_cut_held_inside_band(clock):
+    governor = DelegationGovernor()
+    governor.last_change[TARGET] = (START - timedelta(hours=1), INCREASE)
+    # Over the upper target but not past the band
+    assert governor.apply(cycle(clock, 52, cut=True)) == []
+    assert governor.suppressed == {"hysteresis": 1}
+    sent = governor.apply(cycle(clock, 56, cut=True))
+    assert [dd.cut for dd in sent] == [True]
+    assert governor.last_change[TARGET] == (START, CUT)
+
+
+def test_reversal_blocked_by_dwell(clock):
+    governor = DelegationGovernor()
+    governor.last_change[TARGET] = (START - timedelta(seconds=60), CUT)
+    # Well past the band, but the last change was a minute ago
+    assert governor.apply(cycle(clock, 5, cut=False)) == []
+    assert governor.suppressed == {"dwell": 1}
+    clock.advance_to(START + timedelta(seconds=600))
+    assert len(governor.apply(cycle(clock, 5, cut=False))) == 1
+
+
+def test_cuts_coalesced(clock):
+    policy = POLICY.copy(update={"min_dwell_secs": 0, "coalesce_secs": 300})
+    governor = DelegationGovernor()
+    assert governor.apply(cycle(clock, 80, cut=True, policy=policy)) == []
+    clock.advance_to(START + timedelta(seconds=100))
+    assert governor.apply(cycle(clock, 80, True, 5 * 10**11, policy)) == []
+    assert governor.suppressed == {"coalesced": 1}
+    clock.advance_to(START + timedelta(seconds=300))
+    sent = governor.apply(cycle(clock, 80, True, 2 * 10**11, policy))
+    # Sent once, at the latest amount
+    assert [dd.delegated_rc for dd in sent] == [2 * 10**11]
+    assert governor.suppressed == {"coalesced": 2}
+    assert governor.held == {}
+
+
+def test_alarmed_increase_bypasses_governor(clock):
+    governor = DelegationGovernor()
+    governor.last_change[TARGET] = (START - timedelta(seconds=60), CUT)
+    all_data = cycle(clock, 25, cut=False)
+    all_data.rcs[0].alarm_set = True
+    assert len(governor.apply(all_data)) == 1
+    assert governor.suppressed == {}
+    assert governor.last_change[TARGET] == (START, INCREASE)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from hive_rc_auto.helpers.incremental import IncrementalFrame, update_rolling
+
+START = datetime(2023, 1, 1)
+ROLLING = {"avg4H": "4h", "avg24H": "24h"}
+
+
+def hourly(until: datetime, hosts=("a", "b")) -> pd.DataFrame:
+    """Hourly counts per host up to `until`, the last hour only partly counted"""
+    rows = []
+    for host in hosts:
+        for hour in pd.date_range(START, until, freq="1h", inclusive="left"):
+            # A bucket's timestamp is its first ping, not the hour
+            seen = min(hour.to_pydatetime() + timedelta(minutes=7), until)
+            whole = min((until - hour.to_pydatetime()) / timedelta(hours=1), 1)
+            count = float(hour.hour + ord(host)) * whole
+            rows.append({"timestamp": seen, "host": host, "total_iris": count})
+    return pd.DataFrame(rows).sort_values("timestamp", kind="stable")
+
+
+def fetcher(until: datetime):
+    full = hourly(until)
+    return lambda since: full[full.timestamp >= since - timedelta(hours=1)]
+
+
+def full_recompute(frame: IncrementalFrame, until: datetime, center: bool):
+    expected = IncrementalFrame(frame.window, frame.bucket)
+    expected.update(fetcher(until), now=until)
+    return update_rolling(
+        expected.df, "total_iris", ROLLING, expected.since, by="host", center=center
+    )
+
+
+def ordered(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["host", "timestamp"]).reset_index(drop=True)
+
+
+def check_refreshes(center: bool):
+    frame = IncrementalFrame(timedelta(hours=48), timedelta(hours=1))
+    fetched = []
+    for minutes in range(60 * 50, 60 * 60, 25):
+        now = START + timedelta(minutes=minutes)
+        df = frame.update(fetcher(now), now=now)
+        update_rolling(df, "total_iris", ROLLING, frame.since, by="host", center=center)
+        fetched.append(frame.fetched)
+        expected = full_recompute(frame, now, center)
+        # The oldest rows keep the averages they had before the rows they
+        # looked back on were trimmed, compare from a widest window in
+        settled = now - frame.window + timedelta(hours=24)
+        pd.testing.assert_frame_equal(
+            ordered(df[df.timestamp >= settled]),
+            ordered(expected[expected.timestamp >= settled]),
+            check_like=True,
+        )
+        assert df.timestamp.min() >= now - frame.window
+    # After the first load only the newest hour (or two) is fetched again
+    assert fetched[0] > 90
+    assert max(fetched[1:]) <= 4
+
+
+def test_incremental_matches_full_recompute():
+    check_refreshes(center=False)
+
+
+def test_incremental_matches_full_recompute_centred():
+    check_refreshes(center=True)
+
+
+def test_partial_bucket_replaced():
+    frame = IncrementalFrame(timedelta(hours=6), timedelta(hours=1))
+    for now in (
+        START + timedelta(hours=3, minutes=20),
+        START + timedelta(hours=3, minutes=50),
+    ):
+        frame.update(fetcher(now), now=now)
+    last = frame.df[frame.df.host == "a"].iloc[-1]
+    assert last.total_iris == pytest.approx((3 + ord("a")) * 50 / 60)
+    assert len(frame.df) == 2 * 4
+
+
+def test_empty_fetch():
+    frame = IncrementalFrame(timedelta(hours=6))
+    df = frame.update(lambda since: pd.DataFrame(), now=START)
+    assert df.empty
+    assert update_rolling(df, "total_iris", ROLLING, frame.since).empty
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from hive_rc_auto.helpers.metrics import (
+    HEALTH,
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    start_metrics_server,
+)
+
+
+def test_render_counter_and_histogram():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_total", "A counter.", ["result"]))
+    histogram = registry.register(
+        Histogram("test_seconds", "A histogram.", ["node"], buckets=(0.1, 1))
+    )
+    counter.inc(result="sent")
+    counter.inc(2, result="sent")
+    histogram.observe(0.05, node='https://"quoted"')
+    histogram.observe(0.5, node='https://"quoted"')
+    histogram.observe(5, node='https://"quoted"')
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{result="sent"} 3.0' in text
+    assert 'test_seconds_bucket{node="https://\\"quoted\\"",le="0.1"} 1.0' in text
+    assert 'test_seconds_bucket{node="https://\\"quoted\\"",le="1.0"} 2.0' in text
+    assert 'test_seconds_bucket{node="https://\\"quoted\\"",le="+Inf"} 3.0' in text
+    assert 'test_seconds_count{node="https://\\"quoted\\""} 3.0' in text
+
+
+def test_wrong_labels():
+    counter = Counter("test_total", "A counter.", ["result"])
+    with pytest.raises(ValueError):
+        counter.inc(node="x")
+
+
+async def http_get(port: int, path: str) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.decode()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    server = await start_metrics_server(host="127.0.0.1", port=0)
+    assert server is None
+    server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+    server = await start_metrics_server(host="127.0.0.1", port=port)
+    try:
+        HEALTH.startup_complete = False
+        assert (await http_get(port, "/readyz")).startswith("HTTP/1.1 503")
+        assert (await http_get(port, "/healthz")).startswith("HTTP/1.1 200")
+        HEALTH.startup_complete = True
+        HEALTH.cycle_done()
+        assert (await http_get(port, "/readyz")).startswith("HTTP/1.1 200")
+        metrics = await http_get(port, "/metrics")
+        assert "rc_bot_cycles_total" in metrics
+        assert (await http_get(port, "/nothing")).startswith("HTTP/1.1 404")
+    finally:
+        server.close()
+        await server.wait_closed()
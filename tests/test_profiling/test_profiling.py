@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from hive_rc_auto.helpers.profiling import CycleProfiler, LoopBlockMonitor
+
+
+def test_cycle_profiler_every_n(tmp_path):
+    profiler = CycleProfiler(every_n=2, next_n=0, report_dir=str(tmp_path))
+    for cycle_number in range(1, 5):
+        with profiler.cycle(cycle_number):
+            sum(range(1000))
+    reports = sorted(p.name for p in tmp_path.glob("*.txt"))
+    assert len(reports) == 2
+    assert reports[0].endswith("_000002.txt")
+
+
+def test_cycle_profiler_armed(tmp_path):
+    profiler = CycleProfiler(every_n=0, next_n=0, report_dir=str(tmp_path))
+    with profiler.cycle(1) as profile:
+        assert profile is None
+    profiler.arm(2)
+    for cycle_number in range(2, 6):
+        with profiler.cycle(cycle_number):
+            pass
+    assert len(list(tmp_path.glob("*.prof"))) == 2
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_block_monitor(tmp_path):
+    monitor = LoopBlockMonitor(threshold=0.1, report_dir=str(tmp_path))
+    task = monitor.start()
+    await asyncio.sleep(0.05)
+    blocking_call()
+    await asyncio.sleep(0.05)
+    monitor.stop()
+    await task
+    assert monitor.blocks == 1
+    report = (tmp_path / "slow_callbacks.log").read_text()
+    assert "blocking_call" in report
@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from hive_rc_auto.helpers import rc_delegation
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.metrics import BROADCASTS_TOTAL, MONGO_WRITE_ERRORS_TOTAL
+from hive_rc_auto.helpers.rc_cycle import broadcast_alarms
+from hive_rc_auto.helpers.rc_delegation import RCAllData, RCListOfAccounts
+from hive_rc_auto.helpers.replay import FakeBroadcastSink, reading_to_rc_account
+
+NOW = datetime.now(timezone.utc)
+
+
+def reading(account: str, percent: float, delegating: str = "target") -> dict:
+    max_rc = 1_000_000_000_000_000 if delegating == "delegating" else 10**12
+    return {
+        "timestamp": NOW,
+        "account": account,
+        "delegating": delegating,
+        "max_rc": max_rc,
+        "delegated_rc": 0,
+        "received_delegated_rc": 0,
+        "real_mana": int(max_rc * percent / 100),
+    }
+
+
+def make_all_data() -> RCAllData:
+    accounts = RCListOfAccounts.construct(
+        all=[Config.PRIMARY_ACCOUNT, "alarmed", "low"],
+        delegating=[Config.PRIMARY_ACCOUNT],
+        receiving=["alarmed", "low"],
+    )
+    all_data = RCAllData(accounts=accounts)
+    all_data.rcs = [
+        reading_to_rc_account(reading(Config.PRIMARY_ACCOUNT, 100, "delegating")),
+        reading_to_rc_account(reading("alarmed", Config.RC_PCT_ALARM_LEVEL / 2)),
+        reading_to_rc_account(
+            reading("low", (Config.RC_PCT_ALARM_LEVEL + Config.RC_PCT_LOWER_TARGET) / 2)
+        ),
+    ]
+    return all_data
+
+
+@pytest.mark.asyncio
+async def test_alarm_delegations_go_first():
+    all_data = make_all_data()
+    alarmed = await all_data.update_alarm_delegations()
+    assert [dd.acc_to for dd in alarmed] == ["alarmed"]
+    sink = FakeBroadcastSink()
+    sent = []
+    await all_data.get_payload_for_pending_delegations(
+        send_json=True,
+        broadcaster=sink,
+        store_delegations=False,
+        delegations=alarmed,
+        on_sent=lambda delegator, trx: sent.append(delegator),
+    )
+    assert sent == [Config.PRIMARY_ACCOUNT]
+    assert len(sink.broadcasts) == 1
+    # The rest of the cycle leaves the alarmed account alone
+    await all_data.update_delegations()
+    assert [dd.acc_to for dd in all_data.pending_delegations] == ["low"]
+
+
+class FailingSink(FakeBroadcastSink):
+    async def __call__(self, *args, **kwargs):
+        raise ConnectionError("node down")
+
+
+@pytest.mark.asyncio
+async def test_failed_alarm_left_to_the_cycle():
+    all_data = make_all_data()
+    await broadcast_alarms(
+        [all_data], broadcaster=FailingSink(), store_delegations=False
+    )
+    assert all_data.alarm_delegations == []
+    # Nothing went out, the regular path delegates to the alarmed account too
+    await all_data.update_delegations()
+    assert sorted(dd.acc_to for dd in all_data.pending_delegations) == [
+        "alarmed",
+        "low",
+    ]
+
+
+class BrokenCollection:
+    async def insert_many(self, docs):
+        raise ConnectionError("database down")
+
+
+@pytest.mark.asyncio
+async def test_failed_store_counts_broadcast_once(monkeypatch):
+    monkeypatch.setattr(rc_delegation, "get_mongo_db", lambda _: BrokenCollection())
+    all_data = make_all_data()
+    alarmed = await all_data.update_alarm_delegations()
+    before = {
+        result: BROADCASTS_TOTAL.value(result=result) for result in ("sent", "failed")
+    }
+    errors = MONGO_WRITE_ERRORS_TOTAL.value(collection=Config.DB_NAME_DELEG)
+    await all_data.get_payload_for_pending_delegations(
+        send_json=True, broadcaster=FakeBroadcastSink(), delegations=alarmed
+    )
+    assert BROADCASTS_TOTAL.value(result="sent") == before["sent"] + 1
+    assert BROADCASTS_TOTAL.value(result="failed") == before["failed"]
+    assert MONGO_WRITE_ERRORS_TOTAL.value(collection=Config.DB_NAME_DELEG) == errors + 1
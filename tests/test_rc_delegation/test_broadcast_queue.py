@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from hive_rc_auto.helpers.broadcast_queue import BroadcastQueue
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAllData,
+    RCDirectDelegation,
+    RCListOfAccounts,
+)
+from hive_rc_auto.helpers.replay import FakeBroadcastSink, reading_to_rc_account
+
+NOW = datetime.now(timezone.utc)
+
+
+def target(account: str, percent: float, old_percent: float):
+    return reading_to_rc_account(
+        {
+            "timestamp": NOW,
+            "account": account,
+            "max_rc": 10**12,
+            "delegated_rc": 0,
+            "received_delegated_rc": 0,
+            "real_mana": int(10**12 * percent / 100),
+        },
+        old_mana_percent=old_percent,
+    )
+
+
+def increase(delegator: str, account: str, amount: int = 10**12):
+    return RCDirectDelegation.parse_obj(
+        {"from": delegator, "to": account, "delegated_rc": amount, "cut": False}
+    )
+
+
+@pytest.mark.asyncio
+async def test_most_urgent_first():
+    accounts = RCListOfAccounts.construct(
+        all=["slow", "fast", "flat"], delegating=[], receiving=["slow", "fast", "flat"]
+    )
+    all_data = RCAllData(accounts=accounts)
+    # Same RC level, "fast" is burning through it quickest
+    all_data.rcs = [
+        target("slow", 15, 15.5),
+        target("fast", 15, 18),
+        target("flat", 12, 0),
+    ]
+    assert all_data.rcs[1].seconds_to_empty < all_data.rcs[0].seconds_to_empty
+    all_data.pending_delegations = [
+        increase("delegator-a", "slow"),
+        increase("delegator-b", "fast"),
+        increase("delegator-c", "flat"),
+    ]
+    queue = BroadcastQueue()
+    queue.push_all(all_data)
+    # A newer decision replaces the queued one for the same target
+    queue.push(increase("delegator-a", "slow", 2 * 10**12), all_data.rcs[0], all_data)
+    assert len(queue) == 3
+
+    sink = FakeBroadcastSink()
+    sent = []
+    await queue.dispatch(
+        on_sent=lambda delegator, dds: sent.append(dds),
+        broadcaster=sink,
+        store_delegations=False,
+    )
+    assert [b["required_posting_auth"] for b in sink.broadcasts] == [
+        "delegator-b",
+        "delegator-a",
+        "delegator-c",
+    ]
+    assert sent[1][0].delegated_rc == 2 * 10**12
+    assert len(queue) == 0
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from hive_rc_auto.helpers.checkpoint import Checkpoint
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import (
+    RCAccount,
+    RCListOfAccounts,
+    RCPolicy,
+    set_clock,
+)
+from hive_rc_auto.helpers.replay import reading_to_rc_account
+
+NOW = datetime.now(timezone.utc)
+
+
+def reading(account: str, percent: float) -> dict:
+    return {
+        "timestamp": NOW,
+        "account": account,
+        "max_rc": 10**12,
+        "delegated_rc": 0,
+        "received_delegated_rc": 0,
+        "real_mana": int(10**12 * percent / 100),
+    }
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_round_trip(tmp_path):
+    policy = RCPolicy(primary_account=Config.PRIMARY_ACCOUNT)
+    accounts = RCListOfAccounts.construct(
+        all=[Config.PRIMARY_ACCOUNT, "one"],
+        delegating=[Config.PRIMARY_ACCOUNT],
+        receiving=["one"],
+    )
+    checkpoint = Checkpoint(target=f"file:{tmp_path / 'checkpoint.json'}")
+    assert await checkpoint.load() is None
+    await checkpoint.save(
+        [(accounts, policy)], [reading_to_rc_account(reading("one", 40))]
+    )
+
+    saved = await checkpoint.load()
+    apps = saved.apps_for([policy])
+    assert apps[0][0].receiving == ["one"]
+    assert sorted(apps[0][0].all) == sorted(accounts.all)
+    assert saved.apps_for([RCPolicy(primary_account="someone-else")]) is None
+    assert [r.account for r in saved.recent_readings(max_age=60)] == ["one"]
+    try:
+        set_clock(lambda: NOW + timedelta(hours=1))
+        assert saved.recent_readings(max_age=60) is None
+    finally:
+        set_clock(None)
+
+
+def test_delta_uses_real_gap():
+    """After a restart the previous reading is older than one period"""
+    rc = reading_to_rc_account(reading("one", 50))
+    data = rc.dict() | {
+        "old_mana_percent": 40,
+        "old_timestamp": NOW - timedelta(hours=2),
+    }
+    assert RCAccount.parse_obj(data).delta_percent == pytest.approx(5, abs=0.1)
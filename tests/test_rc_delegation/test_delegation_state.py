@@ -0,0 +1,38 @@
+import pytest
+
+from hive_rc_auto.helpers import delegation_state
+from hive_rc_auto.helpers.delegation_state import DelegationState
+from hive_rc_auto.helpers.rc_delegation import RCDirectDelegation
+
+
+def dd(acc_to: str, amount: int) -> RCDirectDelegation:
+    return RCDirectDelegation.parse_obj(
+        {"from": "delegator", "to": acc_to, "delegated_rc": amount}
+    )
+
+
+@pytest.mark.asyncio
+async def test_delegation_state(monkeypatch):
+    on_chain = [dd("one", 100), dd("two", 200)]
+    reads = []
+
+    async def fake_list(acc_from: str, acc_to: str = "", limit: int = 100):
+        reads.append(acc_from)
+        return list(on_chain)
+
+    monkeypatch.setattr(delegation_state, "list_rc_direct_delegations", fake_list)
+    state = DelegationState(reconcile_secs=3600)
+    assert len(await state.delegations_of("delegator")) == 2
+    await state.delegations_of("delegator")
+    assert reads == ["delegator"]
+
+    planned = [dd("one", 100), dd("two", 250), dd("three", 0)]
+    assert [d.acc_to for d in state.drop_no_ops(planned)] == ["two"]
+
+    state.record_sent("delegator", [dd("two", 250), dd("one", 0)])
+    assert state.state["delegator"] == {"two": 250}
+
+    # Reconciling picks up changes made elsewhere
+    on_chain.append(dd("four", 400))
+    await state.reconcile("delegator")
+    assert state.state["delegator"] == {"one": 100, "two": 200, "four": 400}
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.migrate_history import migrate
+from hive_rc_auto.helpers.rc_delegation import get_mongo_db
+from hive_rc_auto.helpers.rc_schema import AccountDictionary, from_compact
+
+# Naive UTC, as the readings come back from Mongo
+START = datetime(2023, 1, 1)
+ACCOUNTS = ["podping.aaa", "podping.bbb", "podping.ccc"]
+
+
+def legacy_readings(first: int, count: int) -> list:
+    """`count` legacy documents a minute apart from minute `first`"""
+    docs = []
+    for i in range(first, first + count):
+        real_mana = 10**10 * (i % 100)
+        docs.append(
+            {
+                "timestamp": START + timedelta(minutes=i),
+                "account": ACCOUNTS[i % len(ACCOUNTS)],
+                "delegating": "target",
+                "max_rc": 10**12,
+                "delegated_rc": 0,
+                "received_delegated_rc": i * 10**9,
+                "real_mana": real_mana,
+                "real_mana_percent": real_mana * 100 / 10**12,
+                "delta_percent": i / 7,
+                "rc_deleg_available": real_mana - (Config.RC_BASE_LEVEL + i * 10**9),
+                "status": "low" if i % 100 < 20 else "ok",
+                "delta_icon": "🔴" if i % 100 < 20 else "✅",
+            }
+        )
+    return docs
+
+
+@pytest_asyncio.fixture
+async def collections(monkeypatch):
+    monkeypatch.setattr(Config, "DB_NAME", "test_migrate_legacy")
+    monkeypatch.setattr(Config, "DB_NAME_COMPACT", "test_migrate_compact")
+    monkeypatch.setattr(Config, "DB_NAME_ACCOUNTS", "test_migrate_accounts")
+    names = [Config.DB_NAME, Config.DB_NAME_COMPACT, Config.DB_NAME_ACCOUNTS]
+    for name in names:
+        await get_mongo_db(name).drop()
+    yield get_mongo_db(Config.DB_NAME), get_mongo_db(Config.DB_NAME_COMPACT)
+    for name in names:
+        await get_mongo_db(name).drop()
+
+
+@pytest.mark.mongo
+@pytest.mark.asyncio
+async def test_migrate_round_trip_and_resume(collections):
+    legacy, compact = collections
+    seeded = legacy_readings(0, 25)
+    await legacy.insert_many([dict(doc) for doc in seeded])
+
+    report = await migrate(batch_size=10)
+    assert report.documents == 25
+    assert report.last_timestamp == seeded[-1]["timestamp"]
+    names = await AccountDictionary().names()
+    assert sorted(names.values()) == ACCOUNTS
+    docs = await compact.find({}).sort("timestamp", 1).to_list(length=None)
+    assert len(docs) == 25
+    for original, doc in zip(seeded, docs):
+        back = from_compact(doc, names)
+        for field in ["timestamp", "account", "status", "delta_icon", "real_mana"]:
+            assert back[field] == original[field]
+        assert back["received_delegated_rc"] == original["received_delegated_rc"]
+        assert back["real_mana_percent"] == pytest.approx(original["real_mana_percent"])
+        assert back["delta_percent"] == pytest.approx(
+            original["delta_percent"], abs=0.01
+        )
+
+    # Nothing new: a second run writes nothing
+    assert (await migrate(batch_size=10)).documents == 0
+    # Newer readings: only those are copied
+    newer = legacy_readings(25, 7)
+    await legacy.insert_many([dict(doc) for doc in newer])
+    report = await migrate(batch_size=10)
+    assert report.documents == 7
+    assert report.last_timestamp == newer[-1]["timestamp"]
+    assert await compact.count_documents({}) == await legacy.count_documents({})
+    timestamps = await compact.distinct("timestamp")
+    assert len(timestamps) == 32
@@ -1,4 +1,5 @@
 import asyncio
+import json
 import logging
 
 import pytest
@@ -6,13 +7,33 @@ import pytest
 from hive_rc_auto.helpers.rc_delegation import (
     RCAllData,
     RCListOfAccounts,
+    RCPolicy,
     get_rc_of_accounts,
     list_rc_direct_delegations,
+    load_policies,
     mill,
     mill_s,
 )
 
 
+def test_load_policies(tmp_path):
+    assert load_policies("") == [RCPolicy()]
+    apps = tmp_path / "apps.json"
+    apps.write_text(
+        json.dumps(
+            [
+                {"primary_account": "app-one", "rc_pct_upper_target": 40},
+                {"primary_account": "app-two", "delegating_accounts": ["app-two-1"]},
+            ]
+        )
+    )
+    policies = load_policies(str(apps))
+    assert [p.primary_account for p in policies] == ["app-one", "app-two"]
+    assert policies[0].rc_pct_upper_target == 40
+    assert policies[1].delegating_accounts == ["app-two-1"]
+    assert policies[1].rc_pct_upper_target == RCPolicy().rc_pct_upper_target
+
+
 def test_mill():
     number = 33_000_000
     assert mill(number) == 33
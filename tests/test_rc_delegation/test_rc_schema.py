@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+import bson
+import pytest
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.rc_delegation import granularity_for
+from hive_rc_auto.helpers.rc_schema import from_compact, to_compact
+from hive_rc_auto.helpers.replay import reading_to_rc_account
+
+
+def test_compact_round_trip():
+    rc = reading_to_rc_account(
+        {
+            "timestamp": datetime.now(timezone.utc),
+            "account": "podping.bol",
+            "delegating": "target",
+            "max_rc": 10**12,
+            "delegated_rc": 0,
+            "received_delegated_rc": 5 * 10**11,
+            "real_mana": int(10**12 * 0.42),
+        }
+    )
+    rc.delta_percent = -3.14159
+    legacy = rc.db_format
+    compact = to_compact(legacy, account_id=7)
+    assert compact["a"] == 7
+    assert len(bson.encode(compact)) < len(bson.encode(legacy)) / 2
+
+    back = from_compact(compact, {7: "podping.bol"})
+    for field in ["account", "delegating", "status", "max_rc", "delta_icon"]:
+        assert back[field] == legacy[field]
+    assert back["real_mana_percent"] == pytest.approx(legacy["real_mana_percent"])
+    assert back["delta_percent"] == pytest.approx(legacy["delta_percent"], abs=0.01)
+    assert back["rc_deleg_available"] == pytest.approx(
+        legacy["real_mana"] - (Config.RC_BASE_LEVEL + 5 * 10**11), abs=1
+    )
+
+
+def test_granularity_for():
+    assert granularity_for(10) == "seconds"
+    assert granularity_for(300) == "minutes"
+    assert granularity_for(3600) == "hours"
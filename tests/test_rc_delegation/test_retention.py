@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.retention import RetentionPolicy, rollup
+
+HOUR = datetime(2023, 1, 1, 10)
+
+
+def test_rollup():
+    readings = [
+        {
+            "timestamp": HOUR + timedelta(minutes=5 * i),
+            "account": account,
+            "status": "ok" if i < 11 else "low",
+            "max_rc": 1000,
+            "real_mana": 10.0 * i,
+            "real_mana_percent": float(i),
+        }
+        for i in range(12)
+        for account in ("podping.aaa", "podping.bbb")
+    ]
+    docs = {doc["account"]: doc for doc in rollup(readings, HOUR)}
+    assert set(docs) == {"podping.aaa", "podping.bbb"}
+    doc = docs["podping.aaa"]
+    assert doc["timestamp"] == HOUR
+    assert doc["readings"] == 12
+    assert doc["real_mana_percent"] == 5.5
+    assert (doc["min_percent"], doc["max_percent"]) == (0.0, 11.0)
+    assert doc["status"] == "low"
+
+
+def test_ttl_allows_for_archiving(monkeypatch):
+    assert RetentionPolicy(collection="c", days=0).expire_after_secs is None
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", "")
+    policy = RetentionPolicy(collection="c", days=30, archive="readings")
+    assert policy.expire_after_secs == 30 * 24 * 3600
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", "/archive")
+    monkeypatch.setattr(Config, "ARCHIVE_GRACE_DAYS", 2)
+    assert policy.expire_after_secs == 32 * 24 * 3600
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+from hive_rc_auto.helpers.metrics import STORED_READINGS_TOTAL
+from hive_rc_auto.helpers.replay import reading_to_rc_account
+from hive_rc_auto.helpers.store_filter import ReadingFilter
+
+START = datetime.now(timezone.utc)
+
+
+def rc_at(minutes: int, percent: float, delegated_rc: int = 0):
+    return reading_to_rc_account(
+        {
+            "timestamp": START + timedelta(minutes=minutes),
+            "account": "target",
+            "max_rc": 10**12,
+            "delegated_rc": delegated_rc,
+            "received_delegated_rc": 0,
+            "real_mana": int(10**12 * percent / 100),
+        }
+    )
+
+
+def test_reading_filter():
+    skipped = STORED_READINGS_TOTAL.value(result="skipped")
+    store_filter = ReadingFilter(tolerance=0.5, heartbeat_secs=3600)
+    stored = [
+        minutes
+        for minutes, percent, delegated in [
+            (0, 100, 0),
+            (5, 100, 0),  # Unchanged
+            (10, 99.8, 0),  # Inside the tolerance
+            (15, 99.0, 0),
+            (20, 99.0, 5),  # Delegation changed
+            (80, 99.0, 5),  # Heartbeat
+        ]
+        if store_filter.select([rc_at(minutes, percent, delegated)])
+    ]
+    assert stored == [0, 15, 20, 80]
+    assert STORED_READINGS_TOTAL.value(result="skipped") - skipped == 2
+    assert len(ReadingFilter(heartbeat_secs=0).select([rc_at(0, 100)] * 3)) == 3
@@ -0,0 +1,48 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from hive_rc_auto.helpers.checkpoint import RCReading
+from hive_rc_auto.helpers.trend import RCTrend
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def readings(i: int, **percents: float):
+    timestamp = START + timedelta(minutes=5 * i)
+    return [
+        RCReading(account=acc, real_mana_percent=pct, timestamp=timestamp)
+        for acc, pct in percents.items()
+    ]
+
+
+def test_trend_slopes():
+    trend = RCTrend(window=4)
+    noise = [0.2, -0.2, 0.2, -0.2, 0.2, -0.2, 0.2, -0.2]
+    for i, wobble in enumerate(noise):
+        trend.update(readings(i, falling=50 - i * 0.5 + wobble, flat=80))
+    slopes = trend.slopes(["falling", "flat", "unknown"])
+    # 0.5% every 5 minutes, the wobble makes the last two points say -10.8
+    assert math.isclose(slopes[0], -6, abs_tol=1.5)
+    assert slopes[1] == 0
+    assert math.isnan(slopes[2])
+    # The ring buffer doesn't grow
+    assert trend.percents.shape == (2, 4)
+
+
+def test_trend_needs_two_readings():
+    trend = RCTrend(window=4)
+    trend.update(readings(0, one=50))
+    # The same reading again (a restored checkpoint) isn't counted twice
+    trend.update(readings(0, one=50))
+    assert math.isnan(trend.slopes(["one"])[0])
+    trend.update(readings(1, one=49))
+    assert math.isclose(trend.slopes(["one"])[0], -12)
+
+
+def test_trend_retain():
+    trend = RCTrend(window=3)
+    trend.update(readings(0, one=50, two=60))
+    trend.update(readings(1, one=51, two=61))
+    trend.retain(["two"])
+    assert list(trend.rows) == ["two"]
+    assert math.isclose(trend.slopes(["two"])[0], 12)
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from hive_rc_auto.helpers.archive import (
+    READING_SCHEMA,
+    archived_days,
+    partition_path,
+    read_archive,
+    write_partition,
+)
+from hive_rc_auto.helpers.rc_history import combine_history
+
+START = datetime(2023, 1, 1)
+
+
+def readings(day: datetime, accounts=("podping.aaa", "podping.bbb")):
+    return [
+        {
+            "timestamp": day + timedelta(minutes=5 * i),
+            "account": account,
+            "max_rc": 1_000_000,
+            "real_mana": 500_000 + i,
+            "real_mana_percent": 50.0,
+            "_id": i,
+        }
+        for i in range(288)
+        for account in accounts
+    ]
+
+
+def test_write_and_read_partitions(tmp_path):
+    directory = str(tmp_path)
+    for day in range(3):
+        path = partition_path(
+            "readings", (START + timedelta(days=day)).date(), directory
+        )
+        rows = write_partition(
+            readings(START + timedelta(days=day)),
+            path,
+            schema=READING_SCHEMA,
+            batch_size=100,
+        )
+        assert rows == 576
+    assert not any(name.endswith(".tmp") for name in os.listdir(os.path.dirname(path)))
+    assert [day.day for day in archived_days("readings", directory)] == [1, 2, 3]
+    # Nothing written, no partition
+    assert write_partition([], partition_path("readings", START.date(), "x")) == 0
+    assert not os.path.exists("x")
+
+    df = read_archive(
+        "readings",
+        START + timedelta(hours=12),
+        START + timedelta(days=1, hours=12),
+        directory,
+    )
+    assert len(df) == 288 * 2
+    assert df.timestamp.min() == START + timedelta(hours=12)
+    assert df.timestamp.max() < START + timedelta(days=1, hours=12)
+    assert read_archive("readings", START + timedelta(days=5), None, directory).empty
+
+
+def test_combine_history():
+    archived = pd.DataFrame(readings(START)[:10])
+    live = pd.DataFrame(readings(START)[6:20])
+    live["real_mana_percent"] = 60.0
+    df = combine_history([archived, pd.DataFrame(), live])
+    assert len(df) == 20
+    assert df.timestamp.is_monotonic_increasing
+    # The live reading wins where they overlap
+    assert (df.real_mana_percent.iloc[6:] == 60.0).all()
+    assert combine_history([pd.DataFrame()]).empty
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from hive_rc_auto.helpers.rc_history import bucket_frame, bucket_secs_for, fill_forward
+
+START = datetime(2023, 1, 1)
+PERIOD = 300
+
+
+def test_fill_forward():
+    df = pd.DataFrame(
+        [
+            {"timestamp": START, "account": "quiet", "real_mana_percent": 100.0},
+            {"timestamp": START, "account": "busy", "real_mana_percent": 50.0},
+            {
+                "timestamp": START + timedelta(seconds=PERIOD),
+                "account": "busy",
+                "real_mana_percent": 49.0,
+            },
+            {
+                "timestamp": START + timedelta(seconds=10 * PERIOD),
+                "account": "quiet",
+                "real_mana_percent": 90.0,
+            },
+        ]
+    )
+    until = START + timedelta(seconds=10 * PERIOD)
+    filled = fill_forward(df, until=until, period=PERIOD)
+    quiet = filled[filled.account == "quiet"]
+    # Held at 100% until just before the next reading
+    assert list(quiet.real_mana_percent) == [100.0, 100.0, 90.0]
+    assert quiet.timestamp.iloc[1] == START + timedelta(seconds=9 * PERIOD)
+    busy = filled[filled.account == "busy"]
+    assert list(busy.real_mana_percent) == [50.0, 49.0, 49.0]
+    assert busy.timestamp.iloc[-1] == until
+    assert fill_forward(pd.DataFrame()).empty
+
+
+def test_bucket_frame():
+    df = pd.DataFrame(
+        [
+            {
+                "timestamp": START + timedelta(seconds=PERIOD * i),
+                "account": account,
+                "status": "low" if i == 5 else "ok",
+                "real_mana": 10.0 * i,
+                "real_mana_percent": float(i),
+            }
+            for i in range(36)
+            for account in ("podping.aaa", "podping.bbb")
+        ]
+    )
+    bucketed = bucket_frame(df, 3600)
+    assert len(bucketed) == 6
+    first = bucketed[bucketed.account == "podping.aaa"].iloc[0]
+    assert first.timestamp == START
+    assert first.real_mana_percent == 5.5
+    assert (first.min_percent, first.max_percent) == (0.0, 11.0)
+    assert first.status == "ok"
+    assert bucket_frame(df, 0) is df
+
+
+def test_bucket_secs_for():
+    assert bucket_secs_for(4 * 3600, points=1000) == 0
+    # Four weeks to about 1000 points an account, whole minutes
+    bucket = bucket_secs_for(28 * 24 * 3600, points=1000)
+    assert bucket % 60 == 0
+    assert 950 <= 28 * 24 * 3600 / bucket <= 1000
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from hive_rc_auto.helpers.config import Config
+from hive_rc_auto.helpers.hysteresis import DelegationGovernor
+from hive_rc_auto.helpers.rc_delegation import (
+    RCDirectDelegation,
+    RCListOfAccounts,
+    set_clock,
+)
+from hive_rc_auto.helpers.replay import (
+    RCReplay,
+    SimulatedClock,
+    group_snapshots,
+    reading_to_rc_account,
+)
+
+START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+
+
+def make_reading(
+    account: str,
+    timestamp: datetime,
+    percent: float,
+    delegating: str = "target",
+    max_rc: int = 1_000_000_000_000,
+    received: int = 0,
+) -> dict:
+    return {
+        "timestamp": timestamp,
+        "account": account,
+        "delegating": delegating,
+        "max_rc": max_rc,
+        "delegated_rc": 0,
+        "received_delegated_rc": received,
+        "real_mana": int(max_rc * percent / 100),
+        "real_mana_percent": percent,
+    }
+
+
+def make_readings(cycles: int, target_percent: float):
+    readings = []
+    for n in range(cycles):
+        timestamp = START + timedelta(seconds=n * Config.UPDATE_FREQUENCY_SECS)
+        readings.append(
+            make_reading(
+                Config.PRIMARY_ACCOUNT,
+                timestamp,
+                100.0,
+                delegating="delegating",
+                max_rc=1_000_000_000_000_000,
+            )
+        )
+        readings.append(make_reading("replay-target", timestamp, target_percent))
+    return readings
+
+
+def test_group_snapshots():
+    snapshots = list(group_snapshots(make_readings(5, 50.0)))
+    assert len(snapshots) == 5
+    assert all(len(snapshot) == 2 for snapshot in snapshots)
+    # Only changed readings stored: the primary is missing from some cycles
+    sparse = [r for i, r in enumerate(make_readings(5, 50.0)) if i % 4 != 2]
+    snapshots = list(group_snapshots(sparse))
+    assert [len(snapshot) for snapshot in snapshots] == [2, 1, 2, 1, 2]
+
+
+def test_simulated_clock_goes_back_to_history():
+    clock = SimulatedClock()
+    clock.advance_to(START)
+    assert clock() == START
+    clock.advance_to(START - timedelta(minutes=1))
+    assert clock() == START
+
+
+def test_delta_over_heartbeat_gap():
+    # Unchanged readings aren't stored, the previous one is an hour back
+    later = START + timedelta(hours=1)
+    set_clock(SimulatedClock(later))
+    try:
+        rc = reading_to_rc_account(
+            make_reading("replay-target", later, 45.0),
+            old_mana_percent=50.0,
+            old_timestamp=START,
+        )
+    finally:
+        set_clock(None)
+    assert rc.delta_percent == pytest.approx(-5.0)
+    assert not rc.alarm_set
+
+
+@pytest.mark.asyncio
+async def test_replay_low_account():
+    accounts = RCListOfAccounts.construct(
+        all=[Config.PRIMARY_ACCOUNT, "replay-target"],
+        delegating=[Config.PRIMARY_ACCOUNT],
+        receiving=["replay-target"],
+    )
+    low_percent = Config.RC_PCT_ALARM_LEVEL / 2
+    replay = RCReplay(accounts=accounts)
+    report = await replay.run(group_snapshots(make_readings(10, low_percent)))
+    report.log_output()
+    assert report.cycles == 10
+    assert report.broadcasts == 10
+    assert all(decision.acc_to == "replay-target" for decision in report.decisions)
+    assert report.seconds_below_alarm["replay-target"] == pytest.approx(
+        9 * Config.UPDATE_FREQUENCY_SECS, rel=0.01
+    )
+    assert report.days_per_second > 0
+
+
+@pytest.mark.asyncio
+async def test_replay_hysteresis_cuts_churn():
+    accounts = RCListOfAccounts.construct(
+        all=[Config.PRIMARY_ACCOUNT, "replay-target"],
+        delegating=[Config.PRIMARY_ACCOUNT],
+        receiving=["replay-target"],
+    )
+    delegations = [
+        RCDirectDelegation.parse_obj(
+            {
+                "from": Config.PRIMARY_ACCOUNT,
+                "to": "replay-target",
+                "delegated_rc": 10**12,
+            }
+        )
+    ]
+    readings = make_readings(10, 0)
+    for n, reading in enumerate(r for r in readings if r["account"] == "replay-target"):
+        # Flip between just below the lower target and well above the upper
+        percent = (
+            Config.RC_PCT_UPPER_TARGET + 10 if n % 2 else Config.RC_PCT_LOWER_TARGET - 1
+        )
+        reading["real_mana"] = int(reading["max_rc"] * percent / 100)
+        reading["received_delegated_rc"] = 10**12
+
+    plain = await RCReplay(accounts, delegations).run(group_snapshots(readings))
+    governed = await RCReplay(accounts, delegations, governor=DelegationGovernor()).run(
+        group_snapshots(readings)
+    )
+    governed.log_output()
+    assert plain.broadcasts == 10
+    assert governed.broadcasts < plain.broadcasts
+    assert sum(governed.suppressed.values()) > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("given_accounts", [True, False], ids=["given", "worked-out"])
+async def test_replay_change_only_readings(given_accounts: bool):
+    """The primary's reading never changes so it's only stored once"""
+    accounts = RCListOfAccounts.construct(
+        all=[Config.PRIMARY_ACCOUNT, "replay-target"],
+        delegating=[Config.PRIMARY_ACCOUNT],
+        receiving=["replay-target"],
+    )
+    readings = [
+        r
+        for i, r in enumerate(make_readings(10, Config.RC_PCT_ALARM_LEVEL / 2))
+        if i == 0 or r["account"] != Config.PRIMARY_ACCOUNT
+    ]
+    replay = RCReplay(accounts=accounts if given_accounts else None)
+    report = await replay.run(group_snapshots(readings))
+    assert report.cycles == 10
+    assert report.readings == 11
+    assert report.broadcasts == 10
+    assert all(d.acc_from == Config.PRIMARY_ACCOUNT for d in report.decisions)
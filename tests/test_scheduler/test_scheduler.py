@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from hive_rc_auto.helpers.metrics import (
+    MISSED_TICKS_TOTAL,
+    STAGE_DEADLINE_EXCEEDED_TOTAL,
+)
+from hive_rc_auto.helpers.scheduler import (
+    FixedRateScheduler,
+    MissedTickPolicy,
+    StageDeadlineExceeded,
+    with_deadline,
+)
+
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def clock(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += seconds
+
+
+async def start_times(policy: MissedTickPolicy, work: list) -> list:
+    """When each cycle starts, given how long each one's work takes"""
+    time = FakeTime()
+    scheduler = FixedRateScheduler(
+        period=10, policy=policy, start=0, clock=time.clock, sleep=time.sleep
+    )
+    starts = []
+    for seconds in work:
+        tick = await scheduler.wait_next()
+        starts.append((tick, time.now))
+        time.now += seconds
+    return starts
+
+
+@pytest.mark.asyncio
+async def test_fixed_rate_does_not_drift():
+    starts = await start_times(MissedTickPolicy.SKIP, [3, 7, 9.5, 1])
+    assert starts == [(0, 0), (1, 10), (2, 20), (3, 30)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        (MissedTickPolicy.SKIP, [(0, 0), (3, 32), (4, 40)]),
+        (MissedTickPolicy.CATCH_UP, [(0, 0), (1, 32), (2, 33)]),
+        (MissedTickPolicy.RESET, [(0, 0), (1, 32), (2, 42)]),
+    ],
+)
+async def test_missed_tick_policies(policy, expected):
+    assert await start_times(policy, [32, 1, 1]) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", list(MissedTickPolicy))
+async def test_missed_ticks_counted_once(policy):
+    time = FakeTime()
+    scheduler = FixedRateScheduler(
+        period=10, policy=policy, start=0, clock=time.clock, sleep=time.sleep
+    )
+    before = MISSED_TICKS_TOTAL.value()
+    await scheduler.wait_next()
+    # One cycle takes 32s: the start at 10 runs late, those at 20 and 30
+    # are missed and counted once however the policy handles them
+    time.now += 32
+    for _ in range(4):
+        await scheduler.wait_next()
+        time.now += 1
+    assert scheduler.missed == 2
+    assert MISSED_TICKS_TOTAL.value() == before + 2
+
+
+@pytest.mark.asyncio
+async def test_with_deadline():
+    assert await with_deadline("test", asyncio.sleep(0, result=1), 1) == 1
+    before = STAGE_DEADLINE_EXCEEDED_TOTAL.value(stage="test")
+    with pytest.raises(StageDeadlineExceeded):
+        await with_deadline("test", asyncio.sleep(1), 0.01)
+    assert STAGE_DEADLINE_EXCEEDED_TOTAL.value(stage="test") == before + 1
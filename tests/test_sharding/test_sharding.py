@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+
+from hive_rc_auto.helpers.rc_delegation import get_mongo_db
+from hive_rc_auto.helpers.sharding import HashRing, LeaseTimeout, ShardLeases
+
+ACCOUNTS = [f"account-{i}" for i in range(2_000)]
+
+
+def test_hash_ring_spreads_and_is_stable():
+    ring = HashRing(4)
+    shards = [ring.shard_of(acc) for acc in ACCOUNTS]
+    assert shards == [HashRing(4).shard_of(acc) for acc in ACCOUNTS]
+    for shard in range(4):
+        assert 300 < shards.count(shard) < 700
+    # Adding a shard only moves the accounts which land on it
+    bigger = HashRing(5)
+    moved = [acc for acc in ACCOUNTS if ring.shard_of(acc) != bigger.shard_of(acc)]
+    assert all(bigger.shard_of(acc) == 4 for acc in moved)
+    assert len(moved) < len(ACCOUNTS) / 3
+
+
+@pytest_asyncio.fixture
+async def leases_collection():
+    collection = get_mongo_db("test_shard_leases")
+    await collection.delete_many({})
+    yield collection
+    await collection.drop()
+
+
+@pytest.mark.mongo
+@pytest.mark.asyncio
+async def test_workers_split_and_take_over(leases_collection):
+    one = ShardLeases(8, "worker-one", lease_secs=60, collection=leases_collection)
+    two = ShardLeases(8, "worker-two", lease_secs=60, collection=leases_collection)
+    assert len(await one.rebalance()) == 8
+    # A second worker joins: the first gives back half next cycle
+    await two.rebalance()
+    await one.rebalance()
+    await two.rebalance()
+    assert len(one.owned) == 4 and len(two.owned) == 4
+    assert not one.owned & two.owned
+    # The first worker dies: its leases run out and the second takes over
+    await leases_collection.update_many(
+        {"owner": "worker-one"},
+        {"$set": {"expires": datetime.now(timezone.utc) - timedelta(seconds=1)}},
+    )
+    assert len(await two.rebalance()) == 8
+
+
+@pytest.mark.mongo
+@pytest.mark.asyncio
+async def test_delegator_lock_is_single_writer(leases_collection):
+    one = ShardLeases(2, "worker-one", collection=leases_collection)
+    two = ShardLeases(2, "worker-two", collection=leases_collection)
+    async with one.delegator_lock("podping"):
+        with pytest.raises(LeaseTimeout):
+            async with two.delegator_lock("podping", timeout=0.1):
+                pass
+    async with two.delegator_lock("podping", timeout=0.1):
+        pass
+
+
+@pytest.mark.mongo
+@pytest.mark.asyncio
+async def test_delegator_lock_keeps_out_same_worker(leases_collection):
+    one = ShardLeases(2, "worker-one", collection=leases_collection)
+    held = []
+
+    async def broadcast(name: str):
+        async with one.delegator_lock("podping", timeout=5):
+            held.append(name)
+            assert len(held) == 1, "two tasks broadcasting for one delegator"
+            await asyncio.sleep(0.05)
+            # Still this worker's lease while the task broadcasts
+            assert (await leases_collection.find_one({"_id": "delegator:podping"}))[
+                "owner"
+            ] == "worker-one"
+            held.remove(name)
+
+    await asyncio.gather(broadcast("alarm"), broadcast("pipeline"))
+    assert await leases_collection.find_one({"_id": "delegator:podping"}) is None
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from hive_rc_auto.helpers.metrics import (
+    STARTUP_PHASE_SECONDS,
+    TIME_TO_FIRST_CYCLE_SECONDS,
+    HealthState,
+)
+from hive_rc_auto.helpers.rc_delegation import RCPolicy
+from hive_rc_auto.helpers.startup import fallback_apps, timed_phase
+
+
+@pytest.mark.asyncio
+async def test_timed_phase():
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    assert await timed_phase("test", work()) == "done"
+    assert STARTUP_PHASE_SECONDS.value(phase="test") >= 0.05
+
+
+def test_time_to_first_cycle():
+    health = HealthState()
+    health.cycle_done()
+    first = TIME_TO_FIRST_CYCLE_SECONDS.value()
+    health.cycle_done()
+    assert TIME_TO_FIRST_CYCLE_SECONDS.value() == first
+
+
+def test_fallback_apps():
+    policy = RCPolicy(primary_account="primary", delegating_accounts=["one", "primary"])
+    ((accounts, _),) = fallback_apps([policy])
+    assert accounts.delegating == ["primary", "one"]
+    assert accounts.receiving == []
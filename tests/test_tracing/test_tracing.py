@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from hive_rc_auto.helpers import tracing
+from hive_rc_auto.helpers.tracing import (
+    configure_tracing,
+    format_trace,
+    load_spans,
+    slowest_traces,
+    span,
+)
+
+
+@pytest.mark.asyncio
+async def test_spans_exported_to_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    processor = configure_tracing(f"file:{path}")
+
+    async def store():
+        with span("mongo_insert", collection="rc"):
+            await asyncio.sleep(0.01)
+
+    with span("update_cycle", accounts=2):
+        with span("rpc_call", node="https://node1", attempt=1):
+            pass
+        with pytest.raises(ValueError):
+            with span("rpc_call", node="https://node2", attempt=2):
+                raise ValueError("node down")
+        await asyncio.create_task(store())
+    processor.shutdown()
+    tracing._processor = None
+
+    spans = load_spans(path)
+    assert len(spans) == 4
+    root = [s for s in spans if s["name"] == "update_cycle"][0]
+    assert all(s["traceId"] == root["traceId"] for s in spans)
+    children = [s for s in spans if s["parentSpanId"] == root["spanId"]]
+    assert len(children) == 3
+    failed = [s for s in spans if s["status"] == "error"]
+    assert failed[0]["attributes"]["error"] == "ValueError: node down"
+
+    trace = slowest_traces(spans)[0]
+    lines = format_trace(trace)
+    assert "update_cycle" in lines[0]
+    assert lines[-1].strip().endswith("collection=rc")
+
+
+def test_span_off():
+    configure_tracing("")
+    with span("nothing") as s:
+        assert s is None